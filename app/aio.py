@@ -0,0 +1,129 @@
+"""`asyncio` counterparts of `Packager.apply_encoding`/`apply_decoding`.
+
+The sources are `asyncio.StreamReader`-like (an awaitable `read(n)`), the
+sinks are `asyncio.StreamWriter`-like (`write` plus an awaitable `drain`).
+The blocks are transformed in an executor (the loop's default one unless
+given), at most `concurrency` at a time, so the event loop never blocks.
+"""
+
+import asyncio
+from collections import deque
+from functools import partial
+
+from app.packager import (
+    DEFAULT_BLOCK_SIZE,
+    ENCODED_BLOCK_HEADER_SIZE,
+    decode_block,
+    encode_block,
+    unpack_block_header,
+)
+
+DEFAULT_CONCURRENCY = 2
+
+
+async def _read_exactly(reader, size: int) -> bytes:
+    # less than `size` bytes only at the end of the stream
+    data = bytearray()
+    while len(data) < size:
+        chunk = await reader.read(size - len(data))
+        if not chunk:
+            break
+        data.extend(chunk)
+    return bytes(data)
+
+
+async def _gen_blocks(reader, block_size: int):
+    while block := await _read_exactly(reader, block_size):
+        yield block
+
+
+async def _gen_encoded_blocks(reader):
+    while block_header := await _read_exactly(
+        reader, ENCODED_BLOCK_HEADER_SIZE
+    ):
+        block_length, _ = unpack_block_header(block_header)
+        if block_length == 0:
+            break  # the block index follows
+        block = await _read_exactly(reader, block_length)
+        if len(block_header) + len(block) < (
+            ENCODED_BLOCK_HEADER_SIZE + block_length
+        ):
+            raise ValueError(
+                "Compressed data ended in the middle of a block "
+                f"({len(block_header) + len(block)} bytes left)"
+            )
+        yield block_header + block
+
+
+async def _transform_blocks(transform, blocks, writer, executor, concurrency):
+    # keeps up to `concurrency` blocks in the executor, writes the results
+    # in the original order, waiting for the writer to drain after each
+    if concurrency < 1:
+        raise ValueError(f"Invalid concurrency: {concurrency}")
+    loop = asyncio.get_running_loop()
+    in_flight = deque()
+
+    async def write_next():
+        transformed_block = await in_flight.popleft()
+        writer.write(transformed_block)
+        await writer.drain()
+
+    try:
+        async for block in blocks:
+            if len(in_flight) >= concurrency:
+                await write_next()
+            in_flight.append(loop.run_in_executor(executor, transform, block))
+        while in_flight:
+            await write_next()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def _start_stream(transformation, concurrency):
+    if transformation.stateful and concurrency > 1:
+        raise ValueError(
+            "The blocks of a stateful transformation are transformed one "
+            "at a time (concurrency=1)"
+        )
+    transformation.reset()
+
+
+async def encode(
+    reader,
+    writer,
+    transformation,
+    block_size=DEFAULT_BLOCK_SIZE,
+    executor=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    store_raw=True,
+):
+    """Writes the encoded `reader` data to `writer` in the `Packager`
+    container format. The writer is neither closed nor EOF-ed."""
+    _start_stream(transformation, concurrency)
+    await _transform_blocks(
+        partial(encode_block, transformation, store_raw=store_raw),
+        _gen_blocks(reader, block_size),
+        writer,
+        executor,
+        concurrency,
+    )
+
+
+async def decode(
+    reader,
+    writer,
+    transformation,
+    executor=None,
+    concurrency=DEFAULT_CONCURRENCY,
+):
+    """Writes the decoded `reader` data to `writer`. Raises `ValueError`
+    if the data ends in the middle of a block."""
+    _start_stream(transformation, concurrency)
+    await _transform_blocks(
+        partial(decode_block, transformation),
+        _gen_encoded_blocks(reader),
+        writer,
+        executor,
+        concurrency,
+    )
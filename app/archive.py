@@ -0,0 +1,500 @@
+"""A multi-file archive: a directory tree in a single file, no `tar` pass.
+
+An archive is
+
+- the `ARCHIVE_MAGIC`
+- the data of the regular files, one after another: the packed blocks of
+  the `Packager` container (header and transformed block), no markers
+- the central index, an entry per member (file, directory or symbolic
+  link): its kind, permissions, modification time, size, and where its
+  blocks are
+- the trailer: the offset of the index and the `INDEX_MAGIC`
+
+The blocks of all the files go through one pool of workers, so both the
+files and their blocks are transformed in parallel. A single member is
+extracted by seeking to its blocks, the rest isn't read.
+
+    python -m app.archive create backup.sbza dir other_dir
+    python -m app.archive list backup.sbza
+    python -m app.archive extract backup.sbza -C out dir/notes.txt
+"""
+
+import argparse
+import os
+import stat
+import sys
+from collections import namedtuple
+from functools import partial
+
+from app.bzip2 import bzip2
+from app.options import parse_jobs, parse_size
+from app.packager import (
+    DEFAULT_BLOCK_SIZE,
+    ENCODED_BLOCK_HEADER_SIZE,
+    Packager,
+    decode_block,
+    encode_block,
+    gen_transformed_blocks,
+    unpack_block_header,
+)
+
+ARCHIVE_MAGIC = b"SBZA"
+INDEX_MAGIC = b"SBZI"
+INDEX_OFFSET_SIZE = 8
+TRAILER_SIZE = INDEX_OFFSET_SIZE + len(INDEX_MAGIC)
+
+KINDS = ("file", "directory", "symlink")
+FILE, DIRECTORY, SYMLINK = KINDS
+# the fixed part of an index entry: the kind, the mode, the modification
+# time (ns), the size, the offset and the size of the blocks
+ENTRY_FIELD_SIZES = (1, 4, 8, 8, 8, 8)
+NAME_LENGTH_SIZE = 2
+
+PROG = "python -m app.archive"
+
+# `name` is a relative POSIX path; `link` is the target of a symlink;
+# `offset` and `encoded_size` locate the blocks of a file in the archive
+ArchiveMember = namedtuple(
+    "ArchiveMember",
+    [
+        "name",
+        "kind",
+        "mode",
+        "mtime_ns",
+        "size",
+        "offset",
+        "encoded_size",
+        "link",
+    ],
+    defaults=[0, 0, 0, ""],
+)
+
+
+def _gen_tree(path: str):
+    # yields `(name, path)` of `path` and, for a directory, of everything
+    # under it (symlinks aren't followed)
+    top = os.path.normpath(path)
+    root_name = os.path.basename(os.path.abspath(top))
+    yield root_name, top
+    if os.path.islink(top) or not os.path.isdir(top):
+        return
+    for dir_path, dir_names, file_names in os.walk(top):
+        dir_names.sort()
+        relative = os.path.relpath(dir_path, top)
+        prefix = root_name if relative == "." else f"{root_name}/{relative}"
+        prefix = prefix.replace(os.sep, "/")
+        for name in dir_names + sorted(file_names):
+            yield f"{prefix}/{name}", os.path.join(dir_path, name)
+
+
+def scan(paths) -> list[tuple[ArchiveMember, str]]:
+    """The members for `paths` (files and directory trees) and their
+    paths on disk. Special files (devices, FIFOs, ...) are skipped.
+    Raises `ValueError` if two paths get the same member name (the trees
+    are named after their last component)."""
+    members = []
+    names = set()
+    for path in paths:
+        for name, member_path in _gen_tree(path):
+            if name in names:
+                raise ValueError(f"{member_path}: another path is {name!r}")
+            names.add(name)
+            st = os.lstat(member_path)
+            if stat.S_ISLNK(st.st_mode):
+                kind, link = SYMLINK, os.readlink(member_path)
+            elif stat.S_ISDIR(st.st_mode):
+                kind, link = DIRECTORY, ""
+            elif stat.S_ISREG(st.st_mode):
+                kind, link = FILE, ""
+            else:
+                continue
+            member = ArchiveMember(
+                name,
+                kind,
+                stat.S_IMODE(st.st_mode),
+                st.st_mtime_ns,
+                st.st_size if kind == FILE else 0,
+                link=link,
+            )
+            members.append((member, member_path))
+    return members
+
+
+def _gen_file_blocks(members, transformation, block_size: int):
+    # the blocks of the regular files, each file read up to its size
+    for member, path in members:
+        # the members decode on their own: the state starts anew
+        transformation.reset()
+        with open(path, "rb") as in_file:
+            left = member.size
+            while left:
+                block = in_file.read(min(block_size, left))
+                if not block:
+                    raise ValueError(f"{path}: changed while archived")
+                left -= len(block)
+                yield block
+
+
+def pack_index(members: list[ArchiveMember], index_offset: int) -> bytes:
+    """The index entries and the trailer. `index_offset` is where the
+    index is written to."""
+    packed = bytearray()
+    for member in members:
+        fields = (
+            KINDS.index(member.kind),
+            member.mode,
+            member.mtime_ns,
+            member.size,
+            member.offset,
+            member.encoded_size,
+        )
+        for field, size in zip(fields, ENTRY_FIELD_SIZES, strict=True):
+            packed.extend(field.to_bytes(size, byteorder="big", signed=True))
+        for text in (member.name, member.link):
+            encoded_text = text.encode("utf-8", "surrogateescape")
+            packed.extend(
+                len(encoded_text).to_bytes(NAME_LENGTH_SIZE, byteorder="big")
+            )
+            packed.extend(encoded_text)
+    packed.extend(index_offset.to_bytes(INDEX_OFFSET_SIZE, byteorder="big"))
+    packed.extend(INDEX_MAGIC)
+    return bytes(packed)
+
+
+def create(out_file, paths, packager=None) -> list[ArchiveMember]:
+    """Writes the archive of `paths` (files and directory trees) to the
+    binary file object `out_file`. The blocks are transformed by
+    `packager` (the `bzip2` one by default), with its workers."""
+    if packager is None:
+        packager = Packager(bzip2)
+    scanned = scan(paths)
+    file_members = [(m, path) for m, path in scanned if m.kind == FILE]
+    packed_blocks = gen_transformed_blocks(
+        partial(
+            encode_block,
+            packager.transformation,
+            store_raw=packager.store_raw,
+        ),
+        _gen_file_blocks(
+            file_members, packager.transformation, packager.block_size
+        ),
+        packager.workers,
+    )
+
+    out_file.write(ARCHIVE_MAGIC)
+    offset = len(ARCHIVE_MAGIC)
+    # `(offset, encoded_size)` of the files, in order
+    locations = []
+    for member, _ in file_members:
+        # the blocks come in order, the sizes tell where a file ends
+        left = member.size
+        encoded_size = 0
+        while left:
+            block_length, packed_block = next(packed_blocks)
+            out_file.write(packed_block)
+            left -= block_length
+            encoded_size += len(packed_block)
+        locations.append((offset, encoded_size))
+        offset += encoded_size
+
+    members = []
+    file_locations = iter(locations)
+    for member, _ in scanned:
+        if member.kind == FILE:
+            member_offset, encoded_size = next(file_locations)
+            member = member._replace(
+                offset=member_offset, encoded_size=encoded_size
+            )
+        members.append(member)
+    out_file.write(pack_index(members, offset))
+    return members
+
+
+def read_members(in_file) -> list[ArchiveMember]:
+    """The central index of the archive `in_file` (a seekable binary file
+    object). Raises `ValueError` if it's not an archive or if the index
+    is corrupted."""
+    in_file.seek(0)
+    if in_file.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+        raise ValueError("Not an archive")
+    end = in_file.seek(0, os.SEEK_END)
+    if end < len(ARCHIVE_MAGIC) + TRAILER_SIZE:
+        raise ValueError("Truncated archive")
+    in_file.seek(end - TRAILER_SIZE)
+    trailer = in_file.read(TRAILER_SIZE)
+    if trailer[INDEX_OFFSET_SIZE:] != INDEX_MAGIC:
+        raise ValueError("Truncated archive: no index")
+    index_offset = int.from_bytes(trailer[:INDEX_OFFSET_SIZE], "big")
+    if not len(ARCHIVE_MAGIC) <= index_offset <= end - TRAILER_SIZE:
+        raise ValueError("Corrupted archive index")
+    in_file.seek(index_offset)
+    index = in_file.read(end - TRAILER_SIZE - index_offset)
+
+    members = []
+    names = set()
+    pos = 0
+    while pos < len(index):
+        fields = []
+        for size in ENTRY_FIELD_SIZES:
+            fields.append(
+                int.from_bytes(index[pos : pos + size], "big", signed=True)
+            )
+            pos += size
+        texts = []
+        for _ in range(2):
+            length = int.from_bytes(index[pos : pos + NAME_LENGTH_SIZE], "big")
+            pos += NAME_LENGTH_SIZE
+            texts.append(
+                index[pos : pos + length].decode("utf-8", "surrogateescape")
+            )
+            pos += length
+        if pos > len(index):
+            raise ValueError("Corrupted archive index")
+        kind, *rest = fields
+        name, link = texts
+        if not 0 <= kind < len(KINDS):
+            raise ValueError("Corrupted archive index")
+        member = ArchiveMember(name, KINDS[kind], *rest, link=link)
+        # only the modification time may be negative
+        if (
+            min(member.mode, member.size, member.offset, member.encoded_size)
+            < 0
+        ):
+            raise ValueError("Corrupted archive index")
+        if name in names:
+            raise ValueError(f"Corrupted archive index: {name} twice")
+        names.add(name)
+        # the blocks of a file lie between the magic and the index
+        if member.kind == FILE and not (
+            len(ARCHIVE_MAGIC)
+            <= member.offset
+            <= member.offset + member.encoded_size
+            <= index_offset
+        ):
+            raise ValueError(f"Corrupted archive index: {name} out of place")
+        members.append(member)
+    return members
+
+
+def _gen_member_blocks(in_file, members):
+    # the packed blocks of the members, read at their offsets
+    for member in members:
+        in_file.seek(member.offset)
+        left = member.encoded_size
+        while left:
+            block_header = in_file.read(ENCODED_BLOCK_HEADER_SIZE)
+            block_length, _ = unpack_block_header(block_header)
+            packed_block = block_header + in_file.read(block_length)
+            if len(packed_block) != ENCODED_BLOCK_HEADER_SIZE + block_length:
+                raise ValueError(f"{member.name}: truncated")
+            left -= len(packed_block)
+            yield packed_block
+
+
+def _gen_decoded_members(in_file, members, packager):
+    # yields `(member, gen_decoded_blocks)` for every member in turn
+    def gen_blocks():
+        for member in members:
+            packager.transformation.reset()
+            yield from _gen_member_blocks(in_file, [member])
+
+    decoded_blocks = gen_transformed_blocks(
+        partial(
+            decode_block,
+            packager.transformation,
+            limits=packager.decode_limits,
+        ),
+        gen_blocks(),
+        packager.workers,
+    )
+
+    def gen_member_data(member):
+        left = member.size
+        while left > 0:
+            _, block = next(decoded_blocks, (0, None))
+            if block is None:
+                raise ValueError(f"{member.name}: truncated")
+            left -= len(block)
+            yield block
+        if left:
+            raise ValueError(f"{member.name}: corrupted")
+
+    for member in members:
+        yield member, gen_member_data(member)
+
+
+def _find(members, names) -> list[ArchiveMember]:
+    by_name = {member.name: member for member in members}
+    missing = [name for name in names if name not in by_name]
+    if missing:
+        raise KeyError(f"Not in the archive: {', '.join(missing)}")
+    return [by_name[name] for name in names]
+
+
+def extract_member(in_file, name: str, out_file, packager=None) -> int:
+    """Writes the data of the regular file `name` to `out_file`, reading
+    and decoding only its blocks. Returns the size written."""
+    if packager is None:
+        packager = Packager(bzip2)
+    (member,) = _find(read_members(in_file), [name])
+    if member.kind != FILE:
+        raise ValueError(f"{name}: not a regular file")
+    size = 0
+    for _, blocks in _gen_decoded_members(in_file, [member], packager):
+        for block in blocks:
+            out_file.write(block)
+            size += len(block)
+    return size
+
+
+def _target_path(dest_dir: str, name: str) -> str:
+    # no way out of `dest_dir`: neither by the name nor through the
+    # symlinks extracted before
+    parts = name.split("/")
+    if not name or name.startswith("/") or ".." in parts:
+        raise ValueError(f"{name}: unsafe member name")
+    path = os.path.join(dest_dir, *parts)
+    real_dest_dir = os.path.realpath(dest_dir)
+    real_parent = os.path.realpath(os.path.dirname(path))
+    if os.path.commonpath([real_dest_dir, real_parent]) != real_dest_dir:
+        raise ValueError(f"{name}: unsafe member path")
+    return path
+
+
+def _check_links(members):
+    # a member under a symlink member would be written through it
+    links = {member.name for member in members if member.kind == SYMLINK}
+    for member in members:
+        parts = member.name.split("/")
+        for end in range(1, len(parts)):
+            if "/".join(parts[:end]) in links:
+                raise ValueError(f"{member.name}: under a symlink")
+
+
+def _remove_existing(path: str):
+    # a file or a symlink in the way is replaced (and never written
+    # through), the directories are kept
+    if os.path.islink(path) or (
+        os.path.lexists(path) and not os.path.isdir(path)
+    ):
+        os.remove(path)
+
+
+def _write_file(path: str, member: ArchiveMember, blocks):
+    # a new file: neither an existing one nor a symlink is opened
+    _remove_existing(path)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW
+    with open(os.open(path, flags, 0o600), "wb") as out_file:
+        for block in blocks:
+            out_file.write(block)
+        out_file.flush()  # before the modification time is set
+        os.chmod(out_file.fileno(), member.mode)
+        os.utime(out_file.fileno(), ns=(member.mtime_ns, member.mtime_ns))
+
+
+def extract(in_file, dest_dir=".", names=None, packager=None) -> list:
+    """Restores the members `names` (all of them by default) of the
+    archive `in_file` under `dest_dir`, with their permissions and
+    modification times. Returns the members extracted. Raises
+    `ValueError` if a member would land outside `dest_dir`."""
+    if packager is None:
+        packager = Packager(bzip2)
+    members = read_members(in_file)
+    if names is not None:
+        members = _find(members, names)
+    _check_links(members)
+
+    directories = []
+    for member in members:
+        path = _target_path(dest_dir, member.name)
+        if member.kind == DIRECTORY:
+            _remove_existing(path)
+            os.makedirs(path, exist_ok=True)
+            directories.append((member, path))
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    file_members = [member for member in members if member.kind == FILE]
+    for member, blocks in _gen_decoded_members(
+        in_file, file_members, packager
+    ):
+        _write_file(_target_path(dest_dir, member.name), member, blocks)
+    # the symlinks last: nothing is written through them
+    for member in members:
+        if member.kind == SYMLINK:
+            path = _target_path(dest_dir, member.name)
+            _remove_existing(path)
+            os.symlink(member.link, path)
+    # the deepest directories first: their contents are in place
+    for member, path in reversed(directories):
+        os.chmod(path, member.mode)
+        os.utime(path, ns=(member.mtime_ns, member.mtime_ns))
+    return members
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog=PROG, description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=parse_jobs,
+        default=1,
+        help="the number of worker processes, 0 for all the cores",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    create_parser = commands.add_parser("create", help="archive the paths")
+    create_parser.add_argument(
+        "-b", "--block-size", type=parse_size, default=DEFAULT_BLOCK_SIZE
+    )
+    create_parser.add_argument("archive")
+    create_parser.add_argument("paths", nargs="+", metavar="PATH")
+    list_parser = commands.add_parser("list", help="list the members")
+    list_parser.add_argument("archive")
+    extract_parser = commands.add_parser(
+        "extract", help="extract the members (all of them by default)"
+    )
+    extract_parser.add_argument(
+        "-C", "--directory", default=".", help="where to extract to"
+    )
+    extract_parser.add_argument("archive")
+    extract_parser.add_argument("names", nargs="*", metavar="MEMBER")
+    return parser.parse_args(argv)
+
+
+def _run(args):
+    if args.command == "create":
+        packager = Packager(bzip2, args.block_size, workers=args.jobs)
+        with open(args.archive, "wb") as out_file:
+            create(out_file, args.paths, packager)
+    elif args.command == "list":
+        with open(args.archive, "rb") as in_file:
+            for member in read_members(in_file):
+                print(
+                    f"{member.kind:<9} {stat.filemode(member.mode)[1:]} "
+                    f"{member.size:>12} {member.encoded_size:>12} "
+                    f"{member.name}"
+                    + (f" -> {member.link}" if member.link else "")
+                )
+    else:
+        packager = Packager(bzip2, workers=args.jobs)
+        with open(args.archive, "rb") as in_file:
+            extract(in_file, args.directory, args.names or None, packager)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    try:
+        _run(args)
+    except KeyError as e:
+        print(f"{PROG}: {args.archive}: {e.args[0]}", file=sys.stderr)
+        return 1
+    except (ValueError, OSError) as e:
+        print(f"{PROG}: {args.archive}: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""Throughput and compression ratio of the transformations.
+
+    python -m app.benchmark [--size BYTES] [--block-sizes N,...] [...]
+
+Every result is printed as a JSON line, so the outputs of two versions
+can be compared with any JSON-aware tool.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+from app.bzip2 import bzip2
+from app.transformations import (
+    BWT,
+    HFC,
+    MTF,
+    RlePackBits,
+    RlePairs,
+    RleStreams,
+)
+from app.transformations.backends import BACKENDS, get_backend, set_backend
+
+KiB = 1 << 10
+
+DEFAULT_CORPUS_SIZE = 256 * KiB
+DEFAULT_BLOCK_SIZES = (16 * KiB, 64 * KiB, 128 * KiB)
+DEFAULT_SEED = 42
+
+TRANSFORMATIONS = {
+    "BWT": BWT(),
+    "MTF": MTF(),
+    "HFC": HFC(),
+    "RlePackBits": RlePackBits(),
+    "RlePairs": RlePairs(),
+    "RleStreams": RleStreams(),
+    "bzip2": bzip2,
+}
+
+BenchmarkResult = namedtuple(
+    "BenchmarkResult",
+    [
+        "transformation",
+        "corpus",
+        "block_size",
+        "size",
+        "encoded_size",
+        "ratio",
+        "encode_mb_s",
+        "decode_mb_s",
+        "encode_peak_kib",
+    ],
+)
+
+WORDS = (
+    "the of and to in a is that for it as was with be by on not he this "
+    "are or his from at which but have an they you were her she there "
+    "been one all we their has would when if so no will more can out up "
+    "compression block transform huffman wheeler burrows move front"
+).split()
+
+
+def gen_text(size: int, rnd: random.Random) -> bytes:
+    # words with a Zipf-like frequency, sentences and line breaks
+    weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    text = bytearray()
+    while len(text) < size:
+        sentence = rnd.choices(WORDS, weights, k=rnd.randint(4, 16))
+        text.extend(" ".join(sentence).capitalize().encode())
+        text.extend(b".\n" if rnd.random() < 0.2 else b". ")
+    return bytes(text[:size])
+
+
+def gen_random(size: int, rnd: random.Random) -> bytes:
+    return rnd.randbytes(size)
+
+
+def gen_low_entropy(size: int, rnd: random.Random) -> bytes:
+    # a handful of symbols, one of them dominating
+    return bytes(rnd.choices(b"\0\1\2\3\x7f\xff", [80, 8, 5, 4, 2, 1], k=size))
+
+
+def gen_runs(size: int, rnd: random.Random) -> bytes:
+    runs = bytearray()
+    while len(runs) < size:
+        runs.extend(bytes([rnd.randrange(256)]) * rnd.randint(1, 300))
+    return bytes(runs[:size])
+
+
+CORPORA = {
+    "text": gen_text,
+    "random": gen_random,
+    "low_entropy": gen_low_entropy,
+    "runs": gen_runs,
+}
+
+
+def make_corpus(name: str, size: int, seed: int = DEFAULT_SEED) -> bytes:
+    """The same `name`, `size` and `seed` always give the same bytes."""
+    return CORPORA[name](size, random.Random(f"{name}:{seed}"))
+
+
+def _time_blocks(transform, blocks) -> tuple[float, list[bytes]]:
+    results = []
+    start = time.perf_counter()
+    for block in blocks:
+        results.append(transform(block))
+    return time.perf_counter() - start, results
+
+
+def peak_memory(transform, blocks) -> int:
+    """The most memory (in bytes) `transform` allocates for one block."""
+    peak = 0
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        for block in blocks:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            transform(block)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return peak
+
+
+def benchmark(
+    transformation_name: str,
+    corpus_name: str,
+    data: bytes,
+    block_size: int,
+    repeat: int = 1,
+    memory: bool = False,
+) -> BenchmarkResult:
+    """Encodes and decodes `data` block by block, the best of `repeat`
+    runs is taken. Raises `AssertionError` if the decoding fails.
+
+    With `memory` the encoding peak memory per block is measured too (in
+    an extra run, as tracing slows everything down)."""
+    transformation = TRANSFORMATIONS[transformation_name]
+    blocks = [
+        data[pos : pos + block_size] for pos in range(0, len(data), block_size)
+    ]
+    encode_time = decode_time = float("inf")
+    for _ in range(repeat):
+        elapsed, encoded = _time_blocks(transformation.encode, blocks)
+        encode_time = min(encode_time, elapsed)
+        elapsed, decoded = _time_blocks(transformation.decode, encoded)
+        decode_time = min(decode_time, elapsed)
+        if decoded != blocks:
+            raise RuntimeError(f"{transformation_name} round trip failed")
+
+    encoded_size = sum(map(len, encoded))
+    megabytes = len(data) / (1 << 20)
+    return BenchmarkResult(
+        transformation=transformation_name,
+        corpus=corpus_name,
+        block_size=block_size,
+        size=len(data),
+        encoded_size=encoded_size,
+        ratio=round(encoded_size / len(data), 4) if data else 1.0,
+        encode_mb_s=round(megabytes / max(encode_time, 1e-9), 4),
+        decode_mb_s=round(megabytes / max(decode_time, 1e-9), 4),
+        encode_peak_kib=(
+            peak_memory(transformation.encode, blocks) // KiB
+            if memory
+            else None
+        ),
+    )
+
+
+def run(
+    transformations=tuple(TRANSFORMATIONS),
+    corpora=tuple(CORPORA),
+    size=DEFAULT_CORPUS_SIZE,
+    block_sizes=DEFAULT_BLOCK_SIZES,
+    repeat=1,
+    seed=DEFAULT_SEED,
+    memory=False,
+):
+    """Yields a `BenchmarkResult` per transformation, corpus and block
+    size."""
+    for corpus_name in corpora:
+        data = make_corpus(corpus_name, size, seed)
+        for block_size in block_sizes:
+            for transformation_name in transformations:
+                yield benchmark(
+                    transformation_name,
+                    corpus_name,
+                    data,
+                    block_size,
+                    repeat,
+                    memory,
+                )
+
+
+def _parse_list(value: str) -> list[str]:
+    return [item for item in value.split(",") if item]
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.benchmark", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "--transformations",
+        type=_parse_list,
+        default=list(TRANSFORMATIONS),
+        help=f"comma-separated, from: {','.join(TRANSFORMATIONS)}",
+    )
+    parser.add_argument(
+        "--corpora",
+        type=_parse_list,
+        default=list(CORPORA),
+        help=f"comma-separated, from: {','.join(CORPORA)}",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=DEFAULT_CORPUS_SIZE,
+        help="corpus size in bytes",
+    )
+    parser.add_argument(
+        "--block-sizes",
+        type=lambda value: [int(item) for item in _parse_list(value)],
+        default=list(DEFAULT_BLOCK_SIZES),
+        help="comma-separated, in bytes",
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="measure the encoding peak memory per block",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        help="the transformations backend (default: the fastest available)",
+    )
+    args = parser.parse_args(argv)
+    for name in args.transformations:
+        if name not in TRANSFORMATIONS:
+            parser.error(f"unknown transformation: {name}")
+    for name in args.corpora:
+        if name not in CORPORA:
+            parser.error(f"unknown corpus: {name}")
+    return args
+
+
+def main(argv=None, out=sys.stdout):
+    args = _parse_args(argv)
+    if args.backend:
+        set_backend(args.backend)
+    environment = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "seed": args.seed,
+        "backend": get_backend().NAME,
+    }
+    for result in run(
+        args.transformations,
+        args.corpora,
+        args.size,
+        args.block_sizes,
+        args.repeat,
+        args.seed,
+        args.memory,
+    ):
+        print(json.dumps({**result._asdict(), **environment}), file=out)
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""Reading and writing genuine `.bz2` streams (the ones `bzip2`, `lbzip2`
+and the standard `bz2` module work with) out of the same building blocks:
+`BWT`, `MTF`, `RleZeroRuns` and the multiple Huffman tables.
+
+A stream is the `BZh` magic, the level digit (the block size in 100 kB),
+the blocks and the end of stream marker, all of them bit-packed (MSB
+first, the blocks aren't byte-aligned). A block is
+
+- the block magic and the CRC of the block data
+- the BWT origin pointer (24 bits)
+- the bitmap of the bytes in use (16 + 16 * 16 bits at most)
+- the Huffman tables count, the selectors (MTF-ed, unary coded) and the
+  code lengths of every table (delta coded)
+- the Huffman coded symbols: RUNA/RUNB, the MTF ranks (shifted by one) of
+  the bytes in use and the end of block symbol
+
+The block data goes through RLE1 (4 to 255 equal bytes become 4 bytes and
+a count) before the BWT.
+"""
+
+import re
+import zlib
+from array import array
+
+from app.packager import CHUNK_SIZE, gen_transformed_blocks
+from app.transformations import BWT, MTF, RleZeroRuns
+from app.transformations.backends import get_backend
+from app.transformations.bwt.bwt import ORIGIN_PTR_SIZE
+from app.transformations.hfc.bits import BitReader, BitWriter
+from app.transformations.hfc.hf_tree import HuffmanCanonicalTree
+from app.transformations.hfc.multi_table import (
+    GROUP_SIZE,
+    MAX_TABLES,
+    MIN_TABLES,
+    build_tables,
+    mtf_selectors,
+)
+from app.transformations.symbols import (
+    BYTE_CAPACITY,
+    WIDE_SYMBOL_TYPECODE,
+    pack_wide_symbols,
+    unpack_wide_symbols,
+)
+
+STREAM_MAGIC = b"BZh"
+BLOCK_MAGIC = 0x314159265359
+END_OF_STREAM_MAGIC = 0x177245385090
+MAGIC_BITS = 48
+CRC_BITS = 32
+ORIGIN_PTR_BITS = 24
+TABLES_COUNT_BITS = 3
+SELECTORS_COUNT_BITS = 15
+CODE_LENGTH_BITS = 5
+IN_USE_GROUP_SIZE = 16  # the bitmap of bytes in use is two-level
+# the alphabet of the Huffman tables: RUNA, RUNB, the ranks and the end
+# of block symbol
+BYTE_CAPACITY_WITH_RUNS = BYTE_CAPACITY + 2
+# the block magic, the CRC, the randomised bit, the origin pointer, the
+# bitmap, the tables and the selectors counts
+BLOCK_HEADER_BITS = (
+    MAGIC_BITS
+    + CRC_BITS
+    + 1
+    + ORIGIN_PTR_BITS
+    + IN_USE_GROUP_SIZE * (IN_USE_GROUP_SIZE + 1)
+    + TABLES_COUNT_BITS
+    + SELECTORS_COUNT_BITS
+)
+
+MIN_LEVEL = 1
+MAX_LEVEL = 9
+LEVEL_BLOCK_SIZE = 100_000
+# the original bzip2 keeps a few bytes of the block spare
+BLOCK_SIZE_RESERVE = 19
+# the codes written are at most 17 bits long (as by the original bzip2),
+# the decoder accepts up to 20
+MAX_CODE_LENGTH = 17
+MAX_READ_CODE_LENGTH = 20
+
+RLE1_MIN_RUN = 4
+RLE1_MAX_RUN = 255
+RLE1_RUN = re.compile(rb"(.)\1{%d,}" % (RLE1_MIN_RUN - 1), re.DOTALL)
+RLE1_ENCODED_RUN = re.compile(rb"(.)\1{%d}(.)" % (RLE1_MIN_RUN - 1), re.DOTALL)
+
+BIT_REVERSED_BYTES = bytes(int(f"{b:08b}"[::-1], 2) for b in range(256))
+CRC_MASK = (1 << CRC_BITS) - 1
+
+
+def block_crc(data: bytes) -> int:
+    """The CRC-32 of bzip2: the same polynomial as `zlib.crc32` has, but
+    MSB first. Which is `zlib.crc32` of the bit-reversed bytes, reversed."""
+    reflected = zlib.crc32(bytes(data).translate(BIT_REVERSED_BYTES))
+    return int(f"{reflected:032b}"[::-1], 2)
+
+
+def combine_crc(stream_crc: int, crc: int) -> int:
+    return (((stream_crc << 1) | (stream_crc >> (CRC_BITS - 1))) ^ crc) & (
+        CRC_MASK
+    )
+
+
+def block_size_of(level: int) -> int:
+    if not MIN_LEVEL <= level <= MAX_LEVEL:
+        raise ValueError(f"Level must be in [{MIN_LEVEL}, {MAX_LEVEL}]")
+    return level * LEVEL_BLOCK_SIZE - BLOCK_SIZE_RESERVE
+
+
+def max_packed_block_size(level: int) -> int:
+    """An upper bound of the size of a block of `level` (and of the end
+    of stream marker after it), in bytes."""
+    # a symbol per byte and the end of block at most
+    symbols_count = block_size_of(level) + 1
+    selectors_count = -(-symbols_count // GROUP_SIZE)
+    # a delta step is 2 bits, a length is at most that many steps away
+    lengths_bits = CODE_LENGTH_BITS + BYTE_CAPACITY_WITH_RUNS * (
+        2 * MAX_READ_CODE_LENGTH + 1
+    )
+    bits = (
+        symbols_count * MAX_READ_CODE_LENGTH
+        + selectors_count * MAX_TABLES
+        + MAX_TABLES * lengths_bits
+        + BLOCK_HEADER_BITS
+        + MAGIC_BITS
+        + CRC_BITS
+    )
+    return -(-bits // 8)
+
+
+def rle1_encode(data: bytes, max_size: int) -> tuple[bytearray, int]:
+    """RLE1 of the longest prefix of `data` whose encoding fits into
+    `max_size` bytes. Returns the encoding and the prefix length."""
+    encoded = bytearray()
+    pos = 0
+    literals_end = len(data)
+    for run in RLE1_RUN.finditer(data):
+        start, end = run.span()
+        if len(encoded) + start - pos > max_size:
+            # no part of the run among the literals: the prefix alone
+            # encodes the same way then
+            literals_end = start
+            break
+        encoded += data[pos:start]
+        pos = start
+        run_byte = run.group(1)
+        while end - pos >= RLE1_MIN_RUN:
+            run_length = min(end - pos, RLE1_MAX_RUN)
+            if len(encoded) + RLE1_MIN_RUN + 1 > max_size:
+                return encoded, pos
+            encoded += run_byte * RLE1_MIN_RUN
+            encoded.append(run_length - RLE1_MIN_RUN)
+            pos += run_length
+        # the rest of the run (if any) is left to the literals
+    end = min(literals_end, pos + max_size - len(encoded))
+    encoded += data[pos:end]
+    return encoded, end
+
+
+def rle1_decode(data: bytes) -> bytes:
+    # the decoder counts equal bytes from the last count on, and that's
+    # what a left to right non-overlapping search does
+    decoded = bytearray()
+    pos = 0
+    for run in RLE1_ENCODED_RUN.finditer(data):
+        start, end = run.span()
+        decoded += data[pos:start]
+        decoded += run.group(1) * (RLE1_MIN_RUN + data[end - 1])
+        pos = end
+    decoded += data[pos:]
+    return bytes(decoded)
+
+
+def gen_source_blocks(in_file, block_size: int):
+    """Splits `in_file` into the blocks, which are up to `block_size`
+    bytes both before and after RLE1."""
+    rest = b""
+    while data := rest + in_file.read(block_size - len(rest)):
+        _, prefix_length = rle1_encode(data, block_size)
+        rest = data[prefix_length:]
+        yield data[:prefix_length]
+
+
+def encode_block(block: bytes) -> tuple[bytes, int, int]:
+    """Returns the bits (as bytes, zero padded) of a block, their count
+    and the block CRC."""
+    rle1_block, _ = rle1_encode(block, len(block) * 5 // 4 + 1)
+    bwt_block = BWT().encode(rle1_block)
+    origin_ptr = int.from_bytes(bwt_block[:ORIGIN_PTR_SIZE], "big")
+    last_column = bwt_block[ORIGIN_PTR_SIZE:]
+
+    # the MTF is done over the bytes in use only: they're renumbered
+    in_use = sorted(set(last_column))
+    renumbering = bytearray(BYTE_CAPACITY)
+    for index, byte in enumerate(in_use):
+        renumbering[byte] = index
+    mtf_block = MTF().encode(last_column.translate(renumbering))
+    symbols = array(
+        WIDE_SYMBOL_TYPECODE,
+        unpack_wide_symbols(RleZeroRuns().encode(mtf_block)),
+    )
+    end_of_block = len(in_use) + 1
+    symbols.append(end_of_block)
+    alphabet_size = end_of_block + 1
+    tables, selectors = build_tables(
+        symbols, alphabet_size, max_length=MAX_CODE_LENGTH
+    )
+
+    writer = BitWriter()
+    write = writer.write
+    crc = block_crc(block)
+    write(BLOCK_MAGIC, MAGIC_BITS)
+    write(crc, CRC_BITS)
+    write(0, 1)  # not randomised
+    write(origin_ptr, ORIGIN_PTR_BITS)
+
+    in_use_set = set(in_use)
+    groups_in_use = []
+    for group_start in range(0, BYTE_CAPACITY, IN_USE_GROUP_SIZE):
+        group = [
+            byte in in_use_set
+            for byte in range(group_start, group_start + IN_USE_GROUP_SIZE)
+        ]
+        if any(group):
+            groups_in_use.append(group)
+        write(any(group), 1)
+    for group in groups_in_use:
+        for byte_in_use in group:
+            write(byte_in_use, 1)
+
+    write(len(tables), TABLES_COUNT_BITS)
+    write(len(selectors), SELECTORS_COUNT_BITS)
+    for rank in mtf_selectors(selectors, len(tables)):
+        # unary code: `rank` ones and a zero
+        write(((1 << rank) - 1) << 1, rank + 1)
+    for lengths in tables:
+        # every length is the previous one plus/minus a few ones
+        length = lengths[0]
+        write(length, CODE_LENGTH_BITS)
+        for symbol_length in lengths:
+            while length < symbol_length:
+                write(0b10, 2)
+                length += 1
+            while length > symbol_length:
+                write(0b11, 2)
+                length -= 1
+            write(0, 1)
+
+    get_backend().write_grouped_codes(
+        writer,
+        symbols,
+        [HuffmanCanonicalTree(lengths).get_codes() for lengths in tables],
+        selectors,
+        GROUP_SIZE,
+    )
+    return writer.to_bytes(), len(writer), crc
+
+
+def compress_file(
+    in_file, out_file, level=MAX_LEVEL, workers=1
+) -> tuple[int, int]:
+    """Writes a `.bz2` stream. Returns the sizes of the data read and
+    written."""
+    block_size = block_size_of(level)
+    out_file.write(STREAM_MAGIC + str(level).encode())
+    read = 0
+    written = len(STREAM_MAGIC) + 1
+    writer = BitWriter()
+    stream_crc = 0
+    for block_length, (block_bits, bits_count, crc) in gen_transformed_blocks(
+        encode_block, gen_source_blocks(in_file, block_size), workers
+    ):
+        read += block_length
+        writer.write_bytes(block_bits, bits_count)
+        stream_crc = combine_crc(stream_crc, crc)
+        # the whole bytes are ready to go
+        out_file.write(writer.bytes)
+        written += len(writer.bytes)
+        writer.bytes.clear()
+    writer.write(END_OF_STREAM_MAGIC, MAGIC_BITS)
+    writer.write(stream_crc, CRC_BITS)
+    tail = writer.to_bytes()
+    out_file.write(tail)
+    return read, written + len(tail)
+
+
+def _read_bitmap(reader: BitReader) -> list[int]:
+    groups_in_use = [reader.read(1) for _ in range(IN_USE_GROUP_SIZE)]
+    in_use = []
+    for group_index, group_in_use in enumerate(groups_in_use):
+        if not group_in_use:
+            continue
+        for byte in range(IN_USE_GROUP_SIZE):
+            if reader.read(1):
+                in_use.append(group_index * IN_USE_GROUP_SIZE + byte)
+    if not in_use:
+        raise ValueError("No bytes in use")
+    return in_use
+
+
+def _read_symbols(reader: BitReader, alphabet_size: int) -> array:
+    tables_count = reader.read(TABLES_COUNT_BITS)
+    if not MIN_TABLES <= tables_count <= MAX_TABLES:
+        raise ValueError(f"Invalid tables count: {tables_count}")
+    selectors_count = reader.read(SELECTORS_COUNT_BITS)
+    if not selectors_count:
+        raise ValueError("No selectors")
+    dictionary = list(range(tables_count))
+    selectors = []
+    for _ in range(selectors_count):
+        rank = 0
+        while reader.read(1):
+            rank += 1
+            if rank >= tables_count:
+                raise ValueError("Invalid selector")
+        selector = dictionary.pop(rank)
+        dictionary.insert(0, selector)
+        selectors.append(selector)
+
+    decoding_tables = []
+    for _ in range(tables_count):
+        length = reader.read(CODE_LENGTH_BITS)
+        lengths = []
+        for _ in range(alphabet_size):
+            while reader.read(1):
+                length += -1 if reader.read(1) else 1
+            if not 1 <= length <= MAX_READ_CODE_LENGTH:
+                raise ValueError(f"Invalid code length: {length}")
+            lengths.append(length)
+        # a Huffman code is complete: no holes in the decoding table
+        if sum(1 << (MAX_READ_CODE_LENGTH - n) for n in lengths) != (
+            1 << MAX_READ_CODE_LENGTH
+        ):
+            raise ValueError("Invalid code lengths")
+        decoding_tables.append(
+            HuffmanCanonicalTree(lengths).get_decoding_table()
+        )
+
+    # the end of block symbol may be in the middle of a group, and the
+    # next block follows it right away: the group is decoded again, up to
+    # the end of block symbol this time
+    end_of_block = alphabet_size - 1
+    symbols = array(WIDE_SYMBOL_TYPECODE)
+    for selector in selectors:
+        table_bits, table = decoding_tables[selector]
+        group_start = len(symbols)
+        mark = reader.mark()
+        reader.read_prefix_codes(table, table_bits, symbols, GROUP_SIZE)
+        if end_of_block not in symbols[group_start:]:
+            continue
+        group_length = symbols.index(end_of_block, group_start) - group_start
+        del symbols[group_start:]
+        reader.reset(mark)
+        reader.read_prefix_codes(table, table_bits, symbols, group_length + 1)
+        symbols.pop()
+        return symbols
+    raise ValueError("No end of block")
+
+
+def decode_block(block) -> bytes:
+    """The block data out of `(crc, origin_ptr, in_use, symbols)`."""
+    crc, origin_ptr, in_use, symbols = block
+    mtf_block = RleZeroRuns().decode(pack_wide_symbols(symbols))
+    renumbered = MTF().decode(mtf_block)
+    if renumbered and max(renumbered) >= len(in_use):
+        raise ValueError("Invalid MTF rank")
+    last_column = renumbered.translate(
+        bytes(in_use) + bytes(BYTE_CAPACITY - len(in_use))
+    )
+    if origin_ptr >= max(len(last_column), 1):
+        raise ValueError("Invalid origin pointer")
+    rle1_block = BWT().decode(
+        origin_ptr.to_bytes(ORIGIN_PTR_SIZE, "big") + last_column
+    )
+    block_data = rle1_decode(rle1_block)
+    if block_crc(block_data) != crc:
+        raise ValueError("Block CRC mismatch")
+    return block_data
+
+
+def _gen_stream_blocks(reader: BitReader, read_ahead, stream_crcs: list):
+    # yields the Huffman-decoded blocks of all the (concatenated) streams;
+    # `read_ahead(size)` buffers the next `size` bytes of the input, the
+    # stream CRCs (expected, computed) are appended to `stream_crcs`
+    while True:
+        read_ahead(len(STREAM_MAGIC) + 1)
+        if not reader.bits_left:
+            return
+        if reader.bits_left < 32 or reader.read(24) != int.from_bytes(
+            STREAM_MAGIC, "big"
+        ):
+            raise ValueError("Not a bzip2 stream")
+        level = reader.read(8) - ord("0")
+        # raises if the level is invalid
+        packed_block_size = max_packed_block_size(level)
+        stream_crc = 0
+        while True:
+            # a whole block in the reader, the next one isn't read yet
+            read_ahead(packed_block_size)
+            if (magic := reader.read(MAGIC_BITS)) != BLOCK_MAGIC:
+                break
+            crc = reader.read(CRC_BITS)
+            if reader.read(1):
+                raise ValueError("Randomised blocks are not supported")
+            origin_ptr = reader.read(ORIGIN_PTR_BITS)
+            in_use = _read_bitmap(reader)
+            symbols = _read_symbols(reader, len(in_use) + 2)
+            stream_crc = combine_crc(stream_crc, crc)
+            yield crc, origin_ptr, in_use, symbols
+        if magic != END_OF_STREAM_MAGIC:
+            raise ValueError("Invalid block magic")
+        stream_crcs.append((reader.read(CRC_BITS), stream_crc))
+        reader.skip(reader.bits_left % 8)  # streams are byte-aligned
+
+
+def decompress_file(in_file, out_file, workers=1) -> tuple[int, int]:
+    """Decodes all the `.bz2` streams of `in_file`. Returns the sizes of
+    the data read and written. Raises `ValueError` if the data is
+    corrupted.
+
+    The input is read a block at a time, so the memory use doesn't
+    depend on its size."""
+    reader = BitReader(b"")
+    read_size = 0
+
+    def read_ahead(size: int):
+        nonlocal read_size
+        while reader.bits_left < size * 8:
+            data = in_file.read(max(size - reader.bits_left // 8, CHUNK_SIZE))
+            if not data:
+                return
+            reader.feed(data)
+            read_size += len(data)
+
+    stream_crcs: list[tuple[int, int]] = []
+    written = 0
+    try:
+        for _, block_data in gen_transformed_blocks(
+            decode_block,
+            _gen_stream_blocks(reader, read_ahead, stream_crcs),
+            workers,
+        ):
+            out_file.write(block_data)
+            written += len(block_data)
+    except EOFError:
+        raise ValueError(
+            "Compressed data ended before the end of stream"
+        ) from None
+    for expected_crc, crc in stream_crcs:
+        if expected_crc != crc:
+            raise ValueError("Stream CRC mismatch")
+    return read_size, written
+
+
+def compress(data: bytes, level=MAX_LEVEL, workers=1) -> bytes:
+    out_file = _BytesSink()
+    compress_file(_BytesSource(data), out_file, level, workers)
+    return bytes(out_file.data)
+
+
+def decompress(data: bytes, workers=1) -> bytes:
+    out_file = _BytesSink()
+    decompress_file(_BytesSource(data), out_file, workers)
+    return bytes(out_file.data)
+
+
+class _BytesSource:
+    def __init__(self, data: bytes) -> None:
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def read(self, size=-1) -> bytes:
+        end = len(self._view) if size < 0 else self._pos + size
+        chunk = bytes(self._view[self._pos : end])
+        self._pos += len(chunk)
+        return chunk
+
+
+class _BytesSink:
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def write(self, data) -> int:
+        self.data += data
+        return len(data)
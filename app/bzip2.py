@@ -1,14 +1,119 @@
-from app.packager import Packager
-from app.transformations import BWT, HFC, MTF, RLE
+from app import aio, stream
+from app.packager import DEFAULT_BLOCK_SIZE, Packager
+from app.transformations import (
+    BWT,
+    HFC,
+    MTF,
+    RLE,
+    ZERO_RUNS_ALPHABET_SIZE,
+    MultiTableHFC,
+    RleZeroRuns,
+)
 
 bzip2 = RLE() >> BWT() >> MTF() >> RLE() >> HFC()
 
+# MTF zero runs coded with RUNA/RUNB symbols, like the original bzip2 does
+bzip2_zero_runs = (
+    RLE() >> BWT() >> MTF() >> RleZeroRuns() >> HFC(ZERO_RUNS_ALPHABET_SIZE)
+)
 
-def encode(in_file, out_file):
-    packager = Packager(bzip2)
+# ... and with up to 6 Huffman tables per block
+bzip2_multi_table = (
+    RLE()
+    >> BWT()
+    >> MTF()
+    >> RleZeroRuns()
+    >> MultiTableHFC(ZERO_RUNS_ALPHABET_SIZE)
+)
+
+
+def encode(
+    in_file,
+    out_file,
+    block_size=DEFAULT_BLOCK_SIZE,
+    workers=1,
+    index=False,
+    use_mmap=False,
+    store_raw=True,
+    transformation=bzip2,
+    pipeline_depth=0,
+):
+    packager = Packager(
+        transformation,
+        block_size,
+        workers=workers,
+        index=index,
+        use_mmap=use_mmap,
+        store_raw=store_raw,
+        pipeline_depth=pipeline_depth,
+    )
     packager.apply_encoding(in_file, out_file)
 
 
-def decode(in_file, out_file):
-    packager = Packager(bzip2)
+def decode(
+    in_file,
+    out_file,
+    workers=1,
+    use_mmap=False,
+    transformation=bzip2,
+    decode_limits=None,
+    pipeline_depth=0,
+):
+    packager = Packager(
+        transformation,
+        workers=workers,
+        use_mmap=use_mmap,
+        decode_limits=decode_limits,
+        pipeline_depth=pipeline_depth,
+    )
     packager.apply_decoding(in_file, out_file)
+
+
+def decode_range(in_file, start, length, transformation=bzip2) -> bytes:
+    return Packager(transformation).decode_range(in_file, start, length)
+
+
+def compressor(
+    block_size=DEFAULT_BLOCK_SIZE,
+    index=False,
+    store_raw=True,
+    transformation=bzip2,
+) -> stream.Compressor:
+    return stream.Compressor(transformation, block_size, index, store_raw)
+
+
+def decompressor(
+    transformation=bzip2, decode_limits=None
+) -> stream.Decompressor:
+    return stream.Decompressor(transformation, decode_limits)
+
+
+def open(
+    file, mode="rb", block_size=DEFAULT_BLOCK_SIZE, transformation=bzip2
+) -> stream.BlockFile:
+    return stream.open(
+        file, mode, transformation=transformation, block_size=block_size
+    )
+
+
+async def encode_stream(
+    reader,
+    writer,
+    block_size=DEFAULT_BLOCK_SIZE,
+    executor=None,
+    concurrency=aio.DEFAULT_CONCURRENCY,
+    transformation=bzip2,
+):
+    await aio.encode(
+        reader, writer, transformation, block_size, executor, concurrency
+    )
+
+
+async def decode_stream(
+    reader,
+    writer,
+    executor=None,
+    concurrency=aio.DEFAULT_CONCURRENCY,
+    transformation=bzip2,
+):
+    await aio.decode(reader, writer, transformation, executor, concurrency)
@@ -0,0 +1,270 @@
+"""The `sbzip` command line tool, modeled after `bzip2`.
+
+    sbzip [-z|-d|-t] [-c] [-k] [-f] [-v] [-b SIZE] [-j JOBS]
+          [--pipeline DEPTH] [--format sbzip|bz2] [-1..-9] [FILE ...]
+
+Without files (or with `-`) the data goes from stdin to stdout, so the
+tool fits into pipelines (`tar c dir | sbzip -j 4 | ssh host ...`).
+
+`--format bz2` writes the standard `.bz2` streams; both formats are
+recognised on decompression.
+
+`--pipeline` reads and writes in threads of their own, up to DEPTH blocks
+ahead of (and behind) the compression; with `-v` the throughput of the
+reading, the compression and the writing is reported separately.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from app import bz2_format
+from app.bzip2 import bzip2
+from app.options import parse_depth, parse_jobs, parse_size
+from app.packager import DEFAULT_BLOCK_SIZE, Packager
+from app.transformations import CompositionStats
+
+SUFFIX = ".bz"
+BZ2_SUFFIX = ".bz2"
+DECODED_SUFFIX = ".out"  # for the files without `SUFFIX`
+PROG = "sbzip"
+
+
+class CliError(Exception):
+    pass
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog=PROG, description=__doc__.splitlines()[0]
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "-z",
+        "--compress",
+        dest="mode",
+        action="store_const",
+        const="compress",
+        help="compress (the default)",
+    )
+    mode.add_argument(
+        "-d",
+        "--decompress",
+        dest="mode",
+        action="store_const",
+        const="decompress",
+    )
+    mode.add_argument(
+        "-t",
+        "--test",
+        dest="mode",
+        action="store_const",
+        const="test",
+        help="check the compressed files, writing nothing",
+    )
+    parser.set_defaults(mode="compress")
+    parser.add_argument(
+        "-c", "--stdout", action="store_true", help="write to stdout"
+    )
+    parser.add_argument(
+        "-k", "--keep", action="store_true", help="keep the input files"
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="overwrite the output files, write compressed data to a tty",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="report the throughput"
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        type=parse_size,
+        default=DEFAULT_BLOCK_SIZE,
+        help="in bytes, `k` and `m` suffixes are accepted (default: 128k)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=parse_jobs,
+        default=1,
+        help="the number of worker processes, 0 for all the cores",
+    )
+    parser.add_argument(
+        "--pipeline",
+        type=parse_depth,
+        default=0,
+        metavar="DEPTH",
+        help="overlap the I/O with the compression, DEPTH blocks deep "
+        "(sbzip format)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("sbzip", "bz2"),
+        default="sbzip",
+        help="the compressed format (default: sbzip)",
+    )
+    for level in range(bz2_format.MIN_LEVEL, bz2_format.MAX_LEVEL + 1):
+        parser.add_argument(
+            f"-{level}",
+            dest="level",
+            action="store_const",
+            const=level,
+            help=argparse.SUPPRESS,
+        )
+    parser.set_defaults(level=bz2_format.MAX_LEVEL)
+    parser.add_argument("files", nargs="*", metavar="FILE")
+    return parser.parse_args(argv)
+
+
+class _NullFile:
+    # the output of `--test`
+    def write(self, data):
+        return len(data)
+
+
+class _Bz2Codec:
+    # `Packager.encode_file`/`decode_file` for the `.bz2` format
+    def __init__(self, level: int, workers: int) -> None:
+        self.level = level
+        self.workers = workers
+
+    def encode_file(self, in_file, out_file):
+        return bz2_format.compress_file(
+            in_file, out_file, self.level, self.workers
+        )
+
+    def decode_file(self, in_file, out_file):
+        return bz2_format.decompress_file(in_file, out_file, self.workers)
+
+
+def _is_bz2(in_file) -> bool:
+    magic = in_file.peek(len(bz2_format.STREAM_MAGIC) + 1)
+    return (
+        magic.startswith(bz2_format.STREAM_MAGIC)
+        and magic[len(bz2_format.STREAM_MAGIC) :][:1].isdigit()
+    )
+
+
+def _output_path(path: str, mode: str, format_name: str) -> str:
+    if mode == "compress":
+        return path + (BZ2_SUFFIX if format_name == "bz2" else SUFFIX)
+    for suffix in (BZ2_SUFFIX, SUFFIX):
+        if path.endswith(suffix) and len(path) > len(suffix):
+            return path[: -len(suffix)]
+    return path + DECODED_SUFFIX
+
+
+def _process(codecs: dict, args, in_file, out_file):
+    if args.mode == "compress":
+        return codecs[args.format].encode_file(in_file, out_file)
+    codec = codecs["bz2" if _is_bz2(in_file) else "sbzip"]
+    return codec.decode_file(in_file, out_file)
+
+
+def _report(name: str, mode: str, sizes: tuple[int, int], seconds: float):
+    in_size, out_size = sizes
+    if mode == "test":
+        message = "ok"
+    elif mode == "decompress":
+        message = f"{in_size} -> {out_size} bytes"
+    else:
+        ratio = out_size / in_size if in_size else 1.0
+        message = f"{in_size} -> {out_size} bytes ({ratio:.1%})"
+    mb_s = in_size / (1 << 20) / seconds if seconds else 0.0
+    print(f"{name}: {message}, {mb_s:.2f} MB/s", file=sys.stderr)
+
+
+def _report_stages(codecs: dict):
+    # the read/transform/write throughput of the sbzip codec, if it ran
+    stats = codecs["sbzip"].observer
+    if stats is not None and stats.stages:
+        print(stats.report(), file=sys.stderr)
+        stats.stages.clear()
+
+
+def _run_stdio(codecs: dict, args):
+    stdout = sys.stdout.buffer
+    if args.mode == "compress" and not args.force and stdout.isatty():
+        raise CliError(
+            "compressed data can't be written to a terminal (-f to force)"
+        )
+    out_file = _NullFile() if args.mode == "test" else stdout
+    start = time.perf_counter()
+    sizes = _process(codecs, args, sys.stdin.buffer, out_file)
+    if args.mode != "test":
+        stdout.flush()
+    if args.verbose:
+        _report("(stdin)", args.mode, sizes, time.perf_counter() - start)
+        _report_stages(codecs)
+
+
+def _run_file(codecs: dict, args, path: str):
+    if not os.path.isfile(path):
+        raise CliError(f"{path}: no such file")
+    if args.mode == "test":
+        out_path = None
+    elif args.stdout:
+        out_path = "-"
+    else:
+        out_path = _output_path(path, args.mode, args.format)
+        if os.path.exists(out_path) and not args.force:
+            raise CliError(f"{out_path}: already exists (-f to overwrite)")
+
+    start = time.perf_counter()
+    with open(path, "rb") as in_file:
+        if out_path is None:
+            sizes = _process(codecs, args, in_file, _NullFile())
+        elif out_path == "-":
+            sizes = _process(codecs, args, in_file, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+        else:
+            try:
+                with open(out_path, "wb") as out_file:
+                    sizes = _process(codecs, args, in_file, out_file)
+            except BaseException:
+                os.remove(out_path)  # no half-written files
+                raise
+    if args.verbose:
+        _report(path, args.mode, sizes, time.perf_counter() - start)
+        _report_stages(codecs)
+    if out_path not in (None, "-") and not args.keep:
+        os.remove(path)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    codecs = {
+        "sbzip": Packager(
+            bzip2,
+            args.block_size,
+            workers=args.jobs,
+            pipeline_depth=args.pipeline,
+            observer=CompositionStats() if args.verbose else None,
+        ),
+        "bz2": _Bz2Codec(args.level, args.jobs),
+    }
+    files = args.files or ["-"]
+    status = 0
+    for path in files:
+        try:
+            if path == "-":
+                _run_stdio(codecs, args)
+            else:
+                _run_file(codecs, args, path)
+        except CliError as e:
+            print(f"{PROG}: {e}", file=sys.stderr)
+            status = 1
+        except Exception as e:
+            # corrupted data fails in many ways, all of them are reported
+            name = "(stdin)" if path == "-" else path
+            print(f"{PROG}: {name}: {type(e).__name__}: {e}", file=sys.stderr)
+            status = 2
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
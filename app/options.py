@@ -0,0 +1,38 @@
+"""The parsers of the command line option values shared by the tools."""
+
+import argparse
+import os
+
+SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20}
+
+
+def parse_size(value: str) -> int:
+    """`"900k"` -> `921600`; the units are `k` (KiB) and `m` (MiB)."""
+    unit = value[-1:].lower() if value[-1:].isalpha() else ""
+    try:
+        size = int(value[: len(value) - len(unit)]) * SIZE_UNITS[unit]
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}") from None
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}")
+    return size
+
+
+def parse_jobs(value: str) -> int:
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid jobs: {value!r}") from None
+    if jobs < 0:
+        raise argparse.ArgumentTypeError(f"invalid jobs: {value!r}")
+    return jobs or os.cpu_count() or 1
+
+
+def parse_depth(value: str) -> int:
+    try:
+        depth = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid depth: {value!r}") from None
+    if depth < 0:
+        raise argparse.ArgumentTypeError(f"invalid depth: {value!r}")
+    return depth
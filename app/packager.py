@@ -1,37 +1,549 @@
+import mmap
+import os
+import stat
+import threading
+from bisect import bisect_right
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from math import log2
+from time import perf_counter
+
+from app.pipeline import prefetched, written_behind
+from app.transformations.instrumentation import StageEvent
+
 DEFAULT_BLOCK_SIZE = 1024 * 128  # 0.13 Mib
+# the largest block of the original bzip2 (`-9`), compresses text better
+LARGE_BLOCK_SIZE = 1024 * 900  # 0.88 Mib
 CHUNK_SIZE = 1024 * 64
 
 ENCODED_BLOCK_HEADER_SIZE = 4
+# the highest bit of the header marks the blocks stored as is
+STORED_BLOCK_FLAG = 1 << (8 * ENCODED_BLOCK_HEADER_SIZE - 1)
+
+# a block is guessed to be incompressible when its sample is (almost)
+# uniformly distributed (a random one has ~7.95 bits per byte) and none
+# of the probes occurs in it twice
+STORED_SAMPLE_SIZE = 4 * 1024
+STORED_ENTROPY_THRESHOLD = 7.9
+STORED_PROBES_COUNT = 8
+STORED_PROBE_SIZE = 32
+
+IN_FLIGHT_BLOCKS_PER_WORKER = 2
+
+# the stages `Packager` reports to its observer, for every block
+PIPELINE_STAGES = ("read", "transform", "write")
+READ_STAGE, TRANSFORM_STAGE, WRITE_STAGE = range(len(PIPELINE_STAGES))
+
+# the (optional) block index follows the blocks: an empty block header
+# marks the end of the blocks, the index trailer ends the file
+BLOCK_INDEX_MAGIC = b"BZIX"
+BLOCK_INDEX_OFFSET_SIZE = 8
+BLOCK_INDEX_LENGTH_SIZE = 4
+BLOCK_INDEX_ENTRY_SIZE = 2 * BLOCK_INDEX_OFFSET_SIZE + BLOCK_INDEX_LENGTH_SIZE
+BLOCK_INDEX_TRAILER_SIZE = BLOCK_INDEX_OFFSET_SIZE + len(BLOCK_INDEX_MAGIC)
+
+BlockIndexEntry = namedtuple(
+    "BlockIndexEntry", ["encoded_offset", "offset", "length"]
+)
+# a block may decode to at most `max_block_size` bytes and at most
+# `max_expansion` times its encoded size (`None` is no limit)
+DecodeLimits = namedtuple(
+    "DecodeLimits", ["max_block_size", "max_expansion"], defaults=[None, None]
+)
+
+
+def pack_block(transformed_block: bytes, stored=False) -> bytes:
+    block_length = len(transformed_block)
+    if stored:
+        block_length |= STORED_BLOCK_FLAG
+    block_header = block_length.to_bytes(
+        ENCODED_BLOCK_HEADER_SIZE, byteorder="big"
+    )
+    return block_header + transformed_block
+
+
+def unpack_block_header(block_header: bytes) -> tuple[int, bool]:
+    """Returns the block length and whether the block is stored as is."""
+    block_length = int.from_bytes(block_header, byteorder="big")
+    return (
+        block_length & ~STORED_BLOCK_FLAG,
+        bool(block_length & STORED_BLOCK_FLAG),
+    )
+
+
+def looks_incompressible(block: bytes) -> bool:
+    if len(block) < STORED_SAMPLE_SIZE:
+        return False
+    sample = block[:: len(block) // STORED_SAMPLE_SIZE]
+    sample_size = len(sample)
+    entropy = -sum(
+        count / sample_size * log2(count / sample_size)
+        for count in Counter(sample).values()
+    )
+    if entropy < STORED_ENTROPY_THRESHOLD:
+        return False
+    # a high order-0 entropy doesn't rule out long repeats, which the BWT
+    # handles perfectly well
+    block = bytes(block)
+    probes_step = len(block) // STORED_PROBES_COUNT
+    return all(
+        block.count(block[pos : pos + STORED_PROBE_SIZE]) == 1
+        for pos in range(0, len(block) - STORED_PROBE_SIZE, probes_step)
+    )
+
+
+def encode_block(transformation, block: bytes, store_raw=True) -> bytes:
+    """Encodes `block` and packs it. With `store_raw` the block is stored
+    as is if it looks incompressible or if the encoding makes it bigger."""
+    if store_raw and looks_incompressible(block):
+        return pack_block(block, stored=True)
+    transformed_block = transformation.encode(block)
+    # a stateful transformation has already counted the block in: it has
+    # to be decoded
+    if (
+        store_raw
+        and not transformation.stateful
+        and len(transformed_block) > len(block)
+    ):
+        return pack_block(block, stored=True)
+    return pack_block(transformed_block)
+
+
+def decode_block(transformation, packed_block: bytes, limits=None) -> bytes:
+    """The inverse of `encode_block`. Raises `ValueError` if the block
+    decodes to more than `limits` (a `DecodeLimits`) allow."""
+    if limits is None:
+        _, stored = unpack_block_header(
+            packed_block[:ENCODED_BLOCK_HEADER_SIZE]
+        )
+        block = memoryview(packed_block)[ENCODED_BLOCK_HEADER_SIZE:]
+        return bytes(block) if stored else transformation.decode(block)
+    return b"".join(gen_decoded_block(transformation, packed_block, limits))
+
+
+def max_decoded_size(limits, encoded_size: int) -> int | None:
+    max_sizes = []
+    if limits.max_block_size is not None:
+        max_sizes.append(limits.max_block_size)
+    if limits.max_expansion is not None:
+        max_sizes.append(int(limits.max_expansion * encoded_size))
+    return min(max_sizes, default=None)
+
+
+def gen_decoded_block(transformation, packed_block: bytes, limits=None):
+    """`decode_block` in chunks (of `DECODED_CHUNK_SIZE` bytes at most,
+    unless the last stage doesn't expand): the expanded data isn't held
+    all at once. The limits are checked chunk by chunk."""
+    block_length, stored = unpack_block_header(
+        packed_block[:ENCODED_BLOCK_HEADER_SIZE]
+    )
+    block = memoryview(packed_block)[ENCODED_BLOCK_HEADER_SIZE:]
+    if stored:
+        yield bytes(block)
+        return
+    max_size = None
+    if limits is not None:
+        max_size = max_decoded_size(limits, block_length)
+    yield from transformation.gen_decoded(block, max_size)
+
+
+def pack_block_index(entries: list, index_offset: int) -> bytes:
+    """The end of blocks marker, the entries and the trailer.
+    `index_offset` is where the marker is written to."""
+    packed = bytearray(ENCODED_BLOCK_HEADER_SIZE)
+    for encoded_offset, offset, length in entries:
+        packed.extend(
+            encoded_offset.to_bytes(BLOCK_INDEX_OFFSET_SIZE, byteorder="big")
+        )
+        packed.extend(
+            offset.to_bytes(BLOCK_INDEX_OFFSET_SIZE, byteorder="big")
+        )
+        packed.extend(
+            length.to_bytes(BLOCK_INDEX_LENGTH_SIZE, byteorder="big")
+        )
+    packed.extend(index_offset.to_bytes(BLOCK_INDEX_OFFSET_SIZE, "big"))
+    packed.extend(BLOCK_INDEX_MAGIC)
+    return bytes(packed)
+
+
+def read_block_index(file) -> list | None:
+    """Reads the block index of a seekable file, `None` if there's none."""
+    file_size = file.seek(0, os.SEEK_END)
+    if file_size < BLOCK_INDEX_TRAILER_SIZE + ENCODED_BLOCK_HEADER_SIZE:
+        return None
+    file.seek(file_size - BLOCK_INDEX_TRAILER_SIZE)
+    trailer = file.read(BLOCK_INDEX_TRAILER_SIZE)
+    if trailer[BLOCK_INDEX_OFFSET_SIZE:] != BLOCK_INDEX_MAGIC:
+        return None
+    index_offset = int.from_bytes(
+        trailer[:BLOCK_INDEX_OFFSET_SIZE], byteorder="big"
+    )
+    file.seek(index_offset)
+    if any(file.read(ENCODED_BLOCK_HEADER_SIZE)):
+        return None  # a block of data ending with the magic by chance
+    packed = file.read(file_size - BLOCK_INDEX_TRAILER_SIZE - file.tell())
+    entries = []
+    for pos in range(0, len(packed), BLOCK_INDEX_ENTRY_SIZE):
+        entry = packed[pos : pos + BLOCK_INDEX_ENTRY_SIZE]
+        offset_end = 2 * BLOCK_INDEX_OFFSET_SIZE
+        entries.append(
+            BlockIndexEntry(
+                int.from_bytes(entry[:BLOCK_INDEX_OFFSET_SIZE], "big"),
+                int.from_bytes(
+                    entry[BLOCK_INDEX_OFFSET_SIZE:offset_end], "big"
+                ),
+                int.from_bytes(entry[offset_end:], "big"),
+            )
+        )
+    return entries
+
+
+def gen_transformed_blocks(transform, blocks, workers=1):
+    """Yields `(source block length, transform(block))` pairs in the order
+    of `blocks`, with `workers > 1` the blocks go to a process pool."""
+    if workers <= 1:
+        for block in blocks:
+            yield len(block), transform(block)
+        return
+
+    # blocks are independent, so they go to a process pool; at most
+    # `max_in_flight` of them are read ahead, and the results are
+    # yielded in the original order
+    max_in_flight = workers * IN_FLIGHT_BLOCKS_PER_WORKER
+    with ProcessPoolExecutor(workers) as executor:
+        in_flight = deque()
+        for block in blocks:
+            if len(in_flight) >= max_in_flight:
+                block_length, future = in_flight.popleft()
+                yield block_length, future.result()
+            if isinstance(block, memoryview):
+                block = bytes(block)  # has to be pickled anyway
+            in_flight.append((len(block), executor.submit(transform, block)))
+        while in_flight:
+            block_length, future = in_flight.popleft()
+            yield block_length, future.result()
+
+
+def timed_call(function, *args) -> tuple[float, object]:
+    """`function(*args)` and the seconds it took: `(seconds, result)`."""
+    start = perf_counter()
+    result = function(*args)
+    return perf_counter() - start, result
+
+
+def _gen_timed(items):
+    # yields `(seconds, item)`: the seconds each item took to come
+    items = iter(items)
+    while True:
+        start = perf_counter()
+        item = next(items, None)
+        if item is None:
+            return
+        yield perf_counter() - start, item
+
+
+def _is_mappable(file) -> bool:
+    # only non-empty regular files can be memory-mapped
+    try:
+        file_stat = os.fstat(file.fileno())
+    except (AttributeError, OSError, ValueError):
+        return False  # not a real file (`io.BytesIO`, ...)
+    return stat.S_ISREG(file_stat.st_mode) and file_stat.st_size > 0
 
 
 class Packager:
-    def __init__(self, transformation, block_size=DEFAULT_BLOCK_SIZE) -> None:
+    def __init__(
+        self,
+        transformation,
+        block_size=DEFAULT_BLOCK_SIZE,
+        workers=1,
+        index=False,
+        use_mmap=False,
+        store_raw=True,
+        decode_limits=None,
+        pipeline_depth=0,
+        observer=None,
+    ) -> None:
+        if transformation.stateful and workers > 1:
+            raise ValueError(
+                "The blocks of a stateful transformation can't be spread "
+                "over worker processes"
+            )
         self.transformation = transformation
         self.block_size = block_size
+        self.workers = workers
+        self.index = index
+        # read the input through `mmap`, splitting it into `memoryview`s
+        self.use_mmap = use_mmap
+        # store the blocks that don't compress as is
+        self.store_raw = store_raw
+        # a `DecodeLimits`: the decoding fails on the blocks that expand
+        # beyond them
+        self.decode_limits = decode_limits
+        # with a depth, a thread reads that many blocks ahead and another
+        # writes the results behind
+        self.pipeline_depth = pipeline_depth
+        # called with a `StageEvent` for every block read, transformed and
+        # written (e.g. a `CompositionStats`)
+        self.observer = observer
+        self._observer_lock = threading.Lock()
 
     def _gen_split_blocks(self, file_to_encode):
         while block := file_to_encode.read(self.block_size):
             yield block
 
+    def _gen_split_mapped_blocks(self, view: memoryview):
+        for pos in range(0, len(view), self.block_size):
+            yield view[pos : pos + self.block_size]
+
     def _gen_split_encoded_blocks(self, file_to_decode):
-        while block_length := file_to_decode.read(ENCODED_BLOCK_HEADER_SIZE):
-            block_length = int.from_bytes(block_length, byteorder="big")
-            block = file_to_decode.read(block_length)
-            yield block
+        # yields the packed blocks, headers included
+        while block_header := file_to_decode.read(ENCODED_BLOCK_HEADER_SIZE):
+            block_length, _ = unpack_block_header(block_header)
+            if block_length == 0:
+                break  # the block index follows
+            packed_block = bytearray(ENCODED_BLOCK_HEADER_SIZE + block_length)
+            packed_block[:ENCODED_BLOCK_HEADER_SIZE] = block_header
+            read = file_to_decode.readinto(
+                memoryview(packed_block)[ENCODED_BLOCK_HEADER_SIZE:]
+            )
+            del packed_block[ENCODED_BLOCK_HEADER_SIZE + read :]
+            yield packed_block
+
+    def _gen_split_encoded_mapped_blocks(self, view: memoryview):
+        pos = 0
+        while pos < len(view):
+            block_start = pos + ENCODED_BLOCK_HEADER_SIZE
+            block_length, _ = unpack_block_header(view[pos:block_start])
+            if block_length == 0:
+                break  # the block index follows
+            yield view[pos : block_start + block_length]
+            pos = block_start + block_length
+
+    @contextmanager
+    def _split_input(self, in_file, split, split_mapped):
+        # yields the blocks of `in_file`: `split(in_file)` or, in the mmap
+        # mode, `split_mapped(view)` where `view` covers the whole file
+        if not (self.use_mmap and _is_mappable(in_file)):
+            yield split(in_file)
+            return
+        mapped = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield split_mapped(view)
+        finally:
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # a block is still referenced (by a traceback, most
+                # likely), the map is closed once it's collected
+                pass
+
+    def _gen_transformed_blocks(self, transform, blocks):
+        return gen_transformed_blocks(transform, blocks, self.workers)
+
+    def _report(self, direction, stage, seconds, in_size, out_size):
+        if self.observer is None:
+            return
+        event = StageEvent(
+            direction,
+            stage,
+            PIPELINE_STAGES[stage],
+            seconds,
+            in_size,
+            out_size,
+        )
+        # the reading and the writing report from their own threads
+        with self._observer_lock:
+            self.observer(event)
+
+    @contextmanager
+    def _pipeline(self, blocks, out_file, direction):
+        # yields the blocks to transform and the function writing the
+        # results: in the pipelined mode both go through threads
+        def gen_read_blocks():
+            for seconds, block in _gen_timed(blocks):
+                self._report(
+                    direction, READ_STAGE, seconds, len(block), len(block)
+                )
+                yield block
+
+        def write(data):
+            start = perf_counter()
+            out_file.write(data)
+            self._report(
+                direction,
+                WRITE_STAGE,
+                perf_counter() - start,
+                len(data),
+                len(data),
+            )
+
+        if not self.pipeline_depth:
+            yield gen_read_blocks(), write
+            return
+        with prefetched(
+            gen_read_blocks(), self.pipeline_depth
+        ) as read_blocks, written_behind(
+            write, self.pipeline_depth
+        ) as write_behind:
+            yield read_blocks, write_behind
 
     def apply_encoding(self, in_path, out_path):
         with open(in_path, "rb") as in_file, open(out_path, "wb") as out_file:
-            for block in self._gen_split_blocks(in_file):
-                transformed_block = self.transformation.encode(block)
-                block_length = len(transformed_block)
-                block_length = block_length.to_bytes(
-                    ENCODED_BLOCK_HEADER_SIZE, byteorder="big"
+            self.encode_file(in_file, out_file)
+
+    def encode_file(self, in_file, out_file) -> tuple[int, int]:
+        """`apply_encoding` for binary file objects (pipes included).
+        Returns the sizes of the data read and written."""
+        self.transformation.reset()
+        with self._split_input(
+            in_file, self._gen_split_blocks, self._gen_split_mapped_blocks
+        ) as blocks, self._pipeline(blocks, out_file, "encode") as (
+            blocks,
+            write,
+        ):
+            index_entries = []
+            encoded_offset = 0
+            offset = 0
+            transform = partial(
+                timed_call,
+                partial(
+                    encode_block, self.transformation, store_raw=self.store_raw
+                ),
+            )
+            for block_length, (
+                seconds,
+                packed_block,
+            ) in self._gen_transformed_blocks(transform, blocks):
+                self._report(
+                    "encode",
+                    TRANSFORM_STAGE,
+                    seconds,
+                    block_length,
+                    len(packed_block),
+                )
+                write(packed_block)
+                index_entries.append(
+                    BlockIndexEntry(encoded_offset, offset, block_length)
                 )
-                out_file.write(block_length)
-                out_file.write(transformed_block)
+                encoded_offset += len(packed_block)
+                offset += block_length
+            if self.index:
+                packed_index = pack_block_index(index_entries, encoded_offset)
+                write(packed_index)
+                encoded_offset += len(packed_index)
+        return offset, encoded_offset
 
     def apply_decoding(self, in_path, out_path):
         with open(in_path, "rb") as in_file, open(out_path, "wb") as out_file:
+            self.decode_file(in_file, out_file)
+
+    def decode_file(self, in_file, out_file) -> tuple[int, int]:
+        """`apply_decoding` for binary file objects (pipes included).
+        Returns the sizes of the blocks read and the data written."""
+        self.transformation.reset()
+        encoded_size = decoded_size = 0
+        with self._split_input(
+            in_file,
+            self._gen_split_encoded_blocks,
+            self._gen_split_encoded_mapped_blocks,
+        ) as blocks, self._pipeline(blocks, out_file, "decode") as (
+            blocks,
+            write,
+        ):
+            if self.workers > 1:
+                # the workers send the decoded blocks back whole
+                transform = partial(
+                    timed_call,
+                    partial(
+                        decode_block,
+                        self.transformation,
+                        limits=self.decode_limits,
+                    ),
+                )
+                decoded_blocks = (
+                    (block_length, [timed_block])
+                    for block_length, timed_block in (
+                        self._gen_transformed_blocks(transform, blocks)
+                    )
+                )
+            else:
+                # the blocks are written out chunk by chunk as they expand
+                decoded_blocks = (
+                    (
+                        len(block),
+                        _gen_timed(
+                            gen_decoded_block(
+                                self.transformation, block, self.decode_limits
+                            )
+                        ),
+                    )
+                    for block in blocks
+                )
+            for block_length, timed_chunks in decoded_blocks:
+                seconds = 0.0
+                block_decoded_size = 0
+                for chunk_seconds, chunk in timed_chunks:
+                    write(chunk)
+                    seconds += chunk_seconds
+                    block_decoded_size += len(chunk)
+                self._report(
+                    "decode",
+                    TRANSFORM_STAGE,
+                    seconds,
+                    block_length,
+                    block_decoded_size,
+                )
+                encoded_size += block_length
+                decoded_size += block_decoded_size
+        return encoded_size, decoded_size
+
+    def _gen_decoded_blocks(self, in_file, entries, start, end):
+        # yields `(offset, decoded block)` for the blocks overlapping
+        # `[start, end)` (and maybe a few more)
+        if entries is None:
+            # no index: decoding all the blocks up to the range end
+            in_file.seek(0)
+            offset = 0
             for block in self._gen_split_encoded_blocks(in_file):
-                transformed_block = self.transformation.decode(block)
-                out_file.write(transformed_block)
+                if offset >= end:
+                    break
+                block = decode_block(
+                    self.transformation, block, self.decode_limits
+                )
+                yield offset, block
+                offset += len(block)
+            return
+
+        offsets = [entry.offset for entry in entries]
+        first = max(bisect_right(offsets, start) - 1, 0)
+        for encoded_offset, offset, _ in entries[first:]:
+            if offset >= end:
+                break
+            in_file.seek(encoded_offset)
+            block = next(self._gen_split_encoded_blocks(in_file))
+            yield offset, decode_block(
+                self.transformation, block, self.decode_limits
+            )
+
+    def decode_range(self, in_path, start: int, length: int) -> bytes:
+        """Decodes `length` bytes starting from `start`, the same as
+        `decoded[start : start + length]`. With a block index only the
+        blocks overlapping the range are read and decoded."""
+        if self.transformation.stateful:
+            raise ValueError(
+                "The blocks of a stateful transformation decode in order only"
+            )
+        end = start + length
+        decoded = bytearray()
+        with open(in_path, "rb") as in_file:
+            entries = read_block_index(in_file)
+            for offset, block in self._gen_decoded_blocks(
+                in_file, entries, start, end
+            ):
+                decoded.extend(block[max(start - offset, 0) : end - offset])
+        return bytes(decoded)
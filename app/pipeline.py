@@ -0,0 +1,87 @@
+"""Threads overlapping the I/O with the transformations: `prefetched`
+reads ahead, `written_behind` writes behind, both through bounded queues.
+
+The file reads and writes release the GIL, so the disk (or the network)
+works while the blocks are transformed.
+"""
+
+import threading
+from contextlib import contextmanager, suppress
+from queue import Empty, Queue
+
+# the end of the items in a queue
+_END = object()
+
+
+@contextmanager
+def prefetched(items, depth: int):
+    """Yields an iterator over `items`, which a thread reads ahead: up to
+    `depth` of them wait in a queue. The exceptions of the thread are
+    raised by the iterator. On the exit the thread is stopped."""
+    queue: Queue = Queue(depth)
+    stopped = threading.Event()
+
+    def read_ahead():
+        try:
+            for item in items:
+                queue.put((item, None))
+                if stopped.is_set():
+                    return
+            queue.put((_END, None))
+        except BaseException as e:
+            queue.put((_END, e))
+
+    def gen_items():
+        while True:
+            item, error = queue.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+
+    thread = threading.Thread(target=read_ahead, daemon=True)
+    thread.start()
+    try:
+        yield gen_items()
+    finally:
+        stopped.set()
+        # the thread may wait for room in the queue
+        while thread.is_alive():
+            with suppress(Empty):
+                queue.get_nowait()
+            thread.join(0.001)
+
+
+@contextmanager
+def written_behind(write, depth: int):
+    """Yields a function queueing its argument for `write`, which a
+    thread calls: up to `depth` calls wait in the queue. On the exit the
+    queue is drained. The exceptions of the thread are raised by the
+    next call or on the exit."""
+    queue: Queue = Queue(depth)
+    errors: list[BaseException] = []
+
+    def write_behind():
+        while (data := queue.get()) is not _END:
+            if errors:
+                continue  # the rest is dropped
+            try:
+                write(data)
+            except BaseException as e:
+                errors.append(e)
+
+    def put(data):
+        if errors:
+            raise errors[0]
+        queue.put(data)
+
+    thread = threading.Thread(target=write_behind, daemon=True)
+    thread.start()
+    try:
+        yield put
+    finally:
+        queue.put(_END)
+        thread.join()
+    if errors:
+        raise errors[0]
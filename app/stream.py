@@ -0,0 +1,253 @@
+import builtins
+import io
+
+from app.packager import (
+    CHUNK_SIZE,
+    DEFAULT_BLOCK_SIZE,
+    ENCODED_BLOCK_HEADER_SIZE,
+    BlockIndexEntry,
+    decode_block,
+    encode_block,
+    pack_block_index,
+    unpack_block_header,
+)
+
+
+class Compressor:
+    """Incremental counterpart of `Packager.apply_encoding`.
+
+    Buffers the input up to `block_size` bytes and returns every finished
+    block (in the `Packager` container format) as soon as it's ready.
+    """
+
+    def __init__(
+        self,
+        transformation,
+        block_size=DEFAULT_BLOCK_SIZE,
+        index=False,
+        store_raw=True,
+    ) -> None:
+        self.transformation = transformation
+        self.transformation.reset()
+        self.block_size = block_size
+        self.index = index
+        self.store_raw = store_raw
+        self._buffer = bytearray()
+        self._finished = False
+        self._index_entries: list[BlockIndexEntry] = []
+        self._encoded_offset = 0
+        self._offset = 0
+
+    def _pack_block(self, block) -> bytes:
+        packed_block = encode_block(
+            self.transformation, bytes(block), self.store_raw
+        )
+        self._index_entries.append(
+            BlockIndexEntry(self._encoded_offset, self._offset, len(block))
+        )
+        self._encoded_offset += len(packed_block)
+        self._offset += len(block)
+        return packed_block
+
+    def compress(self, data) -> bytes:
+        if self._finished:
+            raise ValueError("Compressor has already been flushed")
+        data = memoryview(data).cast("B")
+        packed = bytearray()
+        if self._buffer:
+            missing = self.block_size - len(self._buffer)
+            self._buffer.extend(data[:missing])
+            data = data[missing:]
+            if len(self._buffer) < self.block_size:
+                return b""
+            packed.extend(self._pack_block(self._buffer))
+            self._buffer.clear()
+        # full blocks are taken right from `data`, without buffering
+        while len(data) >= self.block_size:
+            packed.extend(self._pack_block(data[: self.block_size]))
+            data = data[self.block_size :]
+        self._buffer.extend(data)
+        return bytes(packed)
+
+    def flush(self) -> bytes:
+        if self._finished:
+            raise ValueError("Compressor has already been flushed")
+        self._finished = True
+        packed = b""
+        if self._buffer:
+            packed = self._pack_block(self._buffer)
+            self._buffer.clear()
+        if self.index:
+            packed += pack_block_index(
+                self._index_entries, self._encoded_offset
+            )
+        return packed
+
+
+class Decompressor:
+    """Incremental counterpart of `Packager.apply_decoding`.
+
+    Accepts the container in chunks of any size and returns the decoded
+    data of every block as soon as the block is complete. A block that
+    decodes to more than `decode_limits` (a `DecodeLimits`) allow raises
+    `ValueError`.
+    """
+
+    def __init__(self, transformation, decode_limits=None) -> None:
+        self.transformation = transformation
+        self.transformation.reset()
+        self.decode_limits = decode_limits
+        self._buffer = bytearray()
+        self.eof = False  # the block index is reached
+
+    def decompress(self, data) -> bytes:
+        if self.eof:
+            return b""  # the rest is the block index
+        self._buffer.extend(data)
+        decoded = bytearray()
+        while len(self._buffer) >= ENCODED_BLOCK_HEADER_SIZE:
+            block_length, _ = unpack_block_header(
+                self._buffer[:ENCODED_BLOCK_HEADER_SIZE]
+            )
+            if block_length == 0:
+                self.eof = True
+                self._buffer.clear()
+                break
+            block_end = ENCODED_BLOCK_HEADER_SIZE + block_length
+            if len(self._buffer) < block_end:
+                break
+            packed_block = bytes(self._buffer[:block_end])
+            del self._buffer[:block_end]
+            decoded.extend(
+                decode_block(
+                    self.transformation, packed_block, self.decode_limits
+                )
+            )
+        return bytes(decoded)
+
+    def flush(self) -> bytes:
+        if self._buffer:
+            raise ValueError(
+                f"Compressed data ended in the middle of a block "
+                f"({len(self._buffer)} bytes left)"
+            )
+        return b""
+
+
+class BlockFile(io.BufferedIOBase):
+    """A file object that compresses (`"wb"`) or decompresses (`"rb"`)
+    on the fly, keeping at most a block or two in memory."""
+
+    def __init__(
+        self,
+        file,
+        mode="rb",
+        *,
+        transformation,
+        block_size=DEFAULT_BLOCK_SIZE,
+    ) -> None:
+        if mode not in ("rb", "wb", "ab", "xb"):
+            raise ValueError(f"Invalid mode: {mode!r}")
+        self._mode = mode
+        self._close_fp = isinstance(file, (str, bytes)) or hasattr(
+            file, "__fspath__"
+        )
+        self._fp = builtins.open(file, mode) if self._close_fp else file
+        if mode == "rb":
+            self._decompressor = Decompressor(transformation)
+            self._decoded = bytearray()
+            self._eof = False
+        else:
+            self._compressor = Compressor(transformation, block_size)
+
+    def readable(self) -> bool:
+        self._check_not_closed()
+        return self._mode == "rb"
+
+    def writable(self) -> bool:
+        self._check_not_closed()
+        return self._mode != "rb"
+
+    def _check_not_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def _check_mode(self, readable: bool):
+        self._check_not_closed()
+        if readable != (self._mode == "rb"):
+            raise io.UnsupportedOperation(
+                "File not open for " + ("reading" if readable else "writing")
+            )
+
+    def _fill(self) -> bool:
+        # decodes at least one more block, returns False at the end of file
+        while not self._eof:
+            chunk = self._fp.read(CHUNK_SIZE)
+            if not chunk:
+                self._eof = True
+                self._decompressor.flush()
+                break
+            decoded = self._decompressor.decompress(chunk)
+            if decoded:
+                self._decoded.extend(decoded)
+                return True
+        return False
+
+    def read(self, size=-1) -> bytes:
+        self._check_mode(readable=True)
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            size = len(self._decoded)
+        else:
+            while len(self._decoded) < size and self._fill():
+                pass
+        data = bytes(self._decoded[:size])
+        del self._decoded[:size]
+        return data
+
+    def read1(self, size=-1) -> bytes:
+        self._check_mode(readable=True)
+        if not self._decoded:
+            self._fill()
+        if size is None or size < 0:
+            size = len(self._decoded)
+        data = bytes(self._decoded[:size])
+        del self._decoded[:size]
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(memoryview(buffer).cast("B")))
+        memoryview(buffer).cast("B")[: len(data)] = data
+        return len(data)
+
+    def write(self, data) -> int:
+        self._check_mode(readable=False)
+        length = memoryview(data).nbytes
+        self._fp.write(self._compressor.compress(data))
+        return length
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._mode != "rb":
+                self._fp.write(self._compressor.flush())
+        finally:
+            try:
+                if self._close_fp:
+                    self._fp.close()
+            finally:
+                super().close()
+
+
+def open(
+    file,
+    mode="rb",
+    *,
+    transformation,
+    block_size=DEFAULT_BLOCK_SIZE,
+) -> BlockFile:
+    return BlockFile(
+        file, mode, transformation=transformation, block_size=block_size
+    )
@@ -1,16 +1,30 @@
 from app.transformations.bwt.bwt import BWT
 from app.transformations.hfc.hfc import HFC
+from app.transformations.hfc.multi_table import MultiTableHFC
 from app.transformations.identity import Id
+from app.transformations.instrumentation import CompositionStats, StageEvent
 from app.transformations.mtf.mtf import MTF
-from app.transformations.rle import RLE, RlePackBits, RlePairs, RleStreams
+from app.transformations.rle import (
+    RLE,
+    ZERO_RUNS_ALPHABET_SIZE,
+    RlePackBits,
+    RlePairs,
+    RleStreams,
+    RleZeroRuns,
+)
 
 __all__ = (
     "BWT",
+    "CompositionStats",
     "HFC",
     "MTF",
+    "MultiTableHFC",
     "RLE",
     "RlePackBits",
     "RlePairs",
     "RleStreams",
+    "RleZeroRuns",
+    "StageEvent",
+    "ZERO_RUNS_ALPHABET_SIZE",
     "Id",
 )
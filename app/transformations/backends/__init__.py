@@ -0,0 +1,83 @@
+"""Interchangeable implementations of the hot loops of the transformations.
+
+A backend is a module with the same set of functions (the kernels):
+`bwt_encode`, `bwt_decode`, `mtf_encode`, `mtf_decode`, `runs`,
+`run_spans`, `write_codes` and `write_grouped_codes`. `python` is the
+reference one, `numpy` is vectorized (where it pays off) and is the
+default whenever NumPy is importable. Both give byte-identical results.
+
+The backend is chosen per process: the `BZIP2_BACKEND` environment
+variable (inherited by the worker processes), `set_backend` or, in tests,
+`use_backend`.
+"""
+
+import importlib
+import os
+from contextlib import contextmanager
+
+BACKENDS = {
+    "python": "app.transformations.backends.python_backend",
+    "numpy": "app.transformations.backends.numpy_backend",
+}
+BACKEND_ENV_VAR = "BZIP2_BACKEND"
+# the first importable one is the default
+PREFERRED_BACKENDS = ("numpy", "python")
+
+_backend = None
+
+
+def load_backend(name: str):
+    """Raises `ValueError` for unknown backends and `ImportError` for the
+    ones whose dependencies are missing."""
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown backend: {name!r} (expected one of {list(BACKENDS)})"
+        )
+    return importlib.import_module(BACKENDS[name])
+
+
+def available_backends() -> list[str]:
+    names = []
+    for name in BACKENDS:
+        try:
+            load_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def _default_backend():
+    name = os.environ.get(BACKEND_ENV_VAR)
+    if name:
+        return load_backend(name)
+    for name in PREFERRED_BACKENDS:
+        try:
+            return load_backend(name)
+        except ImportError:
+            continue
+    raise ImportError("No backend available")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = _default_backend()
+    return _backend
+
+
+def set_backend(name: str | None):
+    """`None` gets back to the default backend."""
+    global _backend
+    _backend = None if name is None else load_backend(name)
+
+
+@contextmanager
+def use_backend(name: str):
+    global _backend
+    previous = _backend
+    _backend = load_backend(name)
+    try:
+        yield _backend
+    finally:
+        _backend = previous
@@ -0,0 +1,157 @@
+"""Vectorized kernels (NumPy arrays instead of Python loops).
+
+MTF is left to the Python loops: every rank depends on all the previous
+ones, and its vectorized forms (counting the distinct bytes since the
+previous occurrence of every byte) turn out several times slower.
+"""
+
+import numpy as np
+
+from ..hfc.bits import BitWriter
+from .python_backend import mtf_decode, mtf_encode
+
+NAME = "numpy"
+
+
+def _as_array(block) -> np.ndarray:
+    # bytes-like objects and `array`s of wide symbols alike
+    return np.asarray(memoryview(block))
+
+
+def _dense_ranks(sorted_keys: np.ndarray) -> np.ndarray:
+    # 0, 1, 2, ... for the distinct keys of a sorted array
+    changes = np.empty(len(sorted_keys), np.int64)
+    changes[0] = 0
+    np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=changes[1:])
+    return np.cumsum(changes, out=changes)
+
+
+def sort_rotations(block) -> np.ndarray:
+    """`rotations.sort_rotations` by prefix doubling: every pass sorts
+    all the rotations by `(rank, rank of the rotation shifted)` at once.
+    The stable sort keeps equal rotations in ascending shift order."""
+    block_size = len(block)
+    data = _as_array(block)
+    order = np.argsort(data, kind="stable")
+    ranks = np.empty(block_size, np.int64)
+    if not block_size:
+        return order
+    sorted_ranks = _dense_ranks(data[order])
+    ranks[order] = sorted_ranks
+    shift = 1
+    while sorted_ranks[-1] < block_size - 1 and shift < block_size:
+        keys = ranks * block_size + np.roll(ranks, -shift)
+        order = np.argsort(keys, kind="stable")
+        sorted_ranks = _dense_ranks(keys[order])
+        ranks[order] = sorted_ranks
+        shift <<= 1
+    return order
+
+
+def bwt_encode(block) -> tuple[int, bytes]:
+    if not len(block):
+        return 0, b""
+    rotations = sort_rotations(block)
+    origin_ptr = int(np.flatnonzero(rotations == 0)[0])
+    last_column = np.roll(_as_array(block), 1)[rotations]
+    return origin_ptr, last_column.tobytes()
+
+
+def bwt_decode(last_column: bytes, origin_ptr: int) -> bytes:
+    """`lf_mapping.restore_block`, but the rotations are put in order by
+    pointer jumping (the distance of every rotation to the origin one is
+    found in log2(n) steps) instead of walking the LF mapping."""
+    block_size = len(last_column)
+    if not block_size:
+        return b""
+    column = _as_array(last_column)
+    successors = np.argsort(column, kind="stable")
+    successors[origin_ptr] = origin_ptr
+    distances = np.ones(block_size, np.int64)
+    distances[origin_ptr] = 0
+    for _ in range(block_size.bit_length()):
+        distances += distances[successors]
+        successors = successors[successors]
+    # periodic blocks: only the cycle of the origin rotation is walked,
+    # and it is repeated
+    cycle = successors == origin_ptr
+    period = int(np.count_nonzero(cycle))
+    decoded = np.empty(period, np.uint8)
+    decoded[period - 1 - distances[cycle]] = column[cycle]
+    return np.tile(decoded, block_size // period).tobytes()
+
+
+def _run_starts(data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # the start and the length of every run of a non-empty array
+    starts = np.flatnonzero(data[1:] != data[:-1]) + 1
+    counts = np.diff(starts, prepend=0, append=len(data))
+    return np.concatenate(([0], starts)), counts
+
+
+def runs(block):
+    data = _as_array(block)
+    if not len(data):
+        return []
+    starts, counts = _run_starts(data)
+    return zip(data[starts].tolist(), counts.tolist(), strict=True)
+
+
+def run_spans(block, min_length=2):
+    data = _as_array(block)
+    if not len(data):
+        return []
+    starts, counts = _run_starts(data)
+    long_runs = counts >= min_length
+    return zip(
+        starts[long_runs].tolist(), counts[long_runs].tolist(), strict=True
+    )
+
+
+def _write_code_indices(writer: BitWriter, indices: np.ndarray, codes):
+    # `codes[index]` of every index, via a bit array: the i-th bit of
+    # every code is put at once
+    code_values = np.array([code[0] if code else 0 for code in codes])
+    code_lengths = np.array([code[1] if code else 0 for code in codes])
+    values = code_values[indices]
+    lengths = code_lengths[indices]
+    offsets = np.cumsum(lengths) - lengths
+    bits_count = int(offsets[-1] + lengths[-1]) if len(indices) else 0
+    bits = np.zeros(bits_count, np.uint8)
+    for bit in range(int(code_lengths.max(initial=0))):
+        coded = lengths > bit
+        bits[offsets[coded] + bit] = (
+            values[coded] >> (lengths[coded] - 1 - bit)
+        ) & 1
+    writer.write_bytes(np.packbits(bits).tobytes(), bits_count)
+
+
+def write_codes(writer: BitWriter, symbols, codes: list):
+    _write_code_indices(writer, _as_array(symbols), codes)
+
+
+def write_grouped_codes(
+    writer: BitWriter, symbols, tables_codes: list, selectors, group_size
+):
+    # every table gets its own range of indices in the joined tables
+    symbols = _as_array(symbols)
+    alphabet_size = len(tables_codes[0])
+    table_offsets = np.repeat(
+        np.asarray(selectors, np.int64) * alphabet_size, group_size
+    )
+    _write_code_indices(
+        writer,
+        symbols + table_offsets[: len(symbols)],
+        [code for codes in tables_codes for code in codes],
+    )
+
+
+__all__ = (
+    "bwt_decode",
+    "bwt_encode",
+    "mtf_decode",
+    "mtf_encode",
+    "run_spans",
+    "runs",
+    "write_codes",
+    "write_grouped_codes",
+)
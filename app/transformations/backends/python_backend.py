@@ -0,0 +1,19 @@
+"""The reference kernels: plain Python loops, no dependencies."""
+
+from ..bwt.bwt import bwt_decode, bwt_encode
+from ..hfc.bits import write_codes, write_grouped_codes
+from ..mtf.mtf import mtf_decode, mtf_encode
+from ..rle.runs import run_spans, runs
+
+NAME = "python"
+
+__all__ = (
+    "bwt_decode",
+    "bwt_encode",
+    "mtf_decode",
+    "mtf_encode",
+    "run_spans",
+    "runs",
+    "write_codes",
+    "write_grouped_codes",
+)
@@ -1,56 +1,41 @@
-from __future__ import annotations
-
+from ..backends import get_backend
 from ..transform import Transformation
+from .lf_mapping import restore_block
+from .rotations import sort_rotations, sort_rotations_compact
 
 ORIGIN_PTR_SIZE = 4
+# from this size on the rotations are sorted with `sort_rotations_compact`:
+# ~8 times less memory, but ~3 times slower, so only for the large blocks
+# (above the default 128 KiB ones, up to the 900 KiB ones)
+COMPACT_SORT_MIN_SIZE = 512 * 1024
 
 
-class BWT(Transformation):
-    def encode(self, block: bytes) -> bytes:
-        block_size = len(block)
-        rotations = list(range(block_size))
-
-        class ComparableRotation:
-            def __init__(self, shift) -> None:
-                self.shift = shift
+def bwt_encode(block: bytes) -> tuple[int, bytes]:
+    """Returns the origin pointer and the last column."""
+    if len(block) >= COMPACT_SORT_MIN_SIZE:
+        rotations = sort_rotations_compact(block)
+    else:
+        rotations = sort_rotations(block)
 
-            def __getitem__(self, index):
-                return block[(index + self.shift) % block_size]
+    origin_ptr = rotations.index(0) if rotations else 0
+    # the last column: `block[rot - 1]` for every sorted rotation
+    last_column = bytes(block[-1:]) + block[:-1]
+    return origin_ptr, bytes(map(last_column.__getitem__, rotations))
 
-            def __lt__(self, other: ComparableRotation):
-                for i in range(block_size):
-                    if self[i] < other[i]:
-                        return True
-                    elif self[i] > other[i]:
-                        return False
-                    elif self[i] == other[i]:
-                        continue
-                return False
 
-        def slice_key(rot):
-            return ComparableRotation(rot)
+def bwt_decode(last_column: bytes, origin_ptr: int) -> bytes:
+    return bytes(restore_block(last_column, origin_ptr))
 
-        rotations.sort(key=slice_key)
 
-        origin_ptr = rotations.index(0)
+class BWT(Transformation):
+    def encode(self, block: bytes) -> bytes:
+        origin_ptr, last_column = get_backend().bwt_encode(block)
         origin_ptr_bytes = origin_ptr.to_bytes(
             ORIGIN_PTR_SIZE, byteorder="big"
         )
-        encoded = bytearray(origin_ptr_bytes)
-        for rot in rotations:
-            encoded.append(block[rot - 1])
-        return bytes(encoded)
+        return origin_ptr_bytes + last_column
 
     def decode(self, block: bytes) -> bytes:
         origin_ptr = int.from_bytes(block[:ORIGIN_PTR_SIZE], byteorder="big")
         block = block[ORIGIN_PTR_SIZE:]
-        block_size = len(block)
-        decoded: list[int] = [0] * block_size
-
-        transmissions = list(range(block_size))
-        transmissions.sort(key=lambda i: block[i])
-        cur = origin_ptr
-        for i in range(block_size):
-            cur = transmissions[cur]
-            decoded[i] = block[cur]
-        return bytes(decoded)
+        return get_backend().bwt_decode(block, origin_ptr)
@@ -0,0 +1,38 @@
+from array import array
+
+from .rotations import POSITION_TYPECODE
+
+BYTE_CAPACITY = 256  # 2**8
+
+
+def build_lf_mapping(last_column: bytes) -> array:
+    """Builds the permutation from the first column to the last one.
+
+    Equivalent to a stable sort of `range(len(last_column))` by byte
+    value, but done as a counting sort: the alphabet is only 256 symbols.
+    """
+    counts = [0] * BYTE_CAPACITY
+    for byte in last_column:
+        counts[byte] += 1
+
+    offsets = [0] * BYTE_CAPACITY
+    offset = 0
+    for byte, count in enumerate(counts):
+        offsets[byte] = offset
+        offset += count
+
+    transmissions = array(POSITION_TYPECODE, [0]) * len(last_column)
+    for i, byte in enumerate(last_column):
+        transmissions[offsets[byte]] = i
+        offsets[byte] += 1
+    return transmissions
+
+
+def restore_block(last_column: bytes, origin_ptr: int) -> bytearray:
+    transmissions = build_lf_mapping(last_column)
+    decoded = bytearray(len(last_column))
+    cur = origin_ptr
+    for i in range(len(last_column)):
+        cur = transmissions[cur]
+        decoded[i] = last_column[cur]
+    return decoded
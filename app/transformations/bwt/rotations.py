@@ -0,0 +1,113 @@
+from array import array
+
+BYTE_CAPACITY = 256  # 2**8
+# the positions of the rotations, 4 bytes each (enough for any block)
+POSITION_TYPECODE = "I"
+assert array(POSITION_TYPECODE).itemsize >= 4
+
+
+def sort_rotations(block: bytes) -> list[int]:
+    """Sorts the cyclic rotations of `block` by prefix doubling.
+
+    Returns the rotation shifts in sorted order. Equal rotations (which
+    only occur in periodic blocks) keep ascending shift order, just like a
+    stable sort of the rotations themselves would.
+    """
+    block_size = len(block)
+    if block_size == 0:
+        return []
+
+    ranks = list(block)
+    order = sorted(range(block_size), key=ranks.__getitem__)
+    ranks_count = _rerank(order, ranks, ranks)
+
+    # after the k-th pass `ranks` orders rotations by their first 2**k bytes
+    shift = 1
+    while ranks_count < block_size and shift < block_size:
+        shifted = ranks[shift:] + ranks[:shift]
+        keys = [
+            r * block_size + s for r, s in zip(ranks, shifted, strict=True)
+        ]
+        # `order` is already sorted by `ranks`, so the stable sort keeps
+        # the ties in ascending shift order
+        order.sort(key=keys.__getitem__)
+        ranks_count = _rerank(order, keys, ranks)
+        shift <<= 1
+    return order
+
+
+def _rerank(order: list[int], keys: list[int], ranks: list[int]) -> int:
+    # assigns dense ranks (0, 1, 2, ...) in `order`, returns their count
+    rank = -1
+    prev_key = -1
+    for i in order:
+        key = keys[i]
+        if key != prev_key:
+            rank += 1
+            prev_key = key
+        ranks[i] = rank
+    return rank + 1
+
+
+def sort_rotations_compact(block: bytes) -> array:
+    """The same as `sort_rotations`, but for large blocks.
+
+    The ranks and the order are kept in `array`s (4 bytes per rotation
+    instead of a list slot plus an int object), and each pass only sorts
+    the groups of rotations that are still tied, so the sorted part of
+    the block costs nothing and the temporary lists stay small.
+    """
+    block_size = len(block)
+    order = array(POSITION_TYPECODE, [0]) * block_size
+    ranks = array(POSITION_TYPECODE, [0]) * block_size
+
+    # counting sort by the first byte, the rank of a rotation is the
+    # position of its group in `order`
+    counts = [0] * BYTE_CAPACITY
+    for byte in block:
+        counts[byte] += 1
+    heads = [0] * BYTE_CAPACITY
+    head = 0
+    for byte, count in enumerate(counts):
+        heads[byte] = head
+        head += count
+    positions = heads[:]
+    for i, byte in enumerate(block):
+        order[positions[byte]] = i
+        positions[byte] += 1
+        ranks[i] = heads[byte]
+    groups = [
+        (heads[byte], heads[byte] + count)
+        for byte, count in enumerate(counts)
+        if count > 1
+    ]
+
+    shift = 1
+    while groups and shift < block_size:
+        tied_groups = []
+        for start, end in groups:
+            # sorting by `(rank of the shifted rotation, shift)` packed in
+            # an int; ranks updated earlier in the pass are just more
+            # precise, and the ties stay in ascending shift order
+            packed = sorted(
+                [
+                    ranks[(i + shift) % block_size] * block_size + i
+                    for i in order[start:end]
+                ]
+            )
+            group_start = start
+            prev_key = -1
+            for pos, packed_rotation in enumerate(packed, start):
+                key, i = divmod(packed_rotation, block_size)
+                if key != prev_key:
+                    if pos - group_start > 1:
+                        tied_groups.append((group_start, pos))
+                    group_start = pos
+                    prev_key = key
+                order[pos] = i
+                ranks[i] = group_start
+            if end - group_start > 1:
+                tied_groups.append((group_start, end))
+        groups = tied_groups
+        shift <<= 1
+    return order
@@ -0,0 +1,197 @@
+"""MTF fused with the RLE that follows it: the ranks are run-length coded
+as they're produced, with no intermediate block of ranks.
+
+A run of `count` equal bytes is, after MTF, the rank of the byte and
+`count - 1` zeros, so the fused encoders work run by run (the runs come
+from the backend `runs` kernel) rather than byte by byte. The output is
+byte-identical to the two stages applied one after another.
+
+`Composition` substitutes the fused stages for the adjacent pairs found in
+`FUSED_STAGES` by itself.
+"""
+
+from .backends import get_backend
+from .mtf.mtf import BYTE_CAPACITY, MTF
+from .rle.rle_packbits import (
+    COUNTER_CAPACITY,
+    PACKBITS_MAX_LITERALS,
+    PACKBITS_MIN_REPEAT,
+    RlePackBits,
+    pack_literals,
+    pack_repeat,
+)
+from .rle.rle_zero_runs import RUNB, RleZeroRuns, encode_run_length
+from .rle.runs import gen_repeated
+from .symbols import pack_wide_symbols, unpack_wide_symbols
+from .transform import DECODED_CHUNK_SIZE, Transformation
+
+SINGLE_BYTES = [bytes([byte]) for byte in range(BYTE_CAPACITY)]
+# the RUNA/RUNB digits of the most common zero run lengths
+RUN_LENGTH_DIGITS = [encode_run_length(length) for length in range(1024)]
+
+
+class MtfRlePackBits(Transformation):
+    """`MTF() >> RlePackBits()` in one stage."""
+
+    def encode(self, block: bytes) -> bytes:
+        dictionary = bytearray(range(BYTE_CAPACITY))
+        index, insert = dictionary.index, dictionary.insert
+        first = dictionary[0]
+        encoded = bytearray()
+        literals = bytearray()
+        # the current run of equal ranks
+        run_rank, run_count = 0, 0
+        for byte, count in get_backend().runs(block):
+            rank = 0
+            if byte != first:
+                rank = index(byte)
+                del dictionary[rank]
+                insert(0, byte)
+                first = byte
+            if rank != run_rank:
+                if run_count < PACKBITS_MIN_REPEAT:
+                    literals += SINGLE_BYTES[run_rank] * run_count
+                else:
+                    _pack_repeat(encoded, literals, run_rank, run_count)
+                run_rank, run_count = rank, 0
+            run_count += 1
+            if count > 1 and rank:
+                # the rest of the byte run: zero ranks
+                if run_count < PACKBITS_MIN_REPEAT:
+                    literals += SINGLE_BYTES[run_rank] * run_count
+                else:
+                    _pack_repeat(encoded, literals, run_rank, run_count)
+                run_rank, run_count = 0, 0
+            run_count += count - 1
+        if run_count < PACKBITS_MIN_REPEAT:
+            literals += SINGLE_BYTES[run_rank] * run_count
+        else:
+            _pack_repeat(encoded, literals, run_rank, run_count)
+        pack_literals(encoded, literals)
+        return bytes(encoded)
+
+    def decode(self, block: bytes) -> bytes:
+        return b"".join(self.gen_decoded_chunks(block))
+
+    def gen_decoded_chunks(self, block: bytes):
+        dictionary = bytearray(range(BYTE_CAPACITY))
+        pop, insert = dictionary.pop, dictionary.insert
+        decoded = bytearray()
+        append = decoded.append
+        first = dictionary[0]
+        pos = 0
+        while pos < len(block):
+            counter = block[pos]
+            if counter <= PACKBITS_MAX_LITERALS:
+                # a zero counter is read as a single literal, like
+                # `RlePackBits.decode` does
+                end = pos + 1 + max(counter, 1)
+                ranks = block[pos + 1 : end]
+                repeat = 1
+            else:
+                end = pos + 2
+                ranks = block[pos + 1 : end]
+                repeat = COUNTER_CAPACITY - counter
+            pos = end
+            if len(decoded) >= DECODED_CHUNK_SIZE:
+                yield bytes(decoded)
+                decoded.clear()
+            if repeat > 1 and ranks == b"\0":
+                decoded += SINGLE_BYTES[first] * repeat
+                continue
+            for rank in ranks * repeat:
+                if rank:
+                    first = pop(rank)
+                    insert(0, first)
+                append(first)
+        yield bytes(decoded)
+
+
+def _pack_repeat(encoded: bytearray, literals: bytearray, rank, count):
+    # the literals so far go first
+    pack_literals(encoded, literals)
+    literals.clear()
+    pack_repeat(encoded, rank, count)
+
+
+def _zero_run_digits(run_length: int) -> list[int]:
+    if run_length < len(RUN_LENGTH_DIGITS):
+        return RUN_LENGTH_DIGITS[run_length]
+    return encode_run_length(run_length)
+
+
+class MtfRleZeroRuns(Transformation):
+    """`MTF() >> RleZeroRuns()` in one stage."""
+
+    def encode(self, block: bytes) -> bytes:
+        dictionary = bytearray(range(BYTE_CAPACITY))
+        index, insert = dictionary.index, dictionary.insert
+        first = dictionary[0]
+        symbols: list[int] = []
+        append, extend = symbols.append, symbols.extend
+        # zero ranks only come in the runs: the bytes of two adjacent runs
+        # differ, and so the rank of every run but the first is non-zero
+        for byte, count in get_backend().runs(block):
+            if byte == first:
+                extend(_zero_run_digits(count))
+                continue
+            rank = index(byte)
+            del dictionary[rank]
+            insert(0, byte)
+            first = byte
+            append(rank + 1)
+            if count > 1:
+                extend(_zero_run_digits(count - 1))
+        return pack_wide_symbols(symbols)
+
+    def decode(self, block: bytes) -> bytes:
+        return b"".join(self.gen_decoded_chunks(block))
+
+    def gen_decoded_chunks(self, block: bytes):
+        dictionary = bytearray(range(BYTE_CAPACITY))
+        pop, insert = dictionary.pop, dictionary.insert
+        decoded = bytearray()
+        append = decoded.append
+        first = dictionary[0]
+        run_length = 0
+        weight = 1
+        for symbol in unpack_wide_symbols(block):
+            if symbol <= RUNB:
+                run_length += (symbol + 1) * weight
+                weight <<= 1
+                continue
+            if run_length:
+                if run_length <= DECODED_CHUNK_SIZE:
+                    decoded += SINGLE_BYTES[first] * run_length
+                else:
+                    yield from gen_repeated(
+                        decoded, SINGLE_BYTES[first], run_length
+                    )
+                if len(decoded) >= DECODED_CHUNK_SIZE:
+                    yield bytes(decoded)
+                    decoded.clear()
+                run_length = 0
+                weight = 1
+            first = pop(symbol - 1)
+            insert(0, first)
+            append(first)
+        yield from gen_repeated(decoded, SINGLE_BYTES[first], run_length)
+        yield bytes(decoded)
+
+
+# the pairs of adjacent stages (by their exact types) and their fusion
+FUSED_STAGES = {
+    (MTF, RlePackBits): MtfRlePackBits,
+    (MTF, RleZeroRuns): MtfRleZeroRuns,
+}
+
+
+def fuse(transformations) -> tuple:
+    """`transformations` with the pairs of `FUSED_STAGES` fused."""
+    fused: list[Transformation] = []
+    for t in transformations:
+        if fused and (type(fused[-1]), type(t)) in FUSED_STAGES:
+            fused[-1] = FUSED_STAGES[type(fused[-1]), type(t)]()
+        else:
+            fused.append(t)
+    return tuple(fused)
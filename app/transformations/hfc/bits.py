@@ -3,6 +3,12 @@ from collections import deque
 ACTUAL_BYTE_SIZE = 8
 DEFAULT_BYTE_SIZE = ACTUAL_BYTE_SIZE
 
+FLUSH_THRESHOLD = 64  # bits kept in the `BitWriter` accumulator
+REFILL_SIZE = 8  # bytes pulled into the `BitReader` accumulator at once
+# zero bytes past the end of `BitReader` data: enough to peek up to 64 bits
+# past the end with whole 4-byte (or `REFILL_SIZE`) reads
+READ_PADDING = 24
+
 
 class BitArray:
     @staticmethod
@@ -101,3 +107,172 @@ class BitArray:
         for bit in self:
             new_bit_array.append_bit(bit)
         return new_bit_array
+
+
+class BitWriter:
+    """Packs bit codes (MSB first) into bytes via an int accumulator."""
+
+    def __init__(self) -> None:
+        self.bytes = bytearray()
+        self._acc = 0
+        self._acc_length = 0
+
+    def write(self, code: int, nbits: int):
+        self._acc = (self._acc << nbits) | code
+        self._acc_length += nbits
+        if self._acc_length >= FLUSH_THRESHOLD:
+            self._flush()
+
+    def write_bytes(self, data: bytes, nbits: int):
+        """Writes the first `nbits` bits of `data`."""
+        self._flush()
+        if not self._acc_length:
+            # byte-aligned: the whole bytes go as they are
+            self.bytes.extend(data[: nbits // ACTUAL_BYTE_SIZE])
+            data = data[nbits // ACTUAL_BYTE_SIZE :]
+            nbits %= ACTUAL_BYTE_SIZE
+        padding = len(data) * ACTUAL_BYTE_SIZE - nbits
+        self.write(int.from_bytes(data, "big") >> padding, nbits)
+
+    def _flush(self):
+        rest = self._acc_length % ACTUAL_BYTE_SIZE
+        full_bytes = self._acc >> rest
+        self.bytes.extend(
+            full_bytes.to_bytes(self._acc_length // ACTUAL_BYTE_SIZE, "big")
+        )
+        self._acc &= (1 << rest) - 1
+        self._acc_length = rest
+
+    def __len__(self):
+        return len(self.bytes) * ACTUAL_BYTE_SIZE + self._acc_length
+
+    @property
+    def tail_length(self) -> int:
+        # the amount of zero bits aligning the last byte
+        return -self._acc_length % ACTUAL_BYTE_SIZE
+
+    def to_bytes(self) -> bytes:
+        self._flush()
+        if not self._acc_length:
+            return bytes(self.bytes)
+        last_byte = self._acc << self.tail_length
+        return bytes(self.bytes) + bytes([last_byte])
+
+
+def write_codes(writer: BitWriter, symbols, codes: list):
+    """Writes `codes[symbol]` (a `(code, length)` pair) of every symbol."""
+    write = writer.write
+    for symbol in symbols:
+        write(*codes[symbol])
+
+
+def write_grouped_codes(
+    writer: BitWriter, symbols, tables_codes: list, selectors, group_size
+):
+    """`write_codes` with the codes of `tables_codes[selectors[i]]` for
+    the i-th group of `group_size` symbols."""
+    write = writer.write
+    for group_index, selector in enumerate(selectors):
+        codes = tables_codes[selector]
+        start = group_index * group_size
+        for symbol in symbols[start : start + group_size]:
+            write(*codes[symbol])
+
+
+class BitReader:
+    """Reads bit codes (MSB first) written by `BitWriter`."""
+
+    def __init__(self, data: bytes, *, drop_last: int = 0) -> None:
+        self.bits_left = len(data) * ACTUAL_BYTE_SIZE - drop_last
+        self._data = bytes(data) + bytes(READ_PADDING)
+        self._pos = 0
+        self._acc = 0
+        self._acc_length = 0
+
+    def _refill(self, nbits: int):
+        # pulls whole bytes until there are at least `nbits` bits (zero
+        # bits past the end of data)
+        missing_bytes = -(-(nbits - self._acc_length) // ACTUAL_BYTE_SIZE)
+        missing_bytes = max(missing_bytes, REFILL_SIZE)
+        chunk = self._data[self._pos : self._pos + missing_bytes]
+        self._pos += missing_bytes
+        self._acc = (self._acc << (missing_bytes * ACTUAL_BYTE_SIZE)) | (
+            int.from_bytes(chunk, "big")
+            << ((missing_bytes - len(chunk)) * ACTUAL_BYTE_SIZE)
+        )
+        self._acc_length += missing_bytes * ACTUAL_BYTE_SIZE
+
+    def feed(self, data: bytes):
+        """Appends `data` to the bits left, for the data coming in chunks.
+        The bytes read so far are dropped."""
+        end = len(self._data) - READ_PADDING
+        if self._pos > end:
+            # the padding pulled into the accumulator isn't data
+            padding_bits = (self._pos - end) * ACTUAL_BYTE_SIZE
+            self._acc >>= padding_bits
+            self._acc_length -= padding_bits
+            self._pos = end
+        self._data = b"".join(
+            (self._data[self._pos : end], data, bytes(READ_PADDING))
+        )
+        self._pos = 0
+        self.bits_left += len(data) * ACTUAL_BYTE_SIZE
+
+    def peek(self, nbits: int) -> int:
+        if self._acc_length < nbits:
+            self._refill(nbits)
+        return self._acc >> (self._acc_length - nbits)
+
+    def skip(self, nbits: int):
+        if self._acc_length < nbits:
+            self._refill(nbits)
+        self._acc_length -= nbits
+        self._acc &= (1 << self._acc_length) - 1
+        self.bits_left -= nbits
+
+    def read(self, nbits: int) -> int:
+        if nbits > self.bits_left:
+            raise EOFError(
+                f"Can't read {nbits} bits, only {self.bits_left} left"
+            )
+        code = self.peek(nbits)
+        self.skip(nbits)
+        return code
+
+    def mark(self) -> tuple:
+        """The reading position, to get back to with `reset`."""
+        return self._pos, self._acc, self._acc_length, self.bits_left
+
+    def reset(self, mark: tuple):
+        self._pos, self._acc, self._acc_length, self.bits_left = mark
+
+    def read_prefix_codes(
+        self, table: list, table_bits: int, decoded=None, count=None
+    ):
+        """Decodes `count` symbols (all the bits left by default) with a
+        prefix code lookup table: `table[peek]` is the `(symbol, length)`
+        pair of the code the `table_bits` wide `peek` starts with. The
+        symbols are appended to `decoded` (a new `bytearray` by default),
+        which is returned."""
+        # the same as `peek` + `skip` in a loop, but inlined: it runs once
+        # per symbol
+        data = self._data
+        pos, acc, acc_length = self._pos, self._acc, self._acc_length
+        bits_left = self.bits_left
+        if decoded is None:
+            decoded = bytearray()
+        remaining = -1 if count is None else count  # -1 never gets to 0
+        while bits_left > 0 and remaining:
+            remaining -= 1
+            if acc_length < table_bits:
+                acc = (acc << 32) | int.from_bytes(data[pos : pos + 4], "big")
+                pos += 4
+                acc_length += 32
+            symbol, length = table[acc >> (acc_length - table_bits)]
+            decoded.append(symbol)
+            acc_length -= length
+            acc &= (1 << acc_length) - 1
+            bits_left -= length
+        self._pos, self._acc, self._acc_length = pos, acc, acc_length
+        self.bits_left = bits_left
+        return decoded
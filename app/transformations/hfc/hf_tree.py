@@ -1,40 +1,78 @@
-from collections import defaultdict, namedtuple
+from collections import Counter, defaultdict, namedtuple
+from functools import lru_cache
 from heapq import heapify, heappop, heappush
 
 BYTE_SIZE = 8
 BYTE_CAPACITY = 2**BYTE_SIZE
 
+# keeps the decoding table (`2**MAX_CODE_LENGTH` entries) small
+MAX_CODE_LENGTH = 16
+# the trees (and their tables) of the most recent code lengths
+TREE_CACHE_SIZE = 16
+
 
 class HuffmanCanonicalTree:
     def __init__(self, lengths):
         self.lengths = lengths
         self.trie = None
         self.encoding_table = None
+        self.codes = None
+        self.decoding_table = None
+
+    @staticmethod
+    def lengths_from_block(
+        block: bytes,
+        max_length: int = MAX_CODE_LENGTH,
+        alphabet_size: int = BYTE_CAPACITY,
+    ) -> list:
+        # `block` may be any sequence of symbols below `alphabet_size`
+        return HuffmanCanonicalTree.lengths_from_frequencies(
+            symbol_frequencies(block, alphabet_size), max_length
+        )
+
+    @staticmethod
+    def lengths_from_frequencies(
+        frequencies: list[int], max_length: int = MAX_CODE_LENGTH
+    ) -> list:
+        lengths = HuffmanCanonicalTree._lengths_from_frequencies(frequencies)
+        while max(lengths) > max_length:
+            # flattening the distribution (the way the original bzip2 does)
+            # until the tree is shallow enough
+            frequencies = [1 + (w >> 1) for w in frequencies]
+            lengths = HuffmanCanonicalTree._lengths_from_frequencies(
+                frequencies
+            )
+        return lengths
 
     @staticmethod
-    def lengths_from_block(block: bytes) -> list:
-        frequencies = [0] * BYTE_CAPACITY
-        for byte in block:
-            frequencies[byte] += 1
-        Node = namedtuple("Node", ["weight", "values"])
-        lengths = [0] * BYTE_CAPACITY
-        weight_heap = [Node(w, [b]) for b, w in enumerate(frequencies)]
+    def _lengths_from_frequencies(frequencies: list[int]) -> list:
+        # equal weights are ordered by the smallest symbol of the subtree
+        Node = namedtuple("Node", ["weight", "first_symbol", "node_id"])
+        symbols_count = len(frequencies)
+        parents = [0] * (2 * symbols_count - 1)
+        weight_heap = [Node(w, b, b) for b, w in enumerate(frequencies)]
         heapify(weight_heap)
+        node_id = symbols_count
         while len(weight_heap) > 1:
-            w1, vs1 = heappop(weight_heap)
-            w2, vs2 = heappop(weight_heap)
-            values = vs1
-            vs1.extend(vs2)
-            weight = w1 + w2
-            heappush(weight_heap, Node(weight, values))
-            for byte in values:
-                lengths[byte] += 1
-                assert 0 <= lengths[byte] < 256
-        return lengths
+            w1, first_symbol, node_id1 = heappop(weight_heap)
+            w2, _, node_id2 = heappop(weight_heap)
+            parents[node_id1] = parents[node_id2] = node_id
+            heappush(weight_heap, Node(w1 + w2, first_symbol, node_id))
+            node_id += 1
+        # a node is created after its children, so the depths are known
+        # top-down when walking the nodes backwards (the root is the last)
+        # the depths may get bigger than a byte can hold;
+        # `lengths_from_frequencies` limits them afterwards
+        depths = [0] * len(parents)
+        for node_id in range(len(parents) - 2, -1, -1):
+            depths[node_id] = depths[parents[node_id]] + 1
+        return depths[:symbols_count]
 
     @staticmethod
-    def lengths_from_bytes(lengths_bytes: bytes) -> list:
-        assert len(lengths_bytes) == BYTE_CAPACITY
+    def lengths_from_bytes(
+        lengths_bytes: bytes, alphabet_size: int = BYTE_CAPACITY
+    ) -> list:
+        assert len(lengths_bytes) == alphabet_size
         lengths = []
         for byte in lengths_bytes:
             lengths.append(int.from_bytes([byte], byteorder="big"))
@@ -69,22 +107,65 @@ class HuffmanCanonicalTree:
 
     def get_encoding_table(self):
         if not self.encoding_table:
+            encoding_table = [None] * len(self.lengths)
+            for byte, code in enumerate(self.get_codes()):
+                if code:
+                    code_int, length = code
+                    code_bits = bin(code_int)[2:].zfill(length)
+                    encoding_table[byte] = tuple(int(b) for b in code_bits)
+            self.encoding_table = encoding_table
+        return self.encoding_table
+
+    def get_codes(self):
+        """The same as `get_encoding_table`, but every code is stored as
+        a `(code, length)` pair of ints instead of a tuple of bits."""
+        if not self.codes:
             lengths = [
                 (l, b) for b, l in enumerate(self.lengths)  # noqa: E741
             ]
             lengths.sort()
-            encoding_table = [None] * BYTE_CAPACITY
+            codes = [None] * len(self.lengths)
             current_code = -1
             current_length = 0
             for length, byte in lengths:
                 if length == 0:
                     continue
                 current_code += 1
-                while current_length < length:
-                    current_code <<= 1
-                    current_length += 1
-                code_bits = bin(current_code)[2:]
-                code_bits = code_bits.zfill(current_length)
-                encoding_table[byte] = tuple(int(b) for b in code_bits)
-            self.encoding_table = encoding_table
-        return self.encoding_table
+                current_code <<= length - current_length
+                current_length = length
+                codes[byte] = (current_code, length)
+            self.codes = codes
+        return self.codes
+
+    def get_decoding_table(self):
+        """Returns `(table_bits, table)`: `table[peek]` is the
+        `(byte, length)` pair of the code `peek` (`table_bits` bits wide)
+        starts with."""
+        if not self.decoding_table:
+            table_bits = max(self.lengths)
+            table = [None] * (1 << table_bits)
+            for byte, code in enumerate(self.get_codes()):
+                if not code:
+                    continue
+                code_int, length = code
+                start = code_int << (table_bits - length)
+                span = 1 << (table_bits - length)
+                table[start : start + span] = [(byte, length)] * span
+            self.decoding_table = (table_bits, table)
+        return self.decoding_table
+
+
+def symbol_frequencies(block, alphabet_size: int = BYTE_CAPACITY) -> list:
+    counter = Counter(block)
+    return [counter[symbol] for symbol in range(alphabet_size)]
+
+
+def cached_tree(lengths) -> HuffmanCanonicalTree:
+    """A tree shared by all the callers with the same code lengths, so
+    its tables are built once. It's not to be modified."""
+    return _cached_tree(tuple(lengths))
+
+
+@lru_cache(maxsize=TREE_CACHE_SIZE)
+def _cached_tree(lengths: tuple) -> HuffmanCanonicalTree:
+    return HuffmanCanonicalTree(lengths)
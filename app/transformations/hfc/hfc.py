@@ -1,32 +1,77 @@
+from array import array
+
+from ..backends import get_backend
 from ..rle.rle_packbits import RlePackBits
+from ..symbols import (
+    WIDE_SYMBOL_TYPECODE,
+    pack_wide_symbols,
+    unpack_wide_symbols,
+)
 from ..transform import Transformation
-from .bits import BitArray
-from .hf_tree import HuffmanCanonicalTree
+from .bits import BitArray, BitReader, BitWriter
+from .hf_tree import (
+    MAX_CODE_LENGTH,
+    HuffmanCanonicalTree,
+    cached_tree,
+    symbol_frequencies,
+)
 
 BYTE_SIZE = 8
 BYTE_CAPACITY = 2**BYTE_SIZE
 
 TREE_ENCODER = RlePackBits()
 TREE_HEADER_SIZE = 4
+# the previous block's table is reused if the block coded with it is at
+# most this much bigger than with a table of its own (sent along)
+REUSE_TOLERANCE = 0.01
 
 
 class HFC(Transformation):
-    def encode(self, block: bytes) -> bytes:
-        h_lengths = HuffmanCanonicalTree.lengths_from_block(block)
-        h_tree = HuffmanCanonicalTree(h_lengths)
-        encoded_bits = BitArray()
+    """Huffman coding, a table per block.
+
+    With `reuse_tables` a block whose statistics are close to the
+    previous one's goes without a table (its size in the header is 0):
+    the previous block's table is used. That makes the transformation
+    stateful.
+    """
+
+    def __init__(
+        self, alphabet_size: int = BYTE_CAPACITY, reuse_tables=False
+    ) -> None:
+        # alphabets wider than a byte come as 2-byte big-endian symbols
+        self.alphabet_size = alphabet_size
+        self.wide = alphabet_size > BYTE_CAPACITY
+        self.reuse_tables = reuse_tables
+        self.reset()
 
-        encoding_table = h_tree.get_encoding_table()
-        for byte in block:
-            encoded_bits.extend_bit(encoding_table[byte])
+    @property
+    def stateful(self) -> bool:  # type: ignore[override]
+        return self.reuse_tables
+
+    def reset(self):
+        # the code lengths of the last table sent
+        self._sent_lengths: list | None = None
+        self._received_lengths: list | None = None
+
+    def encode(self, block: bytes) -> bytes:
+        symbols = unpack_wide_symbols(block) if self.wide else block
+        frequencies = symbol_frequencies(symbols, self.alphabet_size)
+        h_lengths = HuffmanCanonicalTree.lengths_from_frequencies(frequencies)
+        tree_lengths = TREE_ENCODER.encode(bytes(h_lengths))
+        if self.reuse_tables:
+            previous_lengths = self._sent_lengths
+            new_cost = _coded_size(frequencies, h_lengths)
+            new_cost += len(tree_lengths) * BYTE_SIZE
+            if previous_lengths is not None and _coded_size(
+                frequencies, previous_lengths
+            ) <= new_cost * (1 + REUSE_TOLERANCE):
+                h_lengths, tree_lengths = previous_lengths, b""
+            self._sent_lengths = h_lengths
+        h_tree = cached_tree(h_lengths)
+        encoded_bits = BitWriter()
 
-        last_byte_length = len(encoded_bits) % BYTE_SIZE
-        tail_length = 0
-        if last_byte_length != 0:
-            tail_length = BYTE_SIZE - last_byte_length
+        get_backend().write_codes(encoded_bits, symbols, h_tree.get_codes())
 
-        tree_lengths = h_tree.lengths_to_bytes()
-        tree_lengths = TREE_ENCODER.encode(tree_lengths)
         tree_lengths_size = len(tree_lengths)
         tree_lengths_size_bytes = tree_lengths_size.to_bytes(
             TREE_HEADER_SIZE, byteorder="big"
@@ -35,8 +80,8 @@ class HFC(Transformation):
         encoded = bytearray()
         encoded.extend(tree_lengths_size_bytes)
         encoded.extend(tree_lengths)
-        encoded.extend(encoded_bits.to_byte_array())
-        encoded.append(tail_length)
+        encoded.extend(encoded_bits.to_bytes())
+        encoded.append(encoded_bits.tail_length)
         return bytes(encoded)
 
     def decode(self, block: bytes) -> bytes:
@@ -45,21 +90,56 @@ class HFC(Transformation):
             tree_lengths_size_bytes, byteorder="big"
         )
         block = block[TREE_HEADER_SIZE:]
-        tree_lengths = block[:tree_lengths_size]
-        tree_lengths = TREE_ENCODER.decode(tree_lengths)
+        if tree_lengths_size:
+            tree_lengths = TREE_ENCODER.decode(block[:tree_lengths_size])
+            h_lengths = HuffmanCanonicalTree.lengths_from_bytes(
+                tree_lengths, self.alphabet_size
+            )
+            if self.reuse_tables:
+                self._received_lengths = h_lengths
+        elif self._received_lengths is not None:
+            h_lengths = self._received_lengths
+        else:
+            raise ValueError(
+                "The block reuses the previous block's Huffman table: it "
+                "decodes with HFC(reuse_tables=True), in order only"
+            )
 
         tail_length = int.from_bytes([block[-1]], byteorder="big")
 
         block = block[tree_lengths_size:-1]
 
-        h_lengths = HuffmanCanonicalTree.lengths_from_bytes(tree_lengths)
-        h_tree = HuffmanCanonicalTree(h_lengths)
-        h_trie_root = h_tree.get_trie()
-        h_trie_ptr = h_trie_root
-        decoded = bytearray()
-        for bit in BitArray.gen_bit_stream(block, drop_last=tail_length):
-            h_trie_ptr = h_trie_ptr[bit]
-            if isinstance(h_trie_ptr, int):
-                decoded.append(h_trie_ptr)
-                h_trie_ptr = h_trie_root
-        return bytes(decoded)
+        h_tree = cached_tree(h_lengths)
+        decoded = array(WIDE_SYMBOL_TYPECODE) if self.wide else bytearray()
+        if max(h_lengths) > MAX_CODE_LENGTH:
+            # blocks encoded before the code lengths were limited
+            _decode_with_trie(h_tree, block, tail_length, decoded)
+        else:
+            _decode_with_table(h_tree, block, tail_length, decoded)
+        return pack_wide_symbols(decoded) if self.wide else bytes(decoded)
+
+
+def _coded_size(frequencies: list[int], lengths: list[int]) -> int:
+    return sum(f * n for f, n in zip(frequencies, lengths, strict=True))
+
+
+def _decode_with_table(
+    h_tree: HuffmanCanonicalTree, block: bytes, tail_length: int, decoded
+):
+    table_bits, table = h_tree.get_decoding_table()
+    reader = BitReader(block, drop_last=tail_length)
+    reader.read_prefix_codes(table, table_bits, decoded)
+    return decoded
+
+
+def _decode_with_trie(
+    h_tree: HuffmanCanonicalTree, block: bytes, tail_length: int, decoded
+):
+    h_trie_root = h_tree.get_trie()
+    h_trie_ptr = h_trie_root
+    for bit in BitArray.gen_bit_stream(block, drop_last=tail_length):
+        h_trie_ptr = h_trie_ptr[bit]
+        if isinstance(h_trie_ptr, int):
+            decoded.append(h_trie_ptr)
+            h_trie_ptr = h_trie_root
+    return decoded
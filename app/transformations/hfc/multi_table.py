@@ -0,0 +1,248 @@
+from array import array
+from collections import Counter
+
+from ..backends import get_backend
+from ..rle.rle_packbits import RlePackBits
+from ..symbols import (
+    BYTE_CAPACITY,
+    WIDE_SYMBOL_TYPECODE,
+    pack_wide_symbols,
+    unpack_wide_symbols,
+)
+from ..transform import Transformation
+from .bits import BitReader, BitWriter
+from .hf_tree import MAX_CODE_LENGTH, HuffmanCanonicalTree, cached_tree
+
+GROUP_SIZE = 50  # symbols coded with the same table
+MIN_TABLES = 2
+MAX_TABLES = 6
+DEFAULT_ITERATIONS = 4
+
+TABLES_ENCODER = RlePackBits()
+TABLES_COUNT_SIZE = 1
+SYMBOLS_COUNT_SIZE = 4
+TABLES_HEADER_SIZE = 4
+
+# initial pseudo code lengths: "in range" / "out of range" of a table
+LESSER_COST = 0
+GREATER_COST = 15
+# per-table costs are summed up packed in a single int
+COST_BITS = 32
+COST_MASK = (1 << COST_BITS) - 1
+
+
+def default_tables_count(symbols_count: int) -> int:
+    # the same thresholds as the original bzip2 has
+    for tables_count, threshold in enumerate((200, 600, 1200, 2400), 2):
+        if symbols_count < threshold:
+            return tables_count
+    return MAX_TABLES
+
+
+def _initial_lengths(frequencies: list[int], tables_count: int) -> list:
+    # splits the alphabet into `tables_count` ranges of (roughly) equal
+    # total frequency; every table favours its own range
+    alphabet_size = len(frequencies)
+    tables = []
+    frequency_left = sum(frequencies)
+    start = 0
+    for parts_left in range(tables_count, 0, -1):
+        target_frequency = frequency_left / parts_left
+        end = start - 1
+        frequency = 0
+        while frequency < target_frequency and end < alphabet_size - 1:
+            end += 1
+            frequency += frequencies[end]
+        if (
+            end > start
+            and parts_left not in (tables_count, 1)
+            and (tables_count - parts_left) % 2 == 1
+        ):
+            frequency -= frequencies[end]
+            end -= 1
+        tables.append(
+            [
+                LESSER_COST if start <= symbol <= end else GREATER_COST
+                for symbol in range(alphabet_size)
+            ]
+        )
+        start = end + 1
+        frequency_left -= frequency
+    return tables
+
+
+def _select_tables(symbols, tables: list) -> list[int]:
+    # the cheapest table for every group of symbols
+    packed_costs = [
+        sum(length << (i * COST_BITS) for i, length in enumerate(lengths))
+        for lengths in zip(*tables, strict=True)
+    ]
+    selectors = []
+    for start in range(0, len(symbols), GROUP_SIZE):
+        group = symbols[start : start + GROUP_SIZE]
+        packed_cost = sum(map(packed_costs.__getitem__, group))
+        costs = [
+            (packed_cost >> (i * COST_BITS)) & COST_MASK
+            for i in range(len(tables))
+        ]
+        selectors.append(costs.index(min(costs)))
+    return selectors
+
+
+def _group_frequencies(symbols, selectors, table, alphabet_size) -> list:
+    counter = Counter()
+    for group_index, selector in enumerate(selectors):
+        if selector == table:
+            start = group_index * GROUP_SIZE
+            counter.update(symbols[start : start + GROUP_SIZE])
+    return [counter[symbol] for symbol in range(alphabet_size)]
+
+
+def mtf_selectors(selectors: list[int], tables_count: int) -> list[int]:
+    dictionary = list(range(tables_count))
+    ranks = []
+    for selector in selectors:
+        rank = dictionary.index(selector)
+        ranks.append(rank)
+        dictionary.insert(0, dictionary.pop(rank))
+    return ranks
+
+
+def build_tables(
+    symbols,
+    alphabet_size: int,
+    tables_count: int | None = None,
+    iterations: int = DEFAULT_ITERATIONS,
+    max_length: int = MAX_CODE_LENGTH,
+) -> tuple[list, list[int]]:
+    """Returns the code lengths of every table and the table selected for
+    every group of symbols."""
+    tables_count = tables_count or default_tables_count(len(symbols))
+    frequencies = Counter(symbols)
+    frequencies = [frequencies[s] for s in range(alphabet_size)]
+    tables = _initial_lengths(frequencies, tables_count)
+    selectors = _select_tables(symbols, tables)
+    for _ in range(iterations):
+        tables = [
+            HuffmanCanonicalTree.lengths_from_frequencies(
+                _group_frequencies(symbols, selectors, table, alphabet_size),
+                max_length,
+            )
+            for table in range(tables_count)
+        ]
+        prev_selectors = selectors
+        selectors = _select_tables(symbols, tables)
+        if selectors == prev_selectors:
+            break  # converged: the tables wouldn't change any more
+    return tables, selectors
+
+
+class MultiTableHFC(Transformation):
+    """Huffman coding with several tables per block (like the original
+    bzip2 does): every group of `GROUP_SIZE` symbols is coded with the
+    table that suits it best.
+
+    The tables are refined `iterations` times: the groups are assigned to
+    the cheapest tables, then every table is rebuilt from the groups
+    assigned to it. More iterations cost more CPU and give (slightly)
+    better compression.
+    """
+
+    def __init__(
+        self,
+        alphabet_size: int = BYTE_CAPACITY,
+        tables: int | None = None,
+        iterations: int = DEFAULT_ITERATIONS,
+    ) -> None:
+        if tables is not None and not MIN_TABLES <= tables <= MAX_TABLES:
+            raise ValueError(
+                f"Tables count must be in [{MIN_TABLES}, {MAX_TABLES}]"
+            )
+        if iterations < 1:
+            raise ValueError("At least one iteration is needed")
+        self.alphabet_size = alphabet_size
+        self.wide = alphabet_size > BYTE_CAPACITY
+        self.tables = tables
+        self.iterations = iterations
+
+    def encode(self, block: bytes) -> bytes:
+        symbols = unpack_wide_symbols(block) if self.wide else block
+        tables, selectors = build_tables(
+            symbols, self.alphabet_size, self.tables, self.iterations
+        )
+        h_trees = [cached_tree(lengths) for lengths in tables]
+
+        encoded_bits = BitWriter()
+        write = encoded_bits.write
+        for rank in mtf_selectors(selectors, len(tables)):
+            # unary code: `rank` ones and a zero
+            write(((1 << rank) - 1) << 1, rank + 1)
+        get_backend().write_grouped_codes(
+            encoded_bits,
+            symbols,
+            [h_tree.get_codes() for h_tree in h_trees],
+            selectors,
+            GROUP_SIZE,
+        )
+
+        tables_lengths = bytearray()
+        for h_tree in h_trees:
+            tables_lengths.extend(h_tree.lengths_to_bytes())
+        tables_lengths = TABLES_ENCODER.encode(tables_lengths)
+
+        encoded = bytearray()
+        encoded.extend(len(tables).to_bytes(TABLES_COUNT_SIZE, "big"))
+        encoded.extend(len(symbols).to_bytes(SYMBOLS_COUNT_SIZE, "big"))
+        encoded.extend(len(tables_lengths).to_bytes(TABLES_HEADER_SIZE, "big"))
+        encoded.extend(tables_lengths)
+        encoded.extend(encoded_bits.to_bytes())
+        encoded.append(encoded_bits.tail_length)
+        return bytes(encoded)
+
+    def decode(self, block: bytes) -> bytes:
+        pos = 0
+        tables_count = int.from_bytes(block[:TABLES_COUNT_SIZE], "big")
+        pos += TABLES_COUNT_SIZE
+        symbols_count = int.from_bytes(
+            block[pos : pos + SYMBOLS_COUNT_SIZE], "big"
+        )
+        pos += SYMBOLS_COUNT_SIZE
+        tables_lengths_size = int.from_bytes(
+            block[pos : pos + TABLES_HEADER_SIZE], "big"
+        )
+        pos += TABLES_HEADER_SIZE
+        tables_lengths = TABLES_ENCODER.decode(
+            block[pos : pos + tables_lengths_size]
+        )
+        pos += tables_lengths_size
+        tail_length = block[-1]
+
+        decoding_tables = []
+        for i in range(tables_count):
+            lengths = HuffmanCanonicalTree.lengths_from_bytes(
+                tables_lengths[
+                    i * self.alphabet_size : (i + 1) * self.alphabet_size
+                ],
+                self.alphabet_size,
+            )
+            if max(lengths) > MAX_CODE_LENGTH:
+                raise ValueError(f"Invalid code length: {max(lengths)}")
+            h_tree = cached_tree(lengths)
+            decoding_tables.append(h_tree.get_decoding_table())
+
+        reader = BitReader(block[pos:-1], drop_last=tail_length)
+        dictionary = list(range(tables_count))
+        selectors = []
+        for _ in range(-(-symbols_count // GROUP_SIZE)):
+            rank = 0
+            while reader.read(1):
+                rank += 1
+            selector = dictionary.pop(rank)
+            dictionary.insert(0, selector)
+            selectors.append(selector)
+
+        decoded = array(WIDE_SYMBOL_TYPECODE) if self.wide else bytearray()
+        for selector in selectors:
+            table_bits, table = decoding_tables[selector]
+            reader.read_prefix_codes(table, table_bits, decoded, GROUP_SIZE)
+        return pack_wide_symbols(decoded) if self.wide else bytes(decoded)
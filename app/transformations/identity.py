@@ -3,7 +3,7 @@ from .transform import Transformation
 
 class Id(Transformation):
     def encode(self, block: bytes) -> bytes:
-        return block
+        return bytes(block)
 
     def decode(self, block: bytes) -> bytes:
-        return block
+        return bytes(block)
@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+# what `Composition` reports to its observer after every stage of a block
+StageEvent = namedtuple(
+    "StageEvent",
+    ["direction", "stage", "name", "seconds", "in_size", "out_size"],
+)
+
+
+class StageStats:
+    __slots__ = ("calls", "seconds", "in_size", "out_size")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.in_size = 0
+        self.out_size = 0
+
+    def add(self, event: StageEvent):
+        self.calls += 1
+        self.seconds += event.seconds
+        self.in_size += event.in_size
+        self.out_size += event.out_size
+
+    @property
+    def mb_s(self) -> float:
+        return self.in_size / (1 << 20) / self.seconds if self.seconds else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"StageStats(calls={self.calls}, seconds={self.seconds:.6f}, "
+            f"in_size={self.in_size}, out_size={self.out_size})"
+        )
+
+
+class CompositionStats:
+    """An observer of `Composition` summing up the events per stage.
+
+    `stages` maps `(direction, stage, name)` to a `StageStats`, `blocks`
+    keeps the events of every block (if `keep_blocks` is set).
+    """
+
+    def __init__(self, keep_blocks=False) -> None:
+        self.stages: dict[tuple, StageStats] = {}
+        self.blocks: list[list[StageEvent]] | None = (
+            [] if keep_blocks else None
+        )
+
+    def __call__(self, event: StageEvent):
+        key = event.direction, event.stage, event.name
+        stage_stats = self.stages.get(key)
+        if stage_stats is None:
+            stage_stats = self.stages[key] = StageStats()
+        stage_stats.add(event)
+        if self.blocks is not None:
+            # the stages of a block come in a row: in order when encoding,
+            # in reverse order when decoding
+            step = 1 if event.direction == "encode" else -1
+            last = self.blocks[-1][-1] if self.blocks else None
+            if (
+                last is None
+                or last.direction != event.direction
+                or last.stage + step != event.stage
+            ):
+                self.blocks.append([])
+            self.blocks[-1].append(event)
+
+    def report(self) -> str:
+        total = sum(s.seconds for s in self.stages.values()) or 1.0
+        lines = [
+            f"{'direction':<9} {'stage':<16} {'calls':>7} {'seconds':>10} "
+            f"{'share':>6} {'in':>11} {'out':>11} {'MB/s':>8}"
+        ]
+        for (direction, stage, name), s in self.stages.items():
+            lines.append(
+                f"{direction:<9} {f'{stage}:{name}':<16} {s.calls:>7} "
+                f"{s.seconds:>10.4f} {s.seconds / total:>6.1%} "
+                f"{s.in_size:>11} {s.out_size:>11} {s.mb_s:>8.3f}"
+            )
+        return "\n".join(lines)
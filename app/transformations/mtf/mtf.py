@@ -1,24 +1,49 @@
+from ..backends import get_backend
 from ..transform import Transformation
 
 BYTE_CAPACITY = 256  # 2**8
 
 
+# After BWT most of the ranks are 0 (the byte repeats), so the rank 0 case
+# skips the dictionary update altogether. The dictionary methods are bound
+# once: they're called for every other byte.
+
+
+def mtf_encode(block: bytes) -> bytes:
+    dictionary = bytearray(range(BYTE_CAPACITY))
+    index, insert = dictionary.index, dictionary.insert
+    encoded = bytearray()
+    append = encoded.append
+    first = dictionary[0]
+    for byte in block:
+        if byte == first:
+            append(0)
+            continue
+        rank = index(byte)
+        append(rank)
+        del dictionary[rank]
+        insert(0, byte)
+        first = byte
+    return bytes(encoded)
+
+
+def mtf_decode(block: bytes) -> bytes:
+    dictionary = bytearray(range(BYTE_CAPACITY))
+    pop, insert = dictionary.pop, dictionary.insert
+    decoded = bytearray()
+    append = decoded.append
+    first = dictionary[0]
+    for rank in block:
+        if rank:
+            first = pop(rank)
+            insert(0, first)
+        append(first)
+    return bytes(decoded)
+
+
 class MTF(Transformation):
     def encode(self, block: bytes) -> bytes:
-        dictionary = bytearray(range(BYTE_CAPACITY))
-        encoded = bytearray()
-        for byte in block:
-            index = dictionary.index(byte)
-            encoded.append(index)
-            dictionary.pop(index)
-            dictionary.insert(0, byte)
-        return bytes(encoded)
+        return get_backend().mtf_encode(block)
 
     def decode(self, block: bytes) -> bytes:
-        dictionary = bytearray(range(BYTE_CAPACITY))
-        decoded = bytearray()
-        for index in block:
-            byte = dictionary.pop(index)
-            decoded.append(byte)
-            dictionary.insert(0, byte)
-        return decoded
+        return get_backend().mtf_decode(block)
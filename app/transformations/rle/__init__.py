@@ -1,7 +1,15 @@
 from .rle_packbits import RlePackBits
 from .rle_pairs import RlePairs
 from .rle_streams import RleStreams
+from .rle_zero_runs import ZERO_RUNS_ALPHABET_SIZE, RleZeroRuns
 
 RLE = RlePackBits
 
-__all__ = ["RLE", "RlePackBits", "RlePairs", "RleStreams"]
+__all__ = [
+    "RLE",
+    "RlePackBits",
+    "RlePairs",
+    "RleStreams",
+    "RleZeroRuns",
+    "ZERO_RUNS_ALPHABET_SIZE",
+]
@@ -1,67 +1,61 @@
-from collections import namedtuple
-from itertools import groupby
+from ..backends import get_backend
+from ..transform import DECODED_CHUNK_SIZE, Transformation
 
-from ..transform import Transformation
+PACKBITS_MAX_LITERALS = 127
+PACKBITS_MAX_REPEAT = 128
+PACKBITS_MIN_REPEAT = 3
+# a repeat packet's counter is the negated count as a signed byte
+COUNTER_CAPACITY = 256
+
+
+def pack_repeat(encoded: bytearray, byte: int, count: int):
+    full_packets, rest = divmod(count, PACKBITS_MAX_REPEAT)
+    encoded += (
+        bytes([COUNTER_CAPACITY - PACKBITS_MAX_REPEAT, byte]) * full_packets
+    )
+    if rest:
+        encoded += bytes([COUNTER_CAPACITY - rest, byte])
+
+
+def pack_literals(encoded: bytearray, literals: bytes):
+    for start in range(0, len(literals), PACKBITS_MAX_LITERALS):
+        packet = literals[start : start + PACKBITS_MAX_LITERALS]
+        encoded.append(len(packet))
+        encoded += packet
 
 
 class RlePackBits(Transformation):
     def encode(self, block: bytes) -> bytes:
-        Repeat = namedtuple("Repeat", ["times", "byte"])
-        chunks: list[Repeat | list[int]] = []
-        # splitting into chunks
-        for byte, group in groupby(block):
-            count = len(list(group))
-            if count > 2:
-                chunks.append(Repeat(count, byte))
-            else:
-                if not chunks or isinstance(chunks[-1], Repeat):
-                    chunks.append([])
-                chunks[-1].extend([byte] * count)  # type: ignore[union-attr]
-
         encoded = bytearray()
-        # splitting chunks into packages, counting package bytes
-        for chunk in chunks:
-            if isinstance(chunk, Repeat):
-                times, byte = chunk
-                while times > 0:
-                    counter = min(128, times)
-                    times -= counter
-                    counter_byte = (-counter).to_bytes(
-                        1, signed=True, byteorder="big"
-                    )[0]
-                    encoded.append(counter_byte)
-                    encoded.append(byte)
-            elif isinstance(chunk, list):
-                total_length = len(chunk)
-                for i, byte in enumerate(chunk):
-                    if i % 127 == 0:
-                        length = min(127, total_length - i)
-                        length_byte = length.to_bytes(
-                            1, signed=True, byteorder="big"
-                        )[0]
-                        encoded.append(length_byte)
-                    encoded.append(byte)
+        literals_start = 0
+        for start, count in get_backend().run_spans(
+            block, PACKBITS_MIN_REPEAT
+        ):
+            pack_literals(encoded, block[literals_start:start])
+            pack_repeat(encoded, block[start], count)
+            literals_start = start + count
+        pack_literals(encoded, block[literals_start:])
         return bytes(encoded)
 
     def decode(self, block: bytes) -> bytes:
+        return b"".join(self.gen_decoded_chunks(block))
+
+    def gen_decoded_chunks(self, block: bytes):
         decoded = bytearray()
-        next_counter_byte = 0
-        repeat = 0
-        for byte in block:
-            if next_counter_byte == 0:
-                counter_int = int.from_bytes(
-                    [byte], signed=True, byteorder="big"
-                )
-                if counter_int > 0:
-                    next_counter_byte = counter_int
-                else:
-                    next_counter_byte = 1
-                    repeat = -counter_int
+        pos = 0
+        while pos < len(block):
+            counter = block[pos]
+            if counter <= PACKBITS_MAX_LITERALS:
+                # a zero counter is read as a single literal
+                end = pos + 1 + max(counter, 1)
+                decoded += block[pos + 1 : end]
             else:
-                next_counter_byte -= 1
-                if repeat:
-                    decoded.extend([byte] * repeat)
-                    repeat = 0
-                else:
-                    decoded.append(byte)
-        return decoded
+                end = pos + 2
+                decoded += bytes(block[pos + 1 : end]) * (
+                    COUNTER_CAPACITY - counter
+                )
+            pos = end
+            if len(decoded) >= DECODED_CHUNK_SIZE:
+                yield bytes(decoded)
+                decoded.clear()
+        yield bytes(decoded)
@@ -1,6 +1,12 @@
-from itertools import groupby
+import re
 
-from ..transform import Transformation
+from ..backends import get_backend
+from ..transform import DECODED_CHUNK_SIZE, Transformation
+
+MAX_COUNTER = 255
+# a pair of equal bytes and the counter after it (missing at the very end
+# of a truncated block)
+PAIR_PATTERN = re.compile(rb"(.)\1(.)?", re.DOTALL)
 
 
 class RlePairs(Transformation):
@@ -8,37 +14,41 @@ class RlePairs(Transformation):
 
     def encode(self, block: bytes) -> bytes:
         encoded: bytearray = bytearray()
-        for byte, group in groupby(block):
-            count = len(list(group))
-            if count > 1:
-                while count > 1:
-                    encoded.append(byte)
-                    encoded.append(byte)
-                    cur_count = min(count, 255)
-                    counter_byte = cur_count.to_bytes(
-                        1, signed=False, byteorder="big"
-                    )[0]
-                    encoded.append(counter_byte)
-                    count -= cur_count
-                if count == 1:
-                    encoded.append(byte)
+        literals_start = 0
+        for start, count in get_backend().run_spans(block):
+            encoded += block[literals_start:start]
+            pair = bytes(block[start : start + 2])
+            if count <= MAX_COUNTER:
+                encoded += pair
+                encoded.append(count)
             else:
-                encoded.append(byte)
+                full_pairs, rest = divmod(count, MAX_COUNTER)
+                encoded += (pair + bytes([MAX_COUNTER])) * full_pairs
+                if rest > 1:
+                    encoded += pair
+                    encoded.append(rest)
+                elif rest:
+                    encoded += pair[:1]
+            literals_start = start + count
+        encoded += block[literals_start:]
         return bytes(encoded)
 
     def decode(self, block: bytes) -> bytes:
+        return b"".join(self.gen_decoded_chunks(block))
+
+    def gen_decoded_chunks(self, block: bytes):
         decoded = bytearray()
-        prev_byte: int | None = None
-        next_will_be_counter = False
-        for byte in block:
-            if byte == prev_byte:
-                prev_byte = None
-                next_will_be_counter = True
-            elif next_will_be_counter:
-                next_will_be_counter = False
-                counter = int.from_bytes([byte], signed=False, byteorder="big")
-                decoded.extend([decoded[-1]] * (counter - 1))
-            else:
-                prev_byte = byte
-                decoded.append(byte)
-        return bytes(decoded)
+        pos = 0
+        for match in PAIR_PATTERN.finditer(block):
+            start, end = match.span()
+            decoded += block[pos : start + 1]
+            if end - start == 3:
+                decoded += bytes(block[start : start + 1]) * (
+                    block[end - 1] - 1
+                )
+            pos = end
+            if len(decoded) >= DECODED_CHUNK_SIZE:
+                yield bytes(decoded)
+                decoded.clear()
+        decoded += block[pos:]
+        yield bytes(decoded)
@@ -1,10 +1,9 @@
-from itertools import groupby
+from app.transformations.hfc.bits import BitWriter
 
-from app.transformations.hfc.bits import BitArray
+from ..backends import get_backend
+from ..transform import DECODED_CHUNK_SIZE, Transformation
+from .runs import gen_repeated
 
-from ..transform import Transformation
-
-ACTUAL_BYTE_SIZE = 8
 FLAG_BLOCK_SIZE = 4
 
 
@@ -26,90 +25,102 @@ def _slpit_streams(
     return (flag_stream, symbol_stream)
 
 
-def _compress_flag_stream(uncompressed_flag_stream: list[int]) -> bytearray:
-    bytes_length = len(uncompressed_flag_stream).to_bytes(
-        4, signed=False, byteorder="big"
-    )
-    flag_stream: BitArray = BitArray(FLAG_BLOCK_SIZE)
+# the high and the low nibbles of every byte
+HIGH_NIBBLES = bytes(byte >> 4 for byte in range(256))
+LOW_NIBBLES = bytes(byte & 0xF for byte in range(256))
+
+
+def _compress_flag_stream(uncompressed_flag_stream) -> bytearray:
+    flags = bytes(uncompressed_flag_stream)
+    bytes_length = len(flags).to_bytes(4, signed=False, byteorder="big")
+    flag_stream = BitWriter()
     max_block_len = 2**FLAG_BLOCK_SIZE - 1
-    for flag, group in groupby(uncompressed_flag_stream):
-        count = len(list(group))
-        if flag == 0:
-            while count > 0:
-                sub_count = min(count, max_block_len)
-                for b in BitArray.gen_by_bits(
-                    sub_count, byte_size=FLAG_BLOCK_SIZE
-                ):
-                    flag_stream.append_bit(b)
-                count -= sub_count
+    for start, count in get_backend().run_spans(flags, 1):
+        if flags[start] == 0:
+            full_blocks, rest = divmod(count, max_block_len)
+            # the full blocks are all ones
+            nbits = FLAG_BLOCK_SIZE * full_blocks
+            flag_stream.write((1 << nbits) - 1, nbits)
+            if rest:
+                flag_stream.write(rest, FLAG_BLOCK_SIZE)
         else:  # flag == 1
-            flag_stream.extend_bit([0] * FLAG_BLOCK_SIZE * count)
+            flag_stream.write(0, FLAG_BLOCK_SIZE * count)
 
     out_bytes = bytearray(bytes_length)
-    out_bytes.extend(
-        flag_stream.to_byte_size(ACTUAL_BYTE_SIZE).to_byte_array()
-    )
+    out_bytes.extend(flag_stream.to_bytes())
     return out_bytes
 
 
-def _uncompress_flag_stream(flag_stream: bytes) -> list[int]:
+def _gen_flag_runs(flag_stream: bytes):
+    """Yields a `(flag, count)` pair per run of the flags in
+    `flag_stream` (a run may come in several pairs)."""
     length = int.from_bytes(flag_stream[:4], signed=False, byteorder="big")
-    flag_stream = flag_stream[4:]
-    flag_stream_arr: BitArray = BitArray(ACTUAL_BYTE_SIZE)
-    for byte in flag_stream:
-        flag_stream_arr.append_byte(byte)
-    resized = flag_stream_arr.to_byte_size(FLAG_BLOCK_SIZE)
+    data = bytes(flag_stream[4:])
+    blocks = bytearray(2 * len(data))
+    blocks[0::2] = data.translate(HIGH_NIBBLES)
+    blocks[1::2] = data.translate(LOW_NIBBLES)
+    # a zero block is a 1 flag, the others are that many 0 flags
+    for start, count in get_backend().run_spans(blocks, 1):
+        if not length:
+            return
+        block = blocks[start]
+        flag, count = (0, block * count) if block else (1, count)
+        count = min(count, length)
+        length -= count
+        yield flag, count
+
+
+def _uncompress_flag_stream(flag_stream: bytes) -> list[int]:
     flags = []
-    for block in resized.to_byte_array():
-        if block == 0:
-            flags.append(1)
-        else:
-            flags.extend([0] * block)
-    return flags[:length]
+    for flag, count in _gen_flag_runs(flag_stream):
+        flags.extend([flag] * count)
+    return flags
 
 
 class RleStreams(Transformation):
     def encode(self, block: bytes) -> bytes:
-        unc_flag_stream: list[int] = []
+        unc_flag_stream = bytearray()
         symbol_stream: bytearray = bytearray()
-        for byte, group in groupby(block):
-            count = len(list(group))
-            if count > 2:
-                unc_flag_stream.append(0)
-                symbol_stream.append(byte)
-
-                counter_bytes = count.to_bytes(
-                    32, signed=False, byteorder="big"
-                )
-                i = 0
-                while counter_bytes[i] == 0:
-                    i += 1  # drop leading zeros
-                while i < len(counter_bytes):
-                    unc_flag_stream.append(1)
-                    symbol_stream.append(counter_bytes[i])
-                    i += 1
-            else:
-                for _ in range(count):
-                    unc_flag_stream.append(0)
-                    symbol_stream.append(byte)
+        literals_start = 0
+        for start, count in get_backend().run_spans(block, 3):
+            # the literals and the run's byte are flagged 0, the counter
+            # bytes (no leading zeros) 1
+            symbol_stream += block[literals_start : start + 1]
+            unc_flag_stream += bytes(start + 1 - literals_start)
+            counter_bytes = count.to_bytes(
+                (count.bit_length() + 7) // 8, signed=False, byteorder="big"
+            )
+            symbol_stream += counter_bytes
+            unc_flag_stream += b"\1" * len(counter_bytes)
+            literals_start = start + count
+        symbol_stream += block[literals_start:]
+        unc_flag_stream += bytes(len(block) - literals_start)
         flag_stream = _compress_flag_stream(unc_flag_stream)
         encoded = _join_streams(flag_stream, symbol_stream)
         return bytes(encoded)
 
     def decode(self, block: bytes) -> bytes:
+        return b"".join(self.gen_decoded_chunks(block))
+
+    def gen_decoded_chunks(self, block: bytes):
         flag_stream, symbol_stream = _slpit_streams(block)
-        unc_flag_stream = _uncompress_flag_stream(flag_stream)
-        assert len(symbol_stream) == len(unc_flag_stream)
         decoded = bytearray()
-        for flag, group in groupby(
-            zip(unc_flag_stream, symbol_stream), key=lambda t: t[0]
-        ):
-            g_bytes = [b for _, b in group]
+        pos = 0
+        for flag, count in _gen_flag_runs(flag_stream):
+            end = pos + count
             if flag == 0:
-                decoded.extend(g_bytes)
+                decoded += symbol_stream[pos:end]
             else:
                 counter = int.from_bytes(
-                    g_bytes, signed=False, byteorder="big"
+                    symbol_stream[pos:end], signed=False, byteorder="big"
+                )
+                # the run's byte is the symbol before the counter
+                yield from gen_repeated(
+                    decoded, bytes(symbol_stream[pos - 1 : pos]), counter - 1
                 )
-                decoded.extend([decoded[-1]] * (counter - 1))
-        return bytes(decoded)
+            pos = end
+            if len(decoded) >= DECODED_CHUNK_SIZE:
+                yield bytes(decoded)
+                decoded.clear()
+        assert pos == len(symbol_stream)
+        yield bytes(decoded)
@@ -0,0 +1,82 @@
+import re
+
+from ..symbols import BYTE_CAPACITY, pack_wide_symbols, unpack_wide_symbols
+from ..transform import DECODED_CHUNK_SIZE, Transformation
+from .runs import gen_repeated
+
+RUNA = 0
+RUNB = 1
+# RUNA, RUNB and the non-zero bytes, shifted by one (`1 → 2 ... 255 → 256`)
+ZERO_RUNS_ALPHABET_SIZE = BYTE_CAPACITY + 1
+
+ZERO_RUN = re.compile(rb"\x00+")
+
+
+def encode_run_length(run_length: int) -> list[int]:
+    """Bijective base-2 digits of `run_length` (least significant first):
+    RUNA stands for `1`, RUNB for `2`."""
+    digits = []
+    while run_length > 0:
+        if run_length & 1:
+            digits.append(RUNA)
+            run_length = (run_length - 1) >> 1
+        else:
+            digits.append(RUNB)
+            run_length = (run_length - 2) >> 1
+    return digits
+
+
+def decode_run_length(digits) -> int:
+    run_length = 0
+    for weight_shift, digit in enumerate(digits):
+        run_length += (digit + 1) << weight_shift
+    return run_length
+
+
+class RleZeroRuns(Transformation):
+    """Zero-run encoding of the original bzip2 (to follow MTF).
+
+    Every run of zero bytes becomes its length in RUNA/RUNB digits, every
+    other byte is shifted by one. The output is a sequence of 2-byte
+    symbols of `ZERO_RUNS_ALPHABET_SIZE` alphabet — to be consumed by
+    `HFC(ZERO_RUNS_ALPHABET_SIZE)`.
+    """
+
+    def encode(self, block: bytes) -> bytes:
+        symbols: list[int] = []
+        pos = 0
+        for zero_run in ZERO_RUN.finditer(block):
+            start, end = zero_run.span()
+            symbols.extend([byte + 1 for byte in block[pos:start]])
+            symbols.extend(encode_run_length(end - start))
+            pos = end
+        symbols.extend([byte + 1 for byte in block[pos:]])
+        return pack_wide_symbols(symbols)
+
+    def decode(self, block: bytes) -> bytes:
+        return b"".join(self.gen_decoded_chunks(block))
+
+    def gen_decoded_chunks(self, block: bytes):
+        # the literals decode to half the size of their symbols: only the
+        # runs are chunked
+        decoded = bytearray()
+        run_length = 0
+        weight = 1
+        for symbol in unpack_wide_symbols(block):
+            if symbol <= RUNB:
+                run_length += (symbol + 1) * weight
+                weight <<= 1
+                continue
+            if run_length:
+                if run_length <= DECODED_CHUNK_SIZE:
+                    decoded += bytes(run_length)
+                else:
+                    yield from gen_repeated(decoded, b"\0", run_length)
+                if len(decoded) >= DECODED_CHUNK_SIZE:
+                    yield bytes(decoded)
+                    decoded.clear()
+                run_length = 0
+                weight = 1
+            decoded.append(symbol - 1)
+        yield from gen_repeated(decoded, b"\0", run_length)
+        yield bytes(decoded)
@@ -0,0 +1,46 @@
+"""Run scanning. `run_spans` looks for the runs of equal bytes with a
+regular expression, so the bytes between the runs (the literals) are
+skipped in C and copied by the callers as slices."""
+
+import re
+from functools import lru_cache
+from itertools import groupby
+
+from ..transform import DECODED_CHUNK_SIZE
+
+
+def runs(block: bytes):
+    """Yields a `(byte, count)` pair per run of equal bytes."""
+    for byte, group in groupby(block):
+        yield byte, len(list(group))
+
+
+@lru_cache
+def _run_pattern(min_length: int) -> re.Pattern:
+    return re.compile(rb"(.)\1{%d,}" % (min_length - 1), re.DOTALL)
+
+
+def run_spans(block: bytes, min_length=2):
+    """Yields a `(start, length)` pair per run of at least `min_length`
+    equal bytes."""
+    for match in _run_pattern(min_length).finditer(block):
+        start, end = match.span()
+        yield start, end - start
+
+
+def gen_repeated(decoded: bytearray, pattern: bytes, count: int):
+    """Extends `decoded` with `pattern * count`, unless that's over
+    `DECODED_CHUNK_SIZE` bytes: then `decoded` and the repeat are yielded
+    in chunks instead, and `decoded` is left with the repeat's tail."""
+    if len(pattern) * count <= DECODED_CHUNK_SIZE:
+        decoded += pattern * count
+        return
+    if decoded:
+        yield bytes(decoded)
+        decoded.clear()
+    chunk_count = DECODED_CHUNK_SIZE // len(pattern)
+    full_chunks, rest = divmod(count, chunk_count)
+    chunk = pattern * chunk_count
+    for _ in range(full_chunks):
+        yield chunk
+    decoded += pattern * rest
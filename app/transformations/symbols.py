@@ -0,0 +1,28 @@
+import sys
+from array import array
+
+BYTE_CAPACITY = 256  # 2**8
+
+# Transformations with an alphabet wider than a byte (e.g. `RleZeroRuns`)
+# pass their symbols on as 2-byte big-endian words
+WIDE_SYMBOL_SIZE = 2
+WIDE_SYMBOL_TYPECODE = "H"
+
+
+def pack_wide_symbols(symbols) -> bytes:
+    wide_symbols = array(WIDE_SYMBOL_TYPECODE, symbols)
+    if sys.byteorder == "little":
+        wide_symbols.byteswap()
+    return wide_symbols.tobytes()
+
+
+def unpack_wide_symbols(block: bytes) -> array:
+    if len(block) % WIDE_SYMBOL_SIZE:
+        raise ValueError(
+            f"Block size {len(block)} is not a multiple of {WIDE_SYMBOL_SIZE}"
+        )
+    wide_symbols = array(WIDE_SYMBOL_TYPECODE)
+    wide_symbols.frombytes(block)
+    if sys.byteorder == "little":
+        wide_symbols.byteswap()
+    return wide_symbols
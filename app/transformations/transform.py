@@ -1,10 +1,52 @@
+from time import perf_counter
+
+from app.transformations.instrumentation import StageEvent
+
+# the most the expanding decoders (the RLEs) hold before yielding a chunk
+DECODED_CHUNK_SIZE = 64 * 1024
+# the inner stages of a composition decode to about the size of the block
+# (a header or some literal packet counters more): their limit is the
+# limit of the whole with this much room
+INNER_STAGE_EXPANSION = 2
+INNER_STAGE_ROOM = 64
+
+
+def limit_decoded(chunks, max_size: int | None = None):
+    """Yields the decoded `chunks`. Raises `ValueError` as soon as they
+    are over `max_size` bytes."""
+    decoded_size = 0
+    for chunk in chunks:
+        decoded_size += len(chunk)
+        if max_size is not None and decoded_size > max_size:
+            raise ValueError(f"The block decodes to over {max_size} bytes")
+        yield chunk
+
+
 class Transformation:
+    # the blocks of a stateful transformation depend on the previous ones:
+    # they're encoded and decoded in order, one stream at a time (no
+    # worker processes, no random access)
+    stateful = False
+
     def encode(self, block: bytes) -> bytes:
         raise NotImplementedError
 
     def decode(self, block: bytes) -> bytes:
         raise NotImplementedError
 
+    def reset(self):
+        """Forgets the previous blocks: a new stream starts."""
+
+    def gen_decoded(self, block: bytes, max_size: int | None = None):
+        """Yields the decoded block in chunks. Raises `ValueError` once
+        they are over `max_size` bytes."""
+        return limit_decoded(self.gen_decoded_chunks(block), max_size)
+
+    def gen_decoded_chunks(self, block: bytes):
+        # the expanding transformations keep the chunks under
+        # `DECODED_CHUNK_SIZE`, the others decode the block at once
+        yield self.decode(block)
+
     def __rshift__(self, obj):
         left_transformations = []
         right_transformations = []
@@ -21,15 +63,85 @@ class Transformation:
 
 
 class Composition(Transformation):
-    def __init__(self, *transformations) -> None:
+    def __init__(self, *transformations, observer=None) -> None:
         self.transformations = transformations
+        # called with a `StageEvent` after every stage of every block
+        self.observer = observer
+        self._fused_transformations = None
 
-    def encode(self, block: bytes) -> bytes:
+    @property
+    def stateful(self) -> bool:  # type: ignore[override]
+        return any(t.stateful for t in self.transformations)
+
+    def reset(self):
         for t in self.transformations:
+            t.reset()
+
+    def with_observer(self, observer) -> "Composition":
+        """The same composition reporting to `observer` (e.g. a
+        `CompositionStats`). Observers live in the calling process, so
+        they see nothing of the blocks sent to `Packager` workers."""
+        return Composition(*self.transformations, observer=observer)
+
+    def encode(self, block: bytes) -> bytes:
+        if self.observer is not None:
+            return self._observe("encode", block)
+        for t in self.fused_transformations:
             block = t.encode(block)
         return block
 
     def decode(self, block: bytes) -> bytes:
-        for t in self.transformations[::-1]:
+        if self.observer is not None:
+            return self._observe("decode", block)
+        for t in self.fused_transformations[::-1]:
             block = t.decode(block)
         return block
+
+    def gen_decoded(self, block: bytes, max_size: int | None = None):
+        """Yields the decoded block in the chunks of the last stage.
+        Raises `ValueError` once a stage decodes to too much: over
+        `max_size` bytes for the last stage, a bit more for the others."""
+        if self.observer is not None:
+            return super().gen_decoded(block, max_size)
+        *inner_stages, last_stage = self.fused_transformations[::-1]
+        inner_max_size = None
+        if max_size is not None:
+            inner_max_size = max_size * INNER_STAGE_EXPANSION
+            inner_max_size += INNER_STAGE_ROOM
+        for t in inner_stages:
+            block = b"".join(t.gen_decoded(block, inner_max_size))
+        return last_stage.gen_decoded(block, max_size)
+
+    @property
+    def fused_transformations(self) -> tuple:
+        """`transformations` with the adjacent stages that have a fused
+        counterpart (e.g. `MTF() >> RLE()`) replaced by it. The observed
+        compositions run stage by stage, unfused."""
+        if self._fused_transformations is None:
+            # the fused stages are built of the other transformations,
+            # which import this module
+            from app.transformations.fused import fuse
+
+            self._fused_transformations = fuse(self.transformations)
+        return self._fused_transformations
+
+    def _observe(self, direction: str, block: bytes) -> bytes:
+        stages = list(enumerate(self.transformations))
+        if direction == "decode":
+            stages.reverse()
+        for stage, t in stages:
+            start = perf_counter()
+            transformed = getattr(t, direction)(block)
+            seconds = perf_counter() - start
+            self.observer(
+                StageEvent(
+                    direction,
+                    stage,
+                    type(t).__name__,
+                    seconds,
+                    len(block),
+                    len(transformed),
+                )
+            )
+            block = transformed
+        return block
@@ -2,27 +2,40 @@ import filecmp
 
 import pytest
 
+from app.bzip2 import bzip2_multi_table, bzip2_zero_runs
 from app.packager import Packager
 from app.transformations import (
     BWT,
     HFC,
     MTF,
     Id,
+    MultiTableHFC,
     RlePackBits,
     RlePairs,
     RleStreams,
+    RleZeroRuns,
 )
 
-from ..helpers import apply_encoding_decoding
+from ..helpers import KiB, apply_encoding_decoding
 
 
 @pytest.mark.parametrize(
     "Algorithm",
-    [BWT, HFC, MTF, RlePackBits, RlePairs, RleStreams, Id],
+    [
+        BWT,
+        HFC,
+        MultiTableHFC,
+        MTF,
+        RlePackBits,
+        RlePairs,
+        RleStreams,
+        RleZeroRuns,
+        Id,
+    ],
 )
 def test_singular_encoding(bin_file, block_size, Algorithm):
     algorithm = Algorithm()
-    packager = Packager(algorithm, block_size)
+    packager = Packager(algorithm, block_size, store_raw=False)
     in_path = bin_file.name
     de_path = apply_encoding_decoding(packager, in_path)
     assert filecmp.cmp(in_path, de_path, shallow=False)
@@ -31,11 +44,21 @@ def test_singular_encoding(bin_file, block_size, Algorithm):
 @pytest.mark.slow
 @pytest.mark.parametrize(
     "Algorithm",
-    [BWT, HFC, MTF, RlePackBits, RlePairs, RleStreams, Id],
+    [
+        BWT,
+        HFC,
+        MultiTableHFC,
+        MTF,
+        RlePackBits,
+        RlePairs,
+        RleStreams,
+        RleZeroRuns,
+        Id,
+    ],
 )
 def test_repetative_encoding(small_bin_file, block_size, Algorithm):
     repetative_algorithm = Algorithm() >> Algorithm() >> Algorithm()
-    packager = Packager(repetative_algorithm, block_size)
+    packager = Packager(repetative_algorithm, block_size, store_raw=False)
     in_path = small_bin_file.name
     de_path = apply_encoding_decoding(packager, in_path)
     assert filecmp.cmp(in_path, de_path, shallow=False)
@@ -43,7 +66,61 @@ def test_repetative_encoding(small_bin_file, block_size, Algorithm):
 
 def test_bzip2(small_bin_file, block_size):
     bzip2 = RlePackBits() >> BWT() >> MTF() >> RlePackBits() >> HFC()
-    packager = Packager(bzip2, block_size)
+    packager = Packager(bzip2, block_size, store_raw=False)
     in_path = small_bin_file.name
     de_path = apply_encoding_decoding(packager, in_path)
     assert filecmp.cmp(in_path, de_path, shallow=False)
+
+
+@pytest.mark.parametrize("bzip2", [bzip2_zero_runs, bzip2_multi_table])
+def test_bzip2_zero_runs(small_bin_file, block_size, bzip2):
+    packager = Packager(bzip2, block_size, store_raw=False)
+    in_path = small_bin_file.name
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+
+
+def test_bzip2_workers(bin_file):
+    bzip2 = RlePackBits() >> BWT() >> MTF() >> RlePackBits() >> HFC()
+    packager = Packager(bzip2, 15 * KiB, workers=4, store_raw=False)
+    in_path = bin_file.name
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+
+
+@pytest.mark.parametrize(
+    "Algorithm",
+    [
+        BWT,
+        HFC,
+        MultiTableHFC,
+        MTF,
+        RlePackBits,
+        RlePairs,
+        RleStreams,
+        RleZeroRuns,
+        Id,
+    ],
+)
+def test_buffer_protocol_input(small_bin_file, Algorithm):
+    algorithm = Algorithm()
+    with open(small_bin_file.name, "rb") as in_file:
+        block = in_file.read(15 * KiB)
+    encoded = algorithm.encode(block)
+    assert algorithm.encode(memoryview(block)) == encoded
+    assert algorithm.encode(bytearray(block)) == encoded
+    assert algorithm.decode(memoryview(encoded)) == block
+
+
+def test_bzip2_mmap(bin_file):
+    bzip2 = RlePackBits() >> BWT() >> MTF() >> RlePackBits() >> HFC()
+    in_path = bin_file.name
+    expected_en_path = in_path + ".en.expected"
+    Packager(bzip2, 15 * KiB, store_raw=False).apply_encoding(
+        in_path, expected_en_path
+    )
+
+    packager = Packager(bzip2, 15 * KiB, use_mmap=True, store_raw=False)
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+    assert filecmp.cmp(in_path + ".en", expected_en_path, shallow=False)
@@ -0,0 +1,124 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import aio, bzip2
+from app.packager import Packager
+from app.stream import Compressor
+from app.transformations import Id
+
+from ..helpers import KiB
+
+
+class Writer:
+    def __init__(self):
+        self.data = bytearray()
+        self.drained = 0
+
+    def write(self, data):
+        self.data.extend(data)
+
+    async def drain(self):
+        self.drained += 1
+
+
+def feed(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+async def serve(handler, requests):
+    # a loopback server running `handler(reader, writer)` on every
+    # connection, `requests` are sent concurrently, the responses returned
+    async def handle(reader, writer):
+        try:
+            await handler(reader, writer)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def request(data):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+        # sending and receiving at the same time, the server sends the
+        # response back before the request is over
+        async def send():
+            for pos in range(0, len(data), 10 * KiB):
+                writer.write(data[pos : pos + 10 * KiB])
+                await writer.drain()
+            writer.write_eof()
+
+        sending = asyncio.create_task(send())
+        response = await reader.read()
+        await sending
+        writer.close()
+        await writer.wait_closed()
+        return response
+
+    async with server:
+        return await asyncio.gather(*map(request, requests))
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_encode_loopback(concurrency):
+    block_size = 5 * KiB
+    rnd = random.Random(14)
+    requests = [rnd.randbytes(size) for size in (0, 123, 5 * KiB, 37 * KiB)]
+
+    async def handler(reader, writer):
+        await aio.encode(
+            reader, writer, Id(), block_size, concurrency=concurrency
+        )
+
+    responses = asyncio.run(serve(handler, requests))
+    for data, response in zip(requests, responses, strict=True):
+        compressor = Compressor(Id(), block_size)
+        assert response == compressor.compress(data) + compressor.flush()
+
+
+def test_bzip2_loopback():
+    rnd = random.Random(14)
+    requests = [rnd.randbytes(3 * KiB) * 5, b"abc" * 5000]
+    encoded = []
+    for data in requests:
+        compressor = bzip2.compressor(4 * KiB)
+        encoded.append(compressor.compress(data) + compressor.flush())
+
+    async def handler(reader, writer):
+        with ThreadPoolExecutor(2) as executor:
+            await bzip2.decode_stream(reader, writer, executor, concurrency=2)
+
+    assert asyncio.run(serve(handler, encoded)) == requests
+
+
+def test_decode_matches_packager(bin_file):
+    in_path = bin_file.name
+    en_path = in_path + ".en"
+    Packager(Id(), 15 * KiB, index=True).apply_encoding(in_path, en_path)
+    with open(in_path, "rb") as in_file, open(en_path, "rb") as en_file:
+        data, encoded = in_file.read(), en_file.read()
+
+    async def decode():
+        writer = Writer()
+        await aio.decode(feed(encoded), writer, Id())
+        return writer
+
+    writer = asyncio.run(decode())
+    assert writer.data == data
+    # the writer is drained after every block
+    assert writer.drained == -(-len(data) // (15 * KiB))
+
+
+def test_decode_truncated():
+    async def decode():
+        await aio.decode(feed(b"\0\0\0\x03ab"), Writer(), Id())
+
+    with pytest.raises(ValueError):
+        asyncio.run(decode())
@@ -0,0 +1,234 @@
+import io
+import os
+
+import pytest
+
+from app.archive import (
+    ARCHIVE_MAGIC,
+    DIRECTORY,
+    FILE,
+    SYMLINK,
+    ArchiveMember,
+    create,
+    extract,
+    extract_member,
+    main,
+    pack_index,
+    read_members,
+)
+from app.benchmark import make_corpus
+from app.packager import Packager
+from app.transformations import HFC, MTF, RlePackBits
+
+
+def make_tree(root):
+    os.makedirs(root / "tree" / "sub" / "deeper")
+    (root / "tree" / "text.txt").write_bytes(make_corpus("text", 50_000))
+    (root / "tree" / "empty").write_bytes(b"")
+    (root / "tree" / "sub" / "random").write_bytes(os.urandom(3000))
+    (root / "tree" / "sub" / "deeper" / "zeros").write_bytes(bytes(70_000))
+    os.symlink("../text.txt", root / "tree" / "sub" / "link")
+    os.chmod(root / "tree" / "empty", 0o600)
+    os.utime(root / "tree" / "text.txt", ns=(10**18, 10**18))
+    return root / "tree"
+
+
+def assert_same_tree(left, right):
+    for dir_path, dir_names, file_names in os.walk(left):
+        other_dir = os.path.join(right, os.path.relpath(dir_path, left))
+        assert sorted(os.listdir(other_dir)) == sorted(dir_names + file_names)
+        for name in file_names:
+            path, other = (
+                os.path.join(d, name) for d in (dir_path, other_dir)
+            )
+            if os.path.islink(path):
+                assert os.readlink(other) == os.readlink(path)
+                continue
+            with open(path, "rb") as f, open(other, "rb") as g:
+                assert f.read() == g.read()
+            st, other_st = os.stat(path), os.stat(other)
+            assert other_st.st_mode == st.st_mode
+            assert other_st.st_mtime_ns == st.st_mtime_ns
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_round_trip(tmp_path, workers):
+    tree = make_tree(tmp_path)
+    packager = Packager(MTF() >> RlePackBits() >> HFC(), 16 * 1024, workers)
+    archive = io.BytesIO()
+    members = create(archive, [tree], packager)
+    assert archive.getvalue().startswith(ARCHIVE_MAGIC)
+    assert read_members(archive) == members
+    assert [(m.name, m.kind) for m in members] == [
+        ("tree", DIRECTORY),
+        ("tree/sub", DIRECTORY),
+        ("tree/empty", FILE),
+        ("tree/text.txt", FILE),
+        ("tree/sub/deeper", DIRECTORY),
+        ("tree/sub/link", SYMLINK),
+        ("tree/sub/random", FILE),
+        ("tree/sub/deeper/zeros", FILE),
+    ]
+
+    extract(archive, tmp_path / "out", packager=packager)
+    assert_same_tree(tree, tmp_path / "out" / "tree")
+
+
+def test_stateful_round_trip(tmp_path):
+    tree = make_tree(tmp_path)
+    packager = Packager(MTF() >> HFC(reuse_tables=True), 8 * 1024)
+    archive = io.BytesIO()
+    create(archive, [tree], packager)
+    # a member decodes on its own
+    out = io.BytesIO()
+    extract_member(archive, "tree/sub/deeper/zeros", out, packager)
+    assert out.getvalue() == bytes(70_000)
+    extract(archive, tmp_path / "out", packager=packager)
+    assert_same_tree(tree, tmp_path / "out" / "tree")
+
+
+def test_extract_member(tmp_path):
+    tree = make_tree(tmp_path)
+    archive = io.BytesIO()
+    members = create(archive, [tree / "text.txt", tree / "sub"])
+    assert [m.name for m in members][:2] == ["text.txt", "sub"]
+
+    # only the blocks of the member are read
+    text = next(m for m in members if m.name == "text.txt")
+    data = bytearray(archive.getvalue())
+    for m in members:
+        if m is not text:
+            data[m.offset : m.offset + m.encoded_size] = bytes(m.encoded_size)
+    out = io.BytesIO()
+    assert extract_member(io.BytesIO(data), "text.txt", out) == text.size
+    assert out.getvalue() == (tree / "text.txt").read_bytes()
+
+    with pytest.raises(KeyError):
+        extract_member(archive, "missing", out)
+    with pytest.raises(ValueError):
+        extract_member(archive, "sub", out)
+
+    extract(archive, tmp_path / "out", names=["sub/random"])
+    assert os.listdir(tmp_path / "out") == ["sub"]
+    assert (tmp_path / "out" / "sub" / "random").read_bytes() == (
+        tree / "sub" / "random"
+    ).read_bytes()
+
+
+@pytest.mark.parametrize(
+    "members",
+    [
+        [ArchiveMember("../escape", DIRECTORY, 0o755, 0)],
+        [ArchiveMember("/absolute", DIRECTORY, 0o755, 0)],
+        [
+            ArchiveMember("link", SYMLINK, 0o777, 0, link=".."),
+            ArchiveMember("link/escape", DIRECTORY, 0o755, 0),
+        ],
+    ],
+)
+def test_unsafe_names(tmp_path, members):
+    archive = io.BytesIO(ARCHIVE_MAGIC + pack_index(members, 4))
+    os.mkdir(tmp_path / "out")
+    with pytest.raises(ValueError):
+        extract(archive, tmp_path / "out")
+    assert not os.path.exists(tmp_path / "escape")
+
+
+def test_no_writing_through_symlinks(tmp_path):
+    victim = tmp_path / "victim"
+    victim.write_bytes(b"safe")
+    (tmp_path / "evil").write_bytes(b"PWNED")
+    archive = io.BytesIO()
+    members = create(archive, [tmp_path / "evil"])
+    index_offset = members[0].offset + members[0].encoded_size
+
+    # the same name twice: a file, then a symlink to outside
+    link = ArchiveMember("evil", SYMLINK, 0o777, 0, link=str(victim))
+    archive.truncate(index_offset)
+    archive.seek(index_offset)
+    archive.write(pack_index([*members, link], index_offset))
+    os.mkdir(tmp_path / "out")
+    with pytest.raises(ValueError):
+        extract(archive, tmp_path / "out")
+
+    # a symlink already in the destination is replaced, not followed
+    os.symlink(victim, tmp_path / "out" / "evil")
+    archive.truncate(index_offset)
+    archive.seek(index_offset)
+    archive.write(pack_index(members, index_offset))
+    extract(archive, tmp_path / "out")
+    assert not os.path.islink(tmp_path / "out" / "evil")
+    assert (tmp_path / "out" / "evil").read_bytes() == b"PWNED"
+    assert victim.read_bytes() == b"safe"
+
+
+def test_colliding_names(tmp_path):
+    for d in ("a", "b"):
+        os.mkdir(tmp_path / d)
+        (tmp_path / d / "x").write_bytes(d.encode() * 1000)
+    with pytest.raises(ValueError):
+        create(io.BytesIO(), [tmp_path / "a" / "x", tmp_path / "b" / "x"])
+
+    archive = io.BytesIO()
+    create(archive, [tmp_path / "a" / "x", tmp_path / "b"])
+    extract(archive, tmp_path / "out")
+    for name, content in (("x", b"a"), ("b/x", b"b")):
+        assert (tmp_path / "out" / name).read_bytes() == content * 1000
+
+
+def test_not_an_archive():
+    with pytest.raises(ValueError):
+        read_members(io.BytesIO(b"BZh9"))
+    with pytest.raises(ValueError):
+        read_members(io.BytesIO(ARCHIVE_MAGIC + b"\0" * 8))
+
+
+@pytest.mark.parametrize("kind", [3, 0x7F, -1])
+def test_invalid_kind(kind):
+    index = bytearray(pack_index([ArchiveMember("x", DIRECTORY, 0, 0)], 4))
+    index[0] = kind & 0xFF
+    with pytest.raises(ValueError):
+        read_members(io.BytesIO(ARCHIVE_MAGIC + index))
+
+
+@pytest.mark.parametrize(
+    "member, index_offset",
+    [
+        (ArchiveMember("x", DIRECTORY, 0, 0), 1000),
+        (ArchiveMember("x", DIRECTORY, 0, 0), 0),
+        (ArchiveMember("x", FILE, 0o644, 0, 10, 4, 10), 4),
+        (ArchiveMember("x", FILE, 0o644, 0, 10, 2, 0), 4),
+        (ArchiveMember("x", FILE, -1, 0), 4),
+    ],
+)
+def test_out_of_place(member, index_offset):
+    archive = io.BytesIO(ARCHIVE_MAGIC + pack_index([member], index_offset))
+    with pytest.raises(ValueError):
+        read_members(archive)
+
+
+def test_cli(tmp_path, capsys):
+    tree = make_tree(tmp_path)
+    archive = str(tmp_path / "tree.sbza")
+    assert main(["-j", "2", "create", "-b", "8k", archive, str(tree)]) == 0
+    assert main(["list", archive]) == 0
+    listed = capsys.readouterr().out
+    assert "tree/sub/link -> ../text.txt" in listed
+    out = str(tmp_path / "out")
+    assert main(["extract", "-C", out, archive, "tree/empty"]) == 0
+    assert os.listdir(os.path.join(out, "tree")) == ["empty"]
+    assert main(["extract", "-C", out, archive]) == 0
+    assert_same_tree(tree, os.path.join(out, "tree"))
+
+
+def test_cli_errors(tmp_path, capsys):
+    archive = tmp_path / "bad.sbza"
+    archive.write_bytes(b"BZh9")
+    assert main(["list", str(archive)]) == 2
+    assert main(["extract", str(tmp_path / "missing.sbza")]) == 2
+    tree = make_tree(tmp_path)
+    assert main(["create", str(archive), str(tree)]) == 0
+    assert main(["extract", "-C", str(tmp_path), str(archive), "nope"]) == 1
+    errors = capsys.readouterr().err.splitlines()
+    assert len(errors) == 3
+    assert errors[0] == f"python -m app.archive: {archive}: Not an archive"
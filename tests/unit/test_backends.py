@@ -0,0 +1,129 @@
+import random
+from array import array
+
+import pytest
+
+from app.benchmark import CORPORA, make_corpus
+from app.bzip2 import bzip2
+from app.transformations import (
+    BWT,
+    HFC,
+    MTF,
+    ZERO_RUNS_ALPHABET_SIZE,
+    MultiTableHFC,
+    RlePackBits,
+    RlePairs,
+    RleStreams,
+    RleZeroRuns,
+)
+from app.transformations.backends import (
+    BACKEND_ENV_VAR,
+    available_backends,
+    get_backend,
+    load_backend,
+    set_backend,
+    use_backend,
+)
+from app.transformations.hfc.bits import BitWriter
+from app.transformations.hfc.hf_tree import HuffmanCanonicalTree
+
+pytest.importorskip("numpy")
+
+BLOCKS = [
+    b"",
+    b"a",
+    b"ab",
+    b"banana",
+    b"abab" * 100,  # periodic
+    bytes(3000),
+    *(make_corpus(name, 20_000) for name in CORPORA),
+]
+
+TRANSFORMATIONS = [
+    BWT(),
+    MTF(),
+    RlePackBits(),
+    RlePairs(),
+    RleStreams(),
+    HFC(),
+    MultiTableHFC(),
+    RleZeroRuns() >> MultiTableHFC(ZERO_RUNS_ALPHABET_SIZE),
+    bzip2,
+]
+
+
+def encode_with(backend: str, transformation, block: bytes) -> bytes:
+    with use_backend(backend):
+        return transformation.encode(block)
+
+
+@pytest.mark.parametrize(
+    "transformation", TRANSFORMATIONS, ids=lambda t: type(t).__name__
+)
+@pytest.mark.parametrize("block", BLOCKS, ids=lambda block: str(len(block)))
+def test_identical_encoding(transformation, block):
+    encoded = encode_with("python", transformation, block)
+    assert encode_with("numpy", transformation, block) == encoded
+    for backend in ("python", "numpy"):
+        with use_backend(backend):
+            assert transformation.decode(encoded) == block
+
+
+@pytest.mark.parametrize("block", BLOCKS, ids=lambda block: str(len(block)))
+def test_identical_kernels(block):
+    python, numpy = load_backend("python"), load_backend("numpy")
+    assert numpy.bwt_encode(block) == python.bwt_encode(block)
+    origin_ptr, last_column = python.bwt_encode(block)
+    assert numpy.bwt_decode(last_column, origin_ptr) == block
+    assert list(numpy.runs(block)) == list(python.runs(block))
+    for min_length in (1, 2, 3):
+        assert list(numpy.run_spans(block, min_length)) == list(
+            python.run_spans(block, min_length)
+        )
+
+
+def test_identical_grouped_codes():
+    rnd = random.Random(19)
+    alphabet_size = 300
+    symbols = array("H", rnd.choices(range(alphabet_size), k=1234))
+    tables_codes = [
+        HuffmanCanonicalTree(
+            HuffmanCanonicalTree.lengths_from_block(
+                rnd.choices(range(alphabet_size), k=500),
+                alphabet_size=alphabet_size,
+            )
+        ).get_codes()
+        for _ in range(3)
+    ]
+    selectors = rnd.choices(range(3), k=-(-len(symbols) // 50))
+    writers = []
+    for backend in ("python", "numpy"):
+        writer = BitWriter()
+        writer.write(0b101, 3)  # unaligned
+        load_backend(backend).write_grouped_codes(
+            writer, symbols, tables_codes, selectors, 50
+        )
+        writers.append((writer.to_bytes(), len(writer)))
+    assert writers[0] == writers[1]
+
+
+def test_selection(monkeypatch):
+    assert available_backends() == ["python", "numpy"]
+    monkeypatch.delenv(BACKEND_ENV_VAR, raising=False)
+    set_backend(None)
+    try:
+        with use_backend("python") as backend:
+            assert get_backend() is backend
+            assert backend.NAME == "python"
+        assert get_backend().NAME == "numpy"  # the default one
+
+        monkeypatch.setenv(BACKEND_ENV_VAR, "python")
+        set_backend(None)
+        assert get_backend().NAME == "python"
+        set_backend("numpy")
+        assert get_backend().NAME == "numpy"
+        with pytest.raises(ValueError):
+            set_backend("fortran")
+    finally:
+        monkeypatch.undo()
+        set_backend(None)
@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+from app.benchmark import (
+    CORPORA,
+    TRANSFORMATIONS,
+    KiB,
+    benchmark,
+    main,
+    make_corpus,
+)
+
+
+@pytest.mark.parametrize("corpus_name", CORPORA)
+def test_make_corpus_deterministic(corpus_name):
+    corpus = make_corpus(corpus_name, 5000)
+    assert len(corpus) == 5000
+    assert corpus == make_corpus(corpus_name, 5000)
+    assert corpus != make_corpus(corpus_name, 5000, seed=1)
+
+
+@pytest.mark.parametrize("transformation_name", TRANSFORMATIONS)
+def test_benchmark(transformation_name):
+    data = make_corpus("text", 3000)
+    result = benchmark(transformation_name, "text", data, block_size=1000)
+    assert result.size == 3000
+    assert result.ratio == round(result.encoded_size / 3000, 4)
+    assert result.encode_mb_s > 0 and result.decode_mb_s > 0
+    assert result.encode_peak_kib is None
+
+
+def test_benchmark_memory():
+    data = make_corpus("text", 64 * KiB)
+    small = benchmark("BWT", "text", data, block_size=8 * KiB, memory=True)
+    large = benchmark("BWT", "text", data, block_size=64 * KiB, memory=True)
+    assert 0 < small.encode_peak_kib < large.encode_peak_kib
+
+
+def test_main_json_lines():
+    out = io.StringIO()
+    main(
+        [
+            "--size=2000",
+            "--block-sizes=500,2000",
+            "--transformations=MTF,bzip2",
+            "--corpora=runs",
+        ],
+        out=out,
+    )
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(r["block_size"], r["transformation"]) for r in results] == [
+        (500, "MTF"),
+        (500, "bzip2"),
+        (2000, "MTF"),
+        (2000, "bzip2"),
+    ]
@@ -1,6 +1,8 @@
+import random
+
 import pytest
 
-from app.transformations.hfc.bits import BitArray
+from app.transformations.hfc.bits import BitArray, BitReader, BitWriter
 
 
 @pytest.mark.parametrize(
@@ -103,3 +105,66 @@ def test_append_byte(byte_size, byte_strs):
 
     assert "".join(byte_strs) == "".join(map(str, barr))
     assert bytes_ == barr.to_byte_array()
+
+
+@pytest.mark.parametrize(
+    "codes_str",
+    [
+        [],
+        ["1"],
+        ["0", "1", "01", "110"],
+        ["10010111", "0110", "1" * 70, "0" * 33, "101"],
+        ["".join(random.choices("01", k=random.randint(1, 40)))] * 50,
+    ],
+)
+def test_bit_writer_reader(codes_str):
+    bits_str = "".join(codes_str)
+
+    writer = BitWriter()
+    for code_str in codes_str:
+        writer.write(int(code_str, 2), len(code_str))
+    assert len(writer) == len(bits_str)
+
+    # the same bytes as `BitArray` would produce
+    barr = BitArray()
+    barr.extend_bit(list(map(int, bits_str)))
+    encoded = writer.to_bytes()
+    assert list(encoded) == barr.to_byte_array()
+    assert writer.tail_length == -len(bits_str) % 8
+
+    reader = BitReader(encoded, drop_last=writer.tail_length)
+    for code_str in codes_str:
+        assert reader.read(len(code_str)) == int(code_str, 2)
+    assert reader.bits_left == 0
+    with pytest.raises(EOFError):
+        reader.read(1)
+
+
+def test_read_prefix_codes():
+    table_bits = 3
+    # "a": 0, "b": 10, "c": 110, "d": 111
+    table = [(97, 1)] * 4 + [(98, 2)] * 2 + [(99, 3), (100, 3)]
+    writer = BitWriter()
+    for code, length in [(0, 1), (0, 1), (6, 3), (7, 3), (0, 1), (2, 2)]:
+        writer.write(code, length)
+    reader = BitReader(writer.to_bytes(), drop_last=writer.tail_length)
+    assert reader.read_prefix_codes(table, table_bits) == b"aacdab"
+
+
+def test_bit_reader_feed():
+    codes = [(random.getrandbits(n), n) for n in range(1, 30)] * 20
+    writer = BitWriter()
+    for code, length in codes:
+        writer.write(code, length)
+    encoded = writer.to_bytes()
+
+    reader = BitReader(b"")
+    pos = 0
+    for code, length in codes:
+        while reader.bits_left < length:
+            # short chunks: the accumulator runs into the padding
+            reader.feed(encoded[pos : pos + 3])
+            pos += 3
+            reader.peek(64)
+        assert reader.read(length) == code
+    assert len(reader._data) < 64
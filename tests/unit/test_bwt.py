@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from app.transformations import BWT
+from app.transformations.bwt.lf_mapping import build_lf_mapping
+from app.transformations.bwt.rotations import (
+    sort_rotations,
+    sort_rotations_compact,
+)
+
+
+def naive_sort_rotations(block: bytes) -> list[int]:
+    return sorted(range(len(block)), key=lambda i: block[i:] + block[:i])
+
+
+@pytest.mark.parametrize(
+    "block",
+    [
+        b"",
+        b"a",
+        b"banana",
+        b"abracadabra",
+        b"aaaaaaaa",
+        b"abababab",
+        b"abcabcabcab",
+        b"\x00\xff" * 17,
+        random.randbytes(97),
+        bytes(random.choice(b"ab") for _ in range(300)),
+    ],
+)
+@pytest.mark.parametrize("sort", [sort_rotations, sort_rotations_compact])
+def test_sort_rotations(block, sort):
+    assert list(sort(block)) == naive_sort_rotations(block)
+
+
+@pytest.mark.parametrize(
+    "block",
+    [
+        b"the quick brown fox jumps over the lazy dog " * 2000,
+        random.randbytes(70 * 1024),
+        bytes(random.choice(b"ab") for _ in range(70 * 1024)),
+    ],
+)
+def test_sort_rotations_compact_large(block):
+    assert list(sort_rotations_compact(block)) == sort_rotations(block)
+
+
+@pytest.mark.parametrize(
+    "last_column",
+    [b"", b"a", b"ard$rcaaaabb", b"\x00" * 10, random.randbytes(1000)],
+)
+def test_build_lf_mapping(last_column):
+    expected = sorted(range(len(last_column)), key=lambda i: last_column[i])
+    assert list(build_lf_mapping(last_column)) == expected
+
+
+@pytest.mark.parametrize(
+    "block",
+    [
+        b"banana",
+        b"zzzzzzzzzzzzzzzz",
+        b"the quick brown fox jumps over the lazy dog " * 50,
+        random.randbytes(1000),
+    ],
+)
+def test_encode_decode(block):
+    bwt = BWT()
+    assert bwt.decode(bwt.encode(block)) == block
@@ -0,0 +1,115 @@
+import bz2
+import random
+
+import pytest
+
+from app import bz2_format
+from app.bz2_format import block_crc, rle1_decode, rle1_encode
+
+from ..helpers import KiB
+
+rnd = random.Random(18)
+
+BLOCKS = (
+    b"",
+    b"a",
+    b"banana" * 100,
+    bytes(5 * KiB),
+    rnd.randbytes(3 * KiB),
+    b"ab" * 300
+    + b"c" * 1000
+    + b"d" * 4
+    + b"e" * 255
+    + b"f" * 256
+    + b"g" * 259,
+    bytes(rnd.choices(b"abc\0\n", k=40 * KiB)),
+)
+
+
+@pytest.mark.parametrize("block", BLOCKS)
+def test_bz2_compatible(block):
+    compressed = bz2_format.compress(block, level=1)
+    assert bz2.decompress(compressed) == block
+    assert bz2_format.decompress(compressed) == block
+    assert bz2_format.decompress(bz2.compress(block, 1)) == block
+
+
+def test_multiple_blocks_and_streams():
+    # 100 kB blocks at level 1
+    data = bytes(rnd.choices(b"abcdefgh \n", k=250 * KiB))
+    compressed = bz2_format.compress(data, level=1, workers=2)
+    assert bz2.decompress(compressed) == data
+    assert bz2_format.decompress(compressed, workers=2) == data
+    assert bz2_format.decompress(compressed + bz2.compress(b"tail")) == (
+        data + b"tail"
+    )
+
+
+def test_block_limit():
+    # RLE1 makes runs shorter, so a block holds more than the limit
+    data = b"a" * 150_000 + bytes(rnd.choices(b"xyz", k=120_000))
+    compressed = bz2_format.compress(data, level=1)
+    assert bz2.decompress(compressed) == data
+
+
+def test_rle1():
+    block = b"x" + b"a" * 300 + b"bbb" + b"c" * 4
+    encoded, consumed = rle1_encode(block, len(block))
+    assert consumed == len(block)
+    assert encoded == b"x" + b"aaaa\xfb" + b"aaaa\x29bbb" + b"cccc\0"
+    assert rle1_decode(encoded) == block
+
+    # the prefix is cut so that it encodes in `max_size` bytes
+    encoded, consumed = rle1_encode(block, 8)
+    assert (encoded, consumed) == (b"xaaaa\xfb", 256)
+
+
+def test_block_crc():
+    assert block_crc(b"") == 0
+    # the check value of the CRC-32/BZIP2 catalogue entry
+    assert block_crc(b"123456789") == 0xFC891918
+
+
+def test_corrupted():
+    compressed = bz2_format.compress(b"hello world" * 1000)
+    with pytest.raises(ValueError):
+        bz2_format.decompress(compressed[:-10])
+    with pytest.raises(ValueError):
+        bz2_format.decompress(b"not bz2")
+    corrupted = bytearray(compressed)
+    corrupted[len(corrupted) // 2] ^= 4
+    with pytest.raises(ValueError):
+        bz2_format.decompress(bytes(corrupted))
+    with pytest.raises(ValueError):
+        bz2_format.compress(b"", level=10)
+
+
+class ChunkedSource:
+    # a file object recording how much of `data` has been read
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+
+    def read(self, size=-1) -> bytes:
+        assert size > 0  # never the whole input
+        chunk = self.data[self.pos : self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def test_decompress_incrementally():
+    data = rnd.randbytes(450 * KiB)
+    compressed = bz2.compress(data, 1)
+    in_file = ChunkedSource(compressed)
+    read_sizes = []
+
+    class Sink:
+        def write(self, block):
+            read_sizes.append(in_file.pos)
+
+    sizes = bz2_format.decompress_file(in_file, Sink())
+    assert sizes == (len(compressed), len(data))
+    # a block is read ahead, not the whole input
+    assert read_sizes[0] <= 4 + bz2_format.max_packed_block_size(1)
+    assert read_sizes[0] < len(compressed)
+    assert read_sizes[-1] == len(compressed)
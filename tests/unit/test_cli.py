@@ -0,0 +1,116 @@
+import bz2
+import os
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.cli import main
+from app.options import parse_size
+
+from ..helpers import KiB
+
+ROOT_DIR = Path(__file__).parents[2]
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.bin"
+    rnd = random.Random(17)
+    path.write_bytes(rnd.randbytes(20 * KiB) + b"abcd" * 5 * KiB)
+    return path
+
+
+def run_cli(*args, data=b""):
+    return subprocess.run(
+        [sys.executable, "-m", "app", *args],
+        input=data,
+        capture_output=True,
+        cwd=ROOT_DIR,
+        check=False,
+    )
+
+
+def test_parse_size():
+    assert parse_size("123") == 123
+    assert parse_size("900k") == 900 * KiB
+    assert parse_size("1M") == 1 << 20
+
+
+def test_compress_decompress(data_file):
+    data = data_file.read_bytes()
+    bz_path = Path(str(data_file) + ".bz")
+
+    assert main(["-b", "8k", "-j", "2", str(data_file)]) == 0
+    assert not data_file.exists()
+    assert bz_path.exists()
+
+    assert main(["-t", str(bz_path)]) == 0
+    assert main(["-d", "-k", str(bz_path)]) == 0
+    assert bz_path.exists()
+    assert data_file.read_bytes() == data
+
+    # the existing files are overwritten only with `--force`
+    assert main(["-d", str(bz_path)]) == 1
+    assert main(["-d", "-f", str(bz_path)]) == 0
+    assert not bz_path.exists()
+    assert data_file.read_bytes() == data
+
+
+def test_test_corrupted(data_file, capsys):
+    assert main(["-k", str(data_file)]) == 0
+    bz_path = Path(str(data_file) + ".bz")
+    bz_path.write_bytes(bz_path.read_bytes()[:100])
+    assert main(["-t", str(bz_path)]) == 2
+    assert str(bz_path) in capsys.readouterr().err
+    assert main(["-t", str(data_file) + ".missing"]) == 1
+
+
+def test_stdin_stdout(data_file):
+    data = data_file.read_bytes()
+    compressed = run_cli("-b", "8k", "-j", "2", data=data)
+    assert compressed.returncode == 0
+    assert len(compressed.stdout) < len(data)
+
+    decompressed = run_cli("-d", "-v", "-", data=compressed.stdout)
+    assert decompressed.returncode == 0
+    assert decompressed.stdout == data
+    assert b"MB/s" in decompressed.stderr
+
+
+def test_stdout(data_file):
+    compressed = run_cli("-c", "-k", str(data_file))
+    assert compressed.returncode == 0
+    assert os.path.exists(data_file)
+    decompressed = run_cli("-d", data=compressed.stdout)
+    assert decompressed.stdout == data_file.read_bytes()
+
+
+def test_bz2_format(data_file):
+    data = data_file.read_bytes()
+    assert main(["--format", "bz2", "-1", "-k", str(data_file)]) == 0
+    bz2_path = Path(str(data_file) + ".bz2")
+    assert bz2.decompress(bz2_path.read_bytes()) == data
+
+    # the format is recognised on decompression
+    data_file.unlink()
+    assert main(["-d", str(bz2_path)]) == 0
+    assert data_file.read_bytes() == data
+    decompressed = run_cli("-d", data=bz2.compress(data))
+    assert decompressed.stdout == data
+
+
+def test_pipeline(data_file, capsys):
+    data = data_file.read_bytes()
+    assert main(["--pipeline", "2", "-b", "8k", "-v", str(data_file)]) == 0
+    # the throughput of every stage
+    err = capsys.readouterr().err
+    assert all(s in err for s in ("0:read", "1:transform", "2:write"))
+
+    bz_path = Path(str(data_file) + ".bz")
+    assert main(["-d", "--pipeline", "3", str(bz_path)]) == 0
+    assert data_file.read_bytes() == data
+    with pytest.raises(SystemExit):
+        main(["--pipeline", "x", str(data_file)])
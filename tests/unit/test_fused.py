@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from app.benchmark import CORPORA, make_corpus
+from app.bzip2 import bzip2, bzip2_multi_table
+from app.transformations import (
+    BWT,
+    HFC,
+    MTF,
+    RLE,
+    CompositionStats,
+    RlePackBits,
+    RleZeroRuns,
+)
+from app.transformations.backends import available_backends, use_backend
+from app.transformations.fused import MtfRlePackBits, MtfRleZeroRuns
+
+rnd = random.Random(20)
+
+BLOCKS = [
+    b"",
+    b"\0",
+    b"\0" * 1000,  # a run of zero ranks from the very first byte
+    b"a",
+    b"ab" * 200,  # a run of equal non-zero ranks
+    b"\0" * 300 + b"x" * 300 + b"\0\0y",
+    bytes(rnd.choices(b"ab", k=5000)),
+    *(BWT().encode(make_corpus(name, 20_000)) for name in CORPORA),
+]
+
+FUSIONS = [
+    (MtfRlePackBits(), MTF() >> RlePackBits()),
+    (MtfRleZeroRuns(), MTF() >> RleZeroRuns()),
+]
+
+
+@pytest.mark.parametrize("backend", available_backends())
+@pytest.mark.parametrize(
+    "fused, stages", FUSIONS, ids=lambda t: type(t).__name__
+)
+@pytest.mark.parametrize("block", BLOCKS, ids=lambda block: str(len(block)))
+def test_identical_to_stages(backend, fused, stages, block):
+    with use_backend(backend):
+        encoded = block
+        for t in stages.transformations:
+            encoded = t.encode(encoded)
+        assert fused.encode(block) == encoded
+        assert fused.decode(encoded) == block
+
+
+def test_substitution():
+    assert [type(t) for t in bzip2.fused_transformations] == [
+        RLE,
+        BWT,
+        MtfRlePackBits,
+        HFC,
+    ]
+    assert MtfRleZeroRuns in map(type, bzip2_multi_table.fused_transformations)
+    # the stages themselves are left as they are
+    assert [type(t) for t in bzip2.transformations] == [
+        RLE,
+        BWT,
+        MTF,
+        RLE,
+        HFC,
+    ]
+    assert len((RLE() >> MTF()).fused_transformations) == 2
+
+
+def test_observed_unfused():
+    block = make_corpus("text", 10_000)
+    stats = CompositionStats()
+    observed = bzip2.with_observer(stats)
+    assert observed.encode(block) == bzip2.encode(block)
+    assert [name for _, _, name in stats.stages] == [
+        "RlePackBits",
+        "BWT",
+        "MTF",
+        "RlePackBits",
+        "HFC",
+    ]
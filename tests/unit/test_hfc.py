@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from app.transformations import HFC
+from app.transformations.hfc.hf_tree import (
+    MAX_CODE_LENGTH,
+    HuffmanCanonicalTree,
+    cached_tree,
+)
+from app.transformations.hfc.hfc import _decode_with_table, _decode_with_trie
+
+
+def gen_skewed_bytes(size):
+    # fibonacci-like frequencies make the deepest Huffman trees
+    weights = [1.6**i for i in range(40)]
+    return bytes(random.choices(range(40), weights, k=size))
+
+
+@pytest.mark.parametrize(
+    "block",
+    [b"", b"a", bytes(1000), random.randbytes(5000), gen_skewed_bytes(5000)],
+)
+def test_lengths_are_limited(block):
+    lengths = HuffmanCanonicalTree.lengths_from_block(block)
+    assert max(lengths) <= MAX_CODE_LENGTH
+    # the code is complete: the Kraft sum is exactly 1
+    assert sum(2 ** (MAX_CODE_LENGTH - length) for length in lengths) == (
+        2**MAX_CODE_LENGTH
+    )
+
+
+@pytest.mark.parametrize(
+    "block",
+    [b"a", b"abracadabra", random.randbytes(5000), gen_skewed_bytes(5000)],
+)
+def test_decode_with_table(block):
+    encoded = HFC().encode(block)
+    tail_length = encoded[-1]
+    tree_lengths_size = int.from_bytes(encoded[:4], byteorder="big")
+    encoded_data = encoded[4 + tree_lengths_size : -1]
+
+    h_tree = HuffmanCanonicalTree(
+        HuffmanCanonicalTree.lengths_from_block(block)
+    )
+    decoded = _decode_with_table(
+        h_tree, encoded_data, tail_length, bytearray()
+    )
+    assert decoded == _decode_with_trie(
+        h_tree, encoded_data, tail_length, bytearray()
+    )
+    assert decoded == block
+
+
+def test_reuse_tables():
+    rnd = random.Random(21)
+    blocks = [gen_skewed_bytes(5000) for _ in range(3)]
+    blocks.append(rnd.randbytes(5000))  # new statistics, a new table
+    encoder, decoder = HFC(reuse_tables=True), HFC(reuse_tables=True)
+    encoded = [encoder.encode(block) for block in blocks]
+    assert [block[:4] == bytes(4) for block in encoded] == [
+        False,
+        True,
+        True,
+        False,
+    ]
+    assert len(encoded[1]) < len(HFC().encode(blocks[1]))
+    assert [decoder.decode(block) for block in encoded] == blocks
+
+    # without the previous blocks
+    with pytest.raises(ValueError):
+        HFC(reuse_tables=True).decode(encoded[1])
+    decoder.reset()
+    with pytest.raises(ValueError):
+        decoder.decode(encoded[1])
+    encoder.reset()
+    assert encoder.encode(blocks[1]) == HFC().encode(blocks[1])
+
+
+def test_cached_tree():
+    lengths = HuffmanCanonicalTree.lengths_from_block(b"abracadabra")
+    assert cached_tree(lengths) is cached_tree(list(lengths))
+    assert cached_tree(lengths).get_codes() == (
+        HuffmanCanonicalTree(lengths).get_codes()
+    )
@@ -0,0 +1,51 @@
+from app.transformations import MTF, CompositionStats, Id, RlePairs
+
+
+def test_observer_events():
+    events = []
+    composition = (MTF() >> RlePairs() >> Id()).with_observer(events.append)
+    block = b"aaaaabbbbbbbbcc"
+    encoded = composition.encode(block)
+    assert [(e.direction, e.stage, e.name) for e in events] == [
+        ("encode", 0, "MTF"),
+        ("encode", 1, "RlePairs"),
+        ("encode", 2, "Id"),
+    ]
+    assert events[0].in_size == len(block)
+    assert events[-1].out_size == len(encoded)
+    assert all(
+        e.in_size == p.out_size
+        for p, e in zip(events, events[1:], strict=False)
+    )
+
+    events.clear()
+    assert composition.decode(encoded) == block
+    assert [(e.direction, e.stage) for e in events] == [
+        ("decode", 2),
+        ("decode", 1),
+        ("decode", 0),
+    ]
+
+
+def test_composition_stats():
+    stats = CompositionStats(keep_blocks=True)
+    composition = (MTF() >> RlePairs()).with_observer(stats)
+    blocks = [b"abc" * 10, b"x" * 100, b"yz"]
+    for block in blocks:
+        assert composition.decode(composition.encode(block)) == block
+
+    mtf_stats = stats.stages["encode", 0, "MTF"]
+    assert mtf_stats.calls == 3
+    assert mtf_stats.in_size == sum(map(len, blocks))
+    assert stats.stages["decode", 0, "MTF"].out_size == mtf_stats.in_size
+    assert len(stats.blocks) == 6
+    assert all(len(block_events) == 2 for block_events in stats.blocks)
+    assert "1:RlePairs" in stats.report()
+
+
+def test_no_observer():
+    composition = MTF() >> RlePairs()
+    assert composition.observer is None
+    observed = composition.with_observer(print)
+    assert observed.transformations == composition.transformations
+    assert composition.observer is None
@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from app.transformations import BWT, MTF
+
+BYTE_CAPACITY = 256
+
+
+def naive_mtf_encode(block: bytes) -> bytes:
+    dictionary = list(range(BYTE_CAPACITY))
+    encoded = bytearray()
+    for byte in block:
+        index = dictionary.index(byte)
+        encoded.append(index)
+        dictionary.insert(0, dictionary.pop(index))
+    return bytes(encoded)
+
+
+@pytest.mark.parametrize(
+    "block",
+    [
+        b"",
+        b"\x00",
+        b"\x00\x00\x01\x01\x00",
+        b"coconut",
+        b"\xff" * 100,
+        random.randbytes(2000),
+        BWT().encode(b"the quick brown fox jumps over the lazy dog " * 30),
+    ],
+)
+def test_mtf(block):
+    mtf = MTF()
+    encoded = mtf.encode(block)
+    assert encoded == naive_mtf_encode(block)
+    assert mtf.decode(encoded) == block
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from app.transformations import (
+    BWT,
+    MTF,
+    ZERO_RUNS_ALPHABET_SIZE,
+    MultiTableHFC,
+    RleZeroRuns,
+)
+from app.transformations.hfc.hf_tree import MAX_CODE_LENGTH
+from app.transformations.hfc.multi_table import (
+    GROUP_SIZE,
+    SYMBOLS_COUNT_SIZE,
+    TABLES_COUNT_SIZE,
+    TABLES_ENCODER,
+    TABLES_HEADER_SIZE,
+    _initial_lengths,
+    _select_tables,
+)
+
+
+def test_initial_lengths():
+    frequencies = [10, 10, 0, 10, 10, 10]
+    tables = _initial_lengths(frequencies, 3)
+    assert len(tables) == 3
+    # every symbol is favoured by exactly one table
+    for symbol in range(len(frequencies)):
+        assert sum(lengths[symbol] == 0 for lengths in tables) == 1
+
+
+def test_select_tables():
+    tables = [[1, 9], [9, 1]]
+    symbols = bytes([0] * GROUP_SIZE + [1] * GROUP_SIZE + [0, 1, 1])
+    assert _select_tables(symbols, tables) == [0, 1, 1]
+
+
+@pytest.mark.parametrize("tables", [None, 2, 6])
+@pytest.mark.parametrize("iterations", [1, 4])
+@pytest.mark.parametrize(
+    "block",
+    [
+        b"",
+        b"a",
+        random.randbytes(3000),
+        bytes(random.choice([0, 0, 0, 1, 2, 3, 200]) for _ in range(5000)),
+    ],
+)
+def test_multi_table_hfc(block, tables, iterations):
+    hfc = MultiTableHFC(tables=tables, iterations=iterations)
+    assert hfc.decode(hfc.encode(block)) == block
+
+
+def test_multi_table_hfc_wide_alphabet():
+    text = b"the quick brown fox jumps over the lazy dog " * 200
+    block = (BWT() >> MTF() >> RleZeroRuns()).encode(text)
+    hfc = MultiTableHFC(ZERO_RUNS_ALPHABET_SIZE)
+    assert hfc.decode(hfc.encode(block)) == block
+
+
+@pytest.mark.parametrize("tables", [1, 7])
+def test_multi_table_hfc_tables_count(tables):
+    with pytest.raises(ValueError):
+        MultiTableHFC(tables=tables)
+
+
+def test_multi_table_hfc_invalid_lengths():
+    tables_lengths = TABLES_ENCODER.encode(bytes([MAX_CODE_LENGTH + 1]) * 256)
+    block = b"".join(
+        [
+            (1).to_bytes(TABLES_COUNT_SIZE, "big"),
+            (1).to_bytes(SYMBOLS_COUNT_SIZE, "big"),
+            len(tables_lengths).to_bytes(TABLES_HEADER_SIZE, "big"),
+            tables_lengths,
+            b"\0\0",
+        ]
+    )
+    with pytest.raises(ValueError):
+        MultiTableHFC().decode(block)
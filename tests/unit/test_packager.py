@@ -1,9 +1,47 @@
 import filecmp
+import io
+import os
+import random
 
-from app.packager import Packager
-from app.transformations import Id
+import pytest
 
-from ..helpers import apply_encoding_decoding
+from app.benchmark import make_corpus
+from app.bzip2 import bzip2
+from app.packager import (
+    STORED_BLOCK_FLAG,
+    DecodeLimits,
+    Packager,
+    decode_block,
+    encode_block,
+    gen_decoded_block,
+    looks_incompressible,
+    read_block_index,
+    unpack_block_header,
+)
+from app.transformations import (
+    HFC,
+    MTF,
+    CompositionStats,
+    Id,
+    RlePackBits,
+    RleStreams,
+)
+from app.transformations.rle.rle_streams import (
+    _compress_flag_stream,
+    _join_streams,
+)
+from app.transformations.transform import DECODED_CHUNK_SIZE, Transformation
+
+from ..helpers import KiB, apply_encoding_decoding
+
+
+class Grow(Transformation):
+    # a transformation that always makes the block bigger
+    def encode(self, block: bytes) -> bytes:
+        return b"+" + block
+
+    def decode(self, block: bytes) -> bytes:
+        return bytes(block[1:])
 
 
 def test_apply_encoding_decoding(bin_file, block_size):
@@ -18,3 +56,275 @@ def test_apply_encoding_decoding_empty(empty_bin_file, block_size):
     in_path = empty_bin_file.name
     de_path = apply_encoding_decoding(packager, in_path)
     assert filecmp.cmp(in_path, de_path, shallow=False)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_apply_encoding_decoding_workers(bin_file, workers):
+    block_size = 15 * KiB
+    in_path = bin_file.name
+
+    expected_en_path = in_path + ".en.expected"
+    Packager(Id(), block_size).apply_encoding(in_path, expected_en_path)
+
+    packager = Packager(Id(), block_size, workers=workers)
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+    # the container doesn't depend on the number of workers
+    en_path = in_path + ".en"
+    assert filecmp.cmp(en_path, expected_en_path, shallow=False)
+
+
+def test_apply_encoding_decoding_index(bin_file, block_size):
+    packager = Packager(Id(), block_size, index=True)
+    in_path = bin_file.name
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+
+    with open(in_path + ".en", "rb") as en_file:
+        entries = read_block_index(en_file)
+    size = os.path.getsize(in_path)
+    assert len(entries) == -(-size // block_size)
+    assert sum(entry.length for entry in entries) == size
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_decode_range(bin_file, index):
+    block_size = 5 * KiB
+    in_path = bin_file.name
+    en_path = in_path + ".en"
+    packager = Packager(Id(), block_size, index=index)
+    packager.apply_encoding(in_path, en_path)
+    with open(in_path, "rb") as in_file:
+        data = in_file.read()
+
+    for start, length in [
+        (0, 0),
+        (0, 10),
+        (block_size - 3, 6),
+        (block_size, block_size),
+        (3 * block_size + 7, 2 * block_size),
+        (len(data) - 5, 100),
+        (len(data) + 10, 10),
+    ]:
+        assert packager.decode_range(en_path, start, length) == (
+            data[start : start + length]
+        )
+
+
+def test_read_block_index_missing(bin_file, block_size):
+    in_path = bin_file.name
+    en_path = in_path + ".en"
+    Packager(Id(), block_size).apply_encoding(in_path, en_path)
+    with open(en_path, "rb") as en_file:
+        assert read_block_index(en_file) is None
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("index", [False, True])
+def test_apply_encoding_decoding_mmap(bin_file, workers, index):
+    block_size = 15 * KiB
+    in_path = bin_file.name
+    expected_en_path = in_path + ".en.expected"
+    Packager(Id(), block_size, index=index).apply_encoding(
+        in_path, expected_en_path
+    )
+
+    packager = Packager(
+        Id(), block_size, workers=workers, index=index, use_mmap=True
+    )
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+    assert filecmp.cmp(in_path + ".en", expected_en_path, shallow=False)
+
+
+def test_apply_encoding_decoding_mmap_empty(empty_bin_file):
+    packager = Packager(Id(), use_mmap=True)
+    in_path = empty_bin_file.name
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+
+
+def test_looks_incompressible():
+    rnd = random.Random(15)
+    assert looks_incompressible(rnd.randbytes(64 * KiB))
+    # too small to judge
+    assert not looks_incompressible(rnd.randbytes(KiB))
+    # low entropy
+    assert not looks_incompressible(bytes(rnd.choices(b"abc", k=64 * KiB)))
+    # high entropy, but repeated
+    assert not looks_incompressible(rnd.randbytes(4 * KiB) * 16)
+
+
+def test_encode_block_stored():
+    rnd = random.Random(15)
+    incompressible = rnd.randbytes(64 * KiB)
+    packed_block = encode_block(Grow(), incompressible)
+    assert unpack_block_header(packed_block[:4]) == (64 * KiB, True)
+    assert packed_block[4:] == incompressible
+    assert decode_block(Grow(), packed_block) == incompressible
+
+    # the post-check: too small for the pre-check, but grows
+    packed_block = encode_block(Grow(), b"abc")
+    assert packed_block == (STORED_BLOCK_FLAG | 3).to_bytes(4, "big") + b"abc"
+
+    packed_block = encode_block(Grow(), b"abc", store_raw=False)
+    assert unpack_block_header(packed_block[:4]) == (4, False)
+    assert decode_block(Grow(), packed_block) == b"abc"
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_apply_encoding_decoding_stored(bin_file, use_mmap):
+    packager = Packager(Grow(), 15 * KiB, use_mmap=use_mmap)
+    in_path = bin_file.name
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+    # every block is stored, just the headers are added
+    blocks_count = -(-os.path.getsize(in_path) // (15 * KiB))
+    assert os.path.getsize(in_path + ".en") == (
+        os.path.getsize(in_path) + 4 * blocks_count
+    )
+
+
+def test_encode_decode_file_objects(small_bin_file):
+    with open(small_bin_file.name, "rb") as in_file:
+        data = in_file.read()
+    packager = Packager(Id(), 2 * KiB, use_mmap=True)
+
+    encoded = io.BytesIO()
+    sizes = packager.encode_file(io.BytesIO(data), encoded)
+    assert sizes == (len(data), len(encoded.getvalue()))
+
+    decoded = io.BytesIO()
+    encoded.seek(0)
+    assert packager.decode_file(encoded, decoded) == sizes[::-1]
+    assert decoded.getvalue() == data
+
+
+def test_apply_encoding_decoding_stateful(bin_file):
+    packager = Packager(MTF() >> HFC(reuse_tables=True), 15 * KiB)
+    in_path = bin_file.name
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+    # again, from a fresh state
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+
+    with pytest.raises(ValueError):
+        packager.decode_range(in_path + ".en", 0, 10)
+    with pytest.raises(ValueError):
+        Packager(HFC(reuse_tables=True), 15 * KiB, workers=2)
+
+
+def rle_streams_bomb(run_length: int) -> bytes:
+    # a single run of `run_length` bytes, packed
+    counter = run_length.to_bytes(8, "big")
+    flags = [0] + [1] * len(counter)
+    return encode_block(
+        Id(),
+        bytes(_join_streams(_compress_flag_stream(flags), b"a" + counter)),
+    )
+
+
+def test_gen_decoded_block_bomb():
+    packed_block = rle_streams_bomb(2**40)
+    chunks = gen_decoded_block(RleStreams(), packed_block)
+    assert next(chunks) == b"a"
+    for _ in range(3):
+        assert next(chunks) == b"a" * DECODED_CHUNK_SIZE
+
+    limits = DecodeLimits(max_block_size=10 * DECODED_CHUNK_SIZE)
+    with pytest.raises(ValueError):
+        decode_block(RleStreams(), packed_block, limits)
+    # an inner stage
+    with pytest.raises(ValueError):
+        decode_block(Id() >> RleStreams(), packed_block, limits)
+    with pytest.raises(ValueError):
+        decode_block(
+            RleStreams(), packed_block, DecodeLimits(max_expansion=1000)
+        )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_apply_decoding_limits(temp_dir, workers):
+    in_path = os.path.join(temp_dir, "text")
+    with open(in_path, "wb") as in_file:
+        in_file.write(make_corpus("text", 50 * KiB))
+    en_path, de_path = in_path + ".en", in_path + ".de"
+    Packager(bzip2, 15 * KiB).apply_encoding(in_path, en_path)
+
+    limits = DecodeLimits(max_block_size=15 * KiB, max_expansion=100)
+    packager = Packager(bzip2, workers=workers, decode_limits=limits)
+    packager.apply_decoding(en_path, de_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+
+    limits = DecodeLimits(max_block_size=15 * KiB - 1)
+    packager = Packager(bzip2, workers=workers, decode_limits=limits)
+    with pytest.raises(ValueError):
+        packager.apply_decoding(en_path, de_path)
+
+
+def test_apply_decoding_limits_expansion():
+    data = bytes(100 * KiB)
+    encoded, decoded = io.BytesIO(), io.BytesIO()
+    Packager(RlePackBits(), 100 * KiB).encode_file(io.BytesIO(data), encoded)
+    for max_expansion, fails in [(10, True), (100, False)]:
+        encoded.seek(0)
+        packager = Packager(
+            RlePackBits(),
+            decode_limits=DecodeLimits(max_expansion=max_expansion),
+        )
+        if fails:
+            with pytest.raises(ValueError):
+                packager.decode_file(encoded, decoded)
+        else:
+            packager.decode_file(encoded, decoded)
+    assert decoded.getvalue() == data
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_apply_encoding_decoding_pipelined(bin_file, use_mmap, workers):
+    in_path = bin_file.name
+    expected_en_path = in_path + ".en.expected"
+    Packager(bzip2, 15 * KiB).apply_encoding(in_path, expected_en_path)
+
+    stats = CompositionStats()
+    packager = Packager(
+        bzip2,
+        15 * KiB,
+        workers=workers,
+        use_mmap=use_mmap,
+        pipeline_depth=2,
+        observer=stats,
+    )
+    de_path = apply_encoding_decoding(packager, in_path)
+    assert filecmp.cmp(in_path, de_path, shallow=False)
+    assert filecmp.cmp(in_path + ".en", expected_en_path, shallow=False)
+
+    blocks_count = -(-os.path.getsize(in_path) // (15 * KiB))
+    for direction in ("encode", "decode"):
+        assert stats.stages[direction, 0, "read"].calls == blocks_count
+        transform_stats = stats.stages[direction, 1, "transform"]
+        assert transform_stats.calls == blocks_count
+    encode_stats = stats.stages["encode", 1, "transform"]
+    assert encode_stats.in_size == os.path.getsize(in_path)
+    assert encode_stats.out_size == os.path.getsize(in_path + ".en")
+    assert stats.stages["decode", 2, "write"].in_size == (
+        os.path.getsize(in_path)
+    )
+
+
+def test_decode_file_pipelined_error():
+    encoded = io.BytesIO()
+    Packager(RlePackBits(), 1 * KiB).encode_file(
+        io.BytesIO(bytes(10 * KiB)), encoded
+    )
+
+    class FailingFile(io.BytesIO):
+        def write(self, data):
+            raise OSError("disk full")
+
+    encoded.seek(0)
+    packager = Packager(RlePackBits(), pipeline_depth=2)
+    with pytest.raises(OSError):
+        packager.decode_file(encoded, FailingFile())
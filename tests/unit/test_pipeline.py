@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from app.pipeline import prefetched, written_behind
+
+
+def gen_items(count, fail_at=None):
+    for i in range(count):
+        if i == fail_at:
+            raise OSError("read failed")
+        yield i
+
+
+@pytest.mark.parametrize("depth", [1, 3])
+def test_prefetched(depth):
+    with prefetched(gen_items(100), depth) as items:
+        assert list(items) == list(range(100))
+
+    with prefetched(gen_items(100, fail_at=10), depth) as items:
+        with pytest.raises(OSError):
+            list(items)
+
+
+def test_prefetched_early_exit():
+    threads_count = threading.active_count()
+    with prefetched(gen_items(10**9), 2) as items:
+        assert next(items) == 0
+    # the reading thread is stopped
+    assert threading.active_count() == threads_count
+
+
+@pytest.mark.parametrize("depth", [1, 3])
+def test_written_behind(depth):
+    written = []
+    with written_behind(written.append, depth) as write:
+        for i in range(100):
+            write(i)
+    assert written == list(range(100))
+
+
+def test_written_behind_error():
+    def write_failing(data):
+        raise OSError("write failed")
+
+    with pytest.raises(OSError):
+        with written_behind(write_failing, 2) as write:
+            write(b"a")
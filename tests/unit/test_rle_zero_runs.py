@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from app.transformations import HFC, ZERO_RUNS_ALPHABET_SIZE, RleZeroRuns
+from app.transformations.rle.rle_zero_runs import (
+    RUNA,
+    RUNB,
+    decode_run_length,
+    encode_run_length,
+)
+from app.transformations.symbols import unpack_wide_symbols
+
+
+@pytest.mark.parametrize(
+    "run_length, digits",
+    [
+        (1, [RUNA]),
+        (2, [RUNB]),
+        (3, [RUNA, RUNA]),
+        (4, [RUNB, RUNA]),
+        (5, [RUNA, RUNB]),
+        (6, [RUNB, RUNB]),
+        (7, [RUNA, RUNA, RUNA]),
+    ],
+)
+def test_encode_run_length(run_length, digits):
+    assert encode_run_length(run_length) == digits
+    assert decode_run_length(digits) == run_length
+
+
+def test_run_length_round_trip():
+    for run_length in range(1, 5000):
+        digits = encode_run_length(run_length)
+        assert decode_run_length(digits) == run_length
+
+
+@pytest.mark.parametrize(
+    "block",
+    [
+        b"",
+        b"\x00",
+        b"\xff",
+        b"\x00\x00\x00\x05\x00\xff\x00\x00",
+        bytes(1000) + b"\x01" + bytes(1001),
+        random.randbytes(3000),
+        bytes(random.choice([0, 0, 0, 0, 1, 2, 255]) for _ in range(3000)),
+    ],
+)
+def test_rle_zero_runs(block):
+    rle = RleZeroRuns()
+    encoded = rle.encode(block)
+    symbols = unpack_wide_symbols(encoded)
+    assert all(symbol < ZERO_RUNS_ALPHABET_SIZE for symbol in symbols)
+    assert rle.decode(encoded) == block
+
+    hfc = HFC(ZERO_RUNS_ALPHABET_SIZE)
+    assert hfc.decode(hfc.encode(encoded)) == encoded
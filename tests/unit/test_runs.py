@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from app.transformations import (
+    RlePackBits,
+    RlePairs,
+    RleStreams,
+    RleZeroRuns,
+)
+from app.transformations.fused import MtfRlePackBits, MtfRleZeroRuns
+from app.transformations.rle.runs import run_spans
+from app.transformations.transform import DECODED_CHUNK_SIZE
+
+
+@pytest.mark.parametrize(
+    "min_length, spans",
+    [
+        (1, [(0, 1), (1, 3), (4, 1), (5, 2), (7, 1)]),
+        (2, [(1, 3), (5, 2)]),
+        (3, [(1, 3)]),
+    ],
+)
+def test_run_spans(min_length, spans):
+    assert list(run_spans(b"abbbcddb", min_length)) == spans
+    assert list(run_spans(b"", min_length)) == []
+
+
+@pytest.mark.parametrize(
+    "rle, block, encoded",
+    [
+        (RlePackBits(), b"abbbc", b"\x01a\xfdb\x01c"),
+        (RlePackBits(), b"a" * 129, b"\x80a\xffa"),
+        (
+            RlePackBits(),
+            bytes(range(128)),
+            b"\x7f" + bytes(range(127)) + b"\x01\x7f",
+        ),
+        (RlePairs(), b"abbbc", b"abb\x03c"),
+        (RlePairs(), b"a" * 256, b"aa\xffa"),
+        (RlePairs(), b"a" * 257, b"aa\xffaa\x02"),
+        (RleStreams(), b"abbbc", b"\0\0\0\x06\0\0\0\x04\x20\x10ab\x03c"),
+    ],
+)
+def test_rle_encoding(rle, block, encoded):
+    assert rle.encode(block) == encoded
+    # the packager hands `memoryview`s over
+    assert rle.decode(memoryview(encoded)) == block
+    assert rle.encode(memoryview(block)) == encoded
+
+
+@pytest.mark.parametrize(
+    "rle",
+    [
+        RlePackBits(),
+        RlePairs(),
+        RleStreams(),
+        RleZeroRuns(),
+        MtfRlePackBits(),
+        MtfRleZeroRuns(),
+    ],
+    ids=lambda rle: type(rle).__name__,
+)
+def test_gen_decoded_chunks(rle):
+    rnd = random.Random(23)
+    # the literals of `RleZeroRuns` aren't chunked: only the zeros run
+    block = b"".join(
+        bytes(rnd.choice([1, 2, 500, 300_000])) + rnd.choice([b"a", b"bb"])
+        for _ in range(40)
+    )
+    chunks = list(rle.gen_decoded_chunks(rle.encode(block)))
+    assert b"".join(chunks) == block
+    # a packet or a literal may go over
+    assert max(map(len, chunks)) < DECODED_CHUNK_SIZE + 256
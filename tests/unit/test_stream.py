@@ -0,0 +1,98 @@
+import io
+import random
+
+import pytest
+
+from app import bzip2
+from app.packager import Packager
+from app.stream import Compressor, Decompressor
+from app.transformations import Id
+
+from ..helpers import KiB
+
+
+def gen_chunks(data: bytes, max_chunk_size: int):
+    while data:
+        chunk_size = random.randint(1, max_chunk_size)
+        yield data[:chunk_size]
+        data = data[chunk_size:]
+
+
+@pytest.mark.parametrize("max_chunk_size", [1, 1000, 40 * KiB])
+def test_compressor_matches_packager(bin_file, max_chunk_size):
+    block_size = 15 * KiB
+    in_path = bin_file.name
+    en_path = in_path + ".en"
+    Packager(Id(), block_size).apply_encoding(in_path, en_path)
+    with open(in_path, "rb") as in_file, open(en_path, "rb") as en_file:
+        data, expected = in_file.read(), en_file.read()
+
+    compressor = Compressor(Id(), block_size)
+    compressed = bytearray()
+    for chunk in gen_chunks(data[: 200 * KiB], max_chunk_size):
+        compressed.extend(compressor.compress(chunk))
+    if len(data) <= 200 * KiB:
+        compressed.extend(compressor.flush())
+        assert compressed == expected
+    else:
+        assert compressed == expected[: len(compressed)]
+
+    decompressor = Decompressor(Id())
+    decompressed = bytearray()
+    for chunk in gen_chunks(bytes(compressed), max_chunk_size):
+        decompressed.extend(decompressor.decompress(chunk))
+    decompressor.flush()
+    assert decompressed == data[: len(decompressed)]
+
+
+def test_compressor_returns_finished_blocks():
+    compressor = Compressor(Id(), block_size=10)
+    assert compressor.compress(b"a" * 9) == b""
+    assert compressor.compress(b"bc") == b"\0\0\0\x0a" + b"a" * 9 + b"b"
+    assert compressor.flush() == b"\0\0\0\x01c"
+    with pytest.raises(ValueError):
+        compressor.compress(b"d")
+
+
+def test_compressor_index(small_bin_file):
+    block_size = 2 * KiB
+    in_path = small_bin_file.name
+    en_path = in_path + ".en"
+    Packager(Id(), block_size, index=True).apply_encoding(in_path, en_path)
+    with open(in_path, "rb") as in_file, open(en_path, "rb") as en_file:
+        data, expected = in_file.read(), en_file.read()
+
+    compressor = Compressor(Id(), block_size, index=True)
+    compressed = compressor.compress(data) + compressor.flush()
+    assert compressed == expected
+
+    decompressor = Decompressor(Id())
+    decompressed = bytearray()
+    for chunk in gen_chunks(compressed, 1000):
+        decompressed.extend(decompressor.decompress(chunk))
+    decompressor.flush()
+    assert decompressor.eof
+    assert decompressed == data
+
+
+def test_decompressor_truncated():
+    decompressor = Decompressor(Id())
+    assert decompressor.decompress(b"\0\0\0\x03ab") == b""
+    with pytest.raises(ValueError):
+        decompressor.flush()
+
+
+def test_open(small_bin_file):
+    with open(small_bin_file.name, "rb") as in_file:
+        data = in_file.read()
+
+    buffer = io.BytesIO()
+    with bzip2.open(buffer, "wb", block_size=2 * KiB) as bz_file:
+        for chunk in gen_chunks(data, 3 * KiB):
+            bz_file.write(chunk)
+    buffer.seek(0)
+
+    with bzip2.open(buffer, "rb") as bz_file:
+        assert bz_file.read(100) == data[:100]
+        assert bz_file.read() == data[100:]
+        assert bz_file.read() == b""